@@ -0,0 +1,109 @@
+# ann_for_bot.py
+# Approximate (trained) FAISS indexes for large corpora. The indexer keeps writing the exact
+# flat index.faiss (the source of truth for incremental updates and the benchmark's ground
+# truth) and, when an index type other than "flat" is chosen, trains a compressed copy
+# over the same vectors in the same order as index.ann.faiss. The server then loads only
+# that copy.
+#
+# Types: ivf (IVF, float32 lists), ivf_sq8 (IVF, int8 scalar quantized), ivf_pq (IVF,
+# product quantized), hnsw, hnsw_sq8, sq8 (exhaustive over int8 codes), or any
+# faiss.index_factory string. Query-time knobs: FAISS_NPROBE (IVF lists visited) and
+# FAISS_EF_SEARCH (HNSW candidate list); bench_index.py measures recall vs latency.
+
+import os
+import math
+import time
+
+import numpy as np
+
+ANN_FILE = "index.ann.faiss"
+INDEX_TYPES = ("flat", "ivf", "ivf_sq8", "ivf_pq", "hnsw", "hnsw_sq8", "sq8")
+INDEX_TYPE = os.environ.get("INDEX_TYPE", "flat")
+FAISS_NPROBE = int(os.environ.get("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.environ.get("FAISS_EF_SEARCH", "64"))
+# Below this many chunks the flat index is exact and already fast (and PQ cannot be trained)
+ANN_MIN_VECTORS = int(os.environ.get("ANN_MIN_VECTORS", "1000"))
+# Vectors sampled to train the coarse quantizer / codebooks
+ANN_TRAIN_SAMPLE = 65536
+HNSW_M = 32
+
+
+def _nlist(n):
+    # ~4 sqrt(n) inverted lists, with at least 39 training points per list
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _pq_subquantizers(d):
+    # 8-bit codes over sub-vectors of ~8 dimensions (48 bytes per vector for MiniLM's 384)
+    return max(m for m in range(1, max(1, d // 8) + 1) if d % m == 0)
+
+
+def factory_string(index_type, n, d):
+    """faiss.index_factory description for an index type (or a factory string passed through)."""
+    presets = {
+        "flat": "Flat",
+        "ivf": f"IVF{_nlist(n)},Flat",
+        "ivf_sq8": f"IVF{_nlist(n)},SQ8",
+        # np: no polysemous training, which costs ~20x the PQ training and only helps Hamming filtering
+        "ivf_pq": f"IVF{_nlist(n)},PQ{_pq_subquantizers(d)}x8np",
+        "hnsw": f"HNSW{HNSW_M}",
+        "hnsw_sq8": f"HNSW{HNSW_M}_SQ8",
+        "sq8": "SQ8",
+    }
+    return presets.get(index_type, index_type)
+
+
+def flat_vectors(index):
+    """All vectors of an exact (flat) index, in id order."""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def build_ann_index(vectors, factory, metric):
+    """Train (on a sample) and fill an index; ids are positions, as in the flat index."""
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    index = faiss.index_factory(vectors.shape[1], factory, metric)
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > ANN_TRAIN_SAMPLE:
+            rows = np.random.default_rng(0).choice(len(vectors), ANN_TRAIN_SAMPLE, replace=False)
+            sample = vectors[np.sort(rows)]
+        index.train(sample)
+    index.add(vectors)
+    return index
+
+
+def ann_from_flat(flat_index, index_type=INDEX_TYPE):
+    """(trained index, factory string) for the flat index's vectors, or (None, "Flat")."""
+    n, d = flat_index.ntotal, flat_index.d
+    factory = factory_string(index_type, n, d)
+    if factory == "Flat":
+        return None, factory
+    if n < ANN_MIN_VECTORS:
+        print(f"[ann] {n} vectors is below ANN_MIN_VECTORS={ANN_MIN_VECTORS}, keeping the flat index only")
+        return None, "Flat"
+    start = time.perf_counter()
+    index = build_ann_index(flat_vectors(flat_index), factory, flat_index.metric_type)
+    print(f"[ann] trained {factory} over {n} vectors in {time.perf_counter() - start:.1f}s")
+    return index, factory
+
+
+def set_search_params(index, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH):
+    """Apply the query-time knobs that exist on this index type."""
+    import faiss
+
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # e.g. nprobe on an HNSW index
+
+
+def index_bytes(index):
+    import faiss
+
+    return int(faiss.serialize_index(index).nbytes)
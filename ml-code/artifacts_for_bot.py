@@ -0,0 +1,298 @@
+# artifacts_for_bot.py
+# Bounded directories for the files the app creates: reply audio in outputs/voices
+# (final_<id>.mp3 from streamed replies, reply_<id>.mp3 from gTTS fallbacks) and uploads
+# in temp/ (left behind whenever a background cleanup task does not run).
+#  - Created files are indexed with size and creation time; a background GC task
+#    reconciles the index with the disk and removes files past max_age, then the oldest
+#    ones while the directory is over max_bytes.
+#  - Only the store's own files are ever collected: files it registered, in this or an
+#    earlier run (every registered name is appended to the folder's .owned log), and files
+#    named with one of the store's owned prefixes (temp_audio_/temp_image_ uploads).
+#    Anything else found on disk (e.g. sample recordings or clips checked into the repo)
+#    is reported as foreign and left alone.
+#  - Files linked from a conversation are retained while the conversation is active: a
+#    reference is a lease that every new turn of the conversation renews.
+#  - Optionally files go to 256 sharded subdirectories (ab/<name>), chosen from a hash of
+#    the name so the download URL stays the bare file name.
+#  - tts_<hash>.mp3 clips belong to the TTS cache (its own LRU), they are never collected here.
+
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+VOICE_DIR = "outputs/voices"
+UPLOAD_DIR = "temp"
+VOICE_MAX_BYTES = int(os.environ.get("VOICE_ARTIFACT_MAX_BYTES", str(1024 * 1024 * 1024)))
+VOICE_MAX_AGE = float(os.environ.get("VOICE_ARTIFACT_MAX_AGE", str(24 * 60 * 60)))
+# Uploads are only needed while their request runs
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_ARTIFACT_MAX_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_MAX_AGE = float(os.environ.get("UPLOAD_ARTIFACT_MAX_AGE", str(60 * 60)))
+VOICE_SHARDS = os.environ.get("VOICE_ARTIFACT_SHARDS", "0") == "1"
+# Comma-separated name prefixes to adopt in outputs/voices without a log entry, e.g.
+# "final_,reply_" on a deployment whose folder holds only replies (from before the .owned log)
+VOICE_OWNED_PREFIXES = tuple(p for p in os.environ.get("VOICE_ARTIFACT_OWNED_PREFIXES", "").split(",") if p)
+# Matches the conversation TTL: an idle conversation's files are released with it
+REFERENCE_TTL = float(os.environ.get("CONVERSATION_TTL", str(2 * 60 * 60)))
+ARTIFACT_GC_INTERVAL = float(os.environ.get("ARTIFACT_GC_INTERVAL", "300"))
+# Scratch files of the TTS cache (.tmp_*) older than this were abandoned mid-write
+ORPHAN_TMP_AGE = 15 * 60
+TTS_CACHE_PREFIX = "tts_"
+# Upload names written by gradio_app.py (temp_audio_<id>_stt.* normalized copies included)
+UPLOAD_PREFIXES = ("temp_audio_", "temp_image_")
+# Per-folder log of registered names, so ownership survives restarts (one name per line)
+OWNED_LOG = ".owned"
+
+
+class ArtifactStore:
+    def __init__(self, folder, max_bytes, max_age, sharded=False, reference_ttl=REFERENCE_TTL, owned_prefixes=()):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.sharded = sharded
+        self.reference_ttl = reference_ttl
+        self.owned_prefixes = tuple(owned_prefixes)
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # name -> (size, created) of owned files, oldest first
+        self.total_bytes = 0
+        self._foreign = {}  # name -> size of files on disk the store did not create
+        self._log_path = os.path.join(folder, OWNED_LOG)
+        self._logged = set()  # names in the .owned log
+        self._owners = {}  # owner (conversation id) -> (names, last renewed)
+        self.counters = {"stored": 0, "stored_bytes": 0, "evicted": 0, "evicted_bytes": 0,
+                         "expired": 0, "gc_runs": 0, "gc_seconds": 0.0}
+        os.makedirs(folder, exist_ok=True)
+        self._logged = self._read_log()
+        self._reconcile()
+
+    # ---- Paths ----
+    def _shard(self, name):
+        return hashlib.sha1(name.encode("utf-8")).hexdigest()[:2]
+
+    def new_path(self, name):
+        """Where to write a new artifact called name (its shard directory is created)."""
+        if not self.sharded:
+            return os.path.join(self.folder, name)
+        folder = os.path.join(self.folder, self._shard(name))
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, name)
+
+    def path_for(self, name):
+        """Existing file for a download name (sharded or flat, e.g. from before sharding), or None."""
+        name = os.path.basename(name)
+        for path in (os.path.join(self.folder, self._shard(name), name), os.path.join(self.folder, name)):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    # ---- Index ----
+    def register(self, path):
+        """Index a file written to new_path()."""
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        with self._lock:
+            previous = self._files.pop(name, None)
+            self.total_bytes += size - (previous[0] if previous else 0)
+            self._files[name] = (size, time.time())
+            self._foreign.pop(name, None)
+            self.counters["stored"] += 1
+            self.counters["stored_bytes"] += size
+            if name not in self._logged:
+                # Appends of one short line are atomic, workers can share the log
+                with open(self._log_path, "a", encoding="utf-8") as f:
+                    f.write(name + "\n")
+                self._logged.add(name)
+        return path
+
+    def _read_log(self):
+        try:
+            with open(self._log_path, encoding="utf-8") as f:
+                return {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def _compact_log(self, on_disk):
+        """Rewrite the log without names whose files are gone (other workers' appends kept)."""
+        names = self._read_log() & on_disk
+        tmp_path = os.path.join(self.folder, f".tmp_owned_{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(name + "\n" for name in sorted(names))
+        os.replace(tmp_path, self._log_path)
+        with self._lock:
+            self._logged = names
+
+    def _managed(self, name):
+        return not name.startswith(TTS_CACHE_PREFIX) and not name.startswith(".tmp_") and name != OWNED_LOG
+
+    def _owned(self, name):
+        # Logged (registered by this or an earlier run) or named like the app's own files
+        return name in self._logged or name.startswith(self.owned_prefixes)
+
+    def _scan(self):
+        """name -> (size, mtime, path) of the managed files on disk, plus abandoned temp files."""
+        found, orphans = {}, []
+        now = time.time()
+        for root, dirs, names in os.walk(self.folder):
+            # Only the top level and shard directories
+            dirs[:] = [d for d in dirs if root == self.folder and len(d) == 2]
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if self._managed(name):
+                    found[name] = (st.st_size, st.st_mtime, path)
+                elif name.startswith(".tmp_") and now - st.st_mtime > ORPHAN_TMP_AGE:
+                    orphans.append((path, st.st_size))
+        return found, orphans
+
+    def _reconcile(self, found=None):
+        """
+        Rebuild the index from the disk: drops files removed behind our back and picks up
+        owned files written without register() (uploads left by a request that died).
+        Unregistered files with other names are only counted as foreign.
+        """
+        if found is None:
+            found, _ = self._scan()
+        with self._lock:
+            files, foreign = [], {}
+            for name, (size, mtime, _) in found.items():
+                if name in self._files:
+                    # Keep the creation time we recorded, the disk only has mtime
+                    files.append((name, (size, self._files[name][1])))
+                elif self._owned(name):
+                    files.append((name, (size, mtime)))
+                else:
+                    foreign[name] = size
+            self._files = OrderedDict(sorted(files, key=lambda item: item[1][1]))
+            self.total_bytes = sum(size for size, _ in self._files.values())
+            self._foreign = foreign
+
+    # ---- References ----
+    def retain(self, owner, name=None):
+        """Renew owner's (a conversation's) lease on its files, adding the artifact name to them if given."""
+        with self._lock:
+            names, _ = self._owners.get(owner, (set(), 0))
+            if name:
+                names.add(os.path.basename(name))
+            self._owners[owner] = (names, time.time())
+
+    def release(self, owner):
+        """The conversation was reset: its files may be collected."""
+        with self._lock:
+            self._owners.pop(owner, None)
+
+    def _referenced(self, now):
+        """Names held by owners renewed within reference_ttl (expired leases are dropped)."""
+        referenced = set()
+        for owner, (names, renewed) in list(self._owners.items()):
+            if now - renewed > self.reference_ttl:
+                del self._owners[owner]
+            else:
+                referenced |= names
+        return referenced
+
+    def is_referenced(self, name):
+        with self._lock:
+            return os.path.basename(name) in self._referenced(time.time())
+
+    # ---- GC ----
+    def collect(self):
+        """One GC pass (blocking file I/O, run it off the event loop). Returns bytes freed."""
+        start = time.perf_counter()
+        found, orphans = self._scan()
+        # Picks up names registered by other workers sharing the folder
+        logged = self._read_log()
+        with self._lock:
+            self._logged |= logged
+        self._reconcile(found)
+        now = time.time()
+        victims = []
+        with self._lock:
+            referenced = self._referenced(now)
+            remaining = self.total_bytes
+            for name, (size, created) in self._files.items():
+                if name in referenced:
+                    continue
+                if now - created > self.max_age:
+                    victims.append((name, size, "expired"))
+                    remaining -= size
+            # Then oldest first until under the size bound
+            victim_names = {name for name, _, _ in victims}
+            for name, (size, created) in self._files.items():
+                if remaining <= self.max_bytes:
+                    break
+                if name in referenced or name in victim_names:
+                    continue
+                victims.append((name, size, "evicted"))
+                remaining -= size
+
+        freed = 0
+        removed = set()
+        for name, size, reason in victims:
+            try:
+                os.remove(found[name][2])
+            except OSError:
+                continue
+            freed += size
+            removed.add(name)
+            with self._lock:
+                if self._files.pop(name, None) is not None:
+                    self.total_bytes -= size
+                self.counters[reason] += 1
+                self.counters["evicted_bytes"] += size
+        for path, size in orphans:
+            try:
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+        if logged - (set(found) - removed):
+            try:
+                self._compact_log(set(found) - removed)
+            except OSError as e:
+                print(f"[artifacts] could not rewrite {self._log_path}: {e}")
+
+        with self._lock:
+            self.counters["gc_runs"] += 1
+            self.counters["gc_seconds"] += time.perf_counter() - start
+        if victims or orphans:
+            print(f"[artifacts] {self.folder}: removed {len(victims) + len(orphans)} files, {freed} bytes")
+        return freed
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "gc_seconds": round(self.counters["gc_seconds"], 3),
+                "files": len(self._files),
+                "bytes": self.total_bytes,
+                "foreign_files": len(self._foreign),
+                "foreign_bytes": sum(self._foreign.values()),
+                "max_bytes": self.max_bytes,
+                "max_age": self.max_age,
+                "active_owners": len(self._owners),
+                "referenced": len(set().union(*(names for names, _ in self._owners.values()))),
+                "sharded": self.sharded,
+            }
+
+
+voice_artifacts = ArtifactStore(VOICE_DIR, VOICE_MAX_BYTES, VOICE_MAX_AGE, sharded=VOICE_SHARDS,
+                                owned_prefixes=VOICE_OWNED_PREFIXES)
+# Uploads are never referenced by conversations, only bounded by age and size.
+# Their names are the app's own, so uploads left by an earlier run are collected too.
+upload_artifacts = ArtifactStore(UPLOAD_DIR, UPLOAD_MAX_BYTES, UPLOAD_MAX_AGE, owned_prefixes=UPLOAD_PREFIXES)
+
+
+async def collect_artifacts_forever(stores=(voice_artifacts, upload_artifacts), interval=ARTIFACT_GC_INTERVAL):
+    """Background GC task started by the app's lifespan."""
+    while True:
+        for store in stores:
+            try:
+                await asyncio.to_thread(store.collect)
+            except Exception as e:
+                print(f"[artifacts] GC of {store.folder} failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,55 @@
+# bench_audio.py
+# Bytes uploaded and STT round-trip time for a recording as the browser sent it vs after
+# normalize_audio (16 kHz mono, silence trimmed, low-bitrate mp3). Runs against the local
+# mock endpoint unless --live is given (then GROQ_API_KEY is used against Groq itself).
+#
+# to run: python bench_audio.py --audio temp_audio.mp3 [--runs 5] [--live]
+
+import os
+import time
+import argparse
+import statistics
+
+from mock_providers import start_mock_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="STT upload size and round trip: raw vs normalized audio")
+    parser.add_argument("--audio", default="temp_audio.mp3", help="recording to transcribe")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--live", action="store_true", help="call Groq instead of the local mock")
+    args = parser.parse_args()
+
+    server = None
+    if not args.live:
+        server, base_url = start_mock_server()
+        # Must be set before clients_for_bot is imported
+        os.environ["GROQ_BASE_URL"] = base_url
+        os.environ.setdefault("GROQ_API_KEY", "mock")
+
+    from voice_of_patient import transcribe_with_groq, normalize_audio
+
+    start = time.perf_counter()
+    normalized_path, info = normalize_audio(args.audio)
+    normalize_ms = (time.perf_counter() - start) * 1000
+
+    try:
+        for label, path in (("original", args.audio), ("normalized", normalized_path)):
+            timings = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                text, _ = transcribe_with_groq("whisper-large-v3", path, os.environ.get("GROQ_API_KEY"))
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f"{label:<11} {os.path.getsize(path) / 1024:8.1f} KB   "
+                  f"STT p50 {statistics.median(timings):7.1f} ms   max {max(timings):7.1f} ms   {text[:40]!r}")
+    finally:
+        if server:
+            server.shutdown()
+        if normalized_path != args.audio:
+            os.remove(normalized_path)
+
+    print(f"normalization took {normalize_ms:.1f} ms, trimmed {info.get('trimmed_ms', 0)} ms of silence")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# bench_chunkstore.py
+# Startup cost of the docstore: the pickled (InMemoryDocstore, index_to_docstore_id) that
+# FAISS.save_local writes as index.pkl, against the memory-mapped chunk store
+# (chunks_for_bot.py). A synthetic corpus of --chunks chunks (~700 chars, PyPDFLoader-like
+# metadata) is written in both formats; each format is then opened in a fresh process
+# that reports load time, private RSS growth (mapped file pages are reported apart: they
+# are page cache shared by all workers and reclaimable), and the latency of looking up
+# --lookups random ids (what retrieval does for every result).
+#
+# to run: python bench_chunkstore.py [--chunks 100000] [--lookups 2000]
+
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+import numpy as np
+
+from chunks_for_bot import CHUNKS_DIR, write_chunk_store
+
+WORDS = ("patient dose tablet daily fever infection pain blood pressure insulin symptoms doctor "
+         "treatment chronic acute therapy clinical adverse effect contraindicated renal hepatic").split()
+
+
+def write_corpus(folder, count, rng):
+    from langchain_core.documents import Document
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    docs, index_to_docstore_id = {}, {}
+    for i in range(count):
+        doc_id = f"{rng.integers(0, 2 ** 63):032x}"[:32]
+        text = " ".join(rng.choice(WORDS, 95))[:700]
+        metadata = {"producer": "PyPDF", "creator": "PyPDF", "creationdate": "", "source": f"data/book_{i // 5000}.pdf",
+                    "total_pages": 900, "page": (i // 9) % 900, "page_label": str((i // 9) % 900 + 1)}
+        docs[doc_id] = Document(id=doc_id, page_content=text, metadata=metadata)
+        index_to_docstore_id[i] = doc_id
+    docstore = InMemoryDocstore(docs)
+
+    with open(os.path.join(folder, "index.pkl"), "wb") as f:
+        pickle.dump((docstore, index_to_docstore_id), f)
+    write_chunk_store(os.path.join(folder, CHUNKS_DIR), docstore, index_to_docstore_id)
+
+
+def rss_bytes(kind="RssAnon"):
+    """Private (RssAnon) or file-backed, shareable page cache (RssFile) resident memory."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(kind + ":"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def run_child(fmt, folder, lookups):
+    """Open one format in this (fresh) process and print a JSON line."""
+    from langchain_core.documents import Document  # imported by both formats; not part of the load time
+    from langchain_community.docstore.in_memory import InMemoryDocstore  # noqa: F401
+
+    base, base_file = rss_bytes(), rss_bytes("RssFile")
+    start = time.perf_counter()
+    if fmt == "pickle":
+        with open(os.path.join(folder, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    else:
+        from chunks_for_bot import ChunkStore
+        docstore = ChunkStore(os.path.join(folder, CHUNKS_DIR))
+        index_to_docstore_id = docstore.index_to_docstore_id
+    load_seconds = time.perf_counter() - start
+    loaded = rss_bytes()
+
+    rng = np.random.default_rng(1)
+    latencies = []
+    for position in rng.integers(0, len(index_to_docstore_id), lookups):
+        t = time.perf_counter()
+        doc = docstore.search(index_to_docstore_id[int(position)])
+        latencies.append((time.perf_counter() - t) * 1e6)
+        assert isinstance(doc, Document)
+    print(json.dumps({
+        "load_ms": round(load_seconds * 1000, 1),
+        "rss_load_mb": round((loaded - base) / 2 ** 20, 1),
+        "rss_after_lookups_mb": round((rss_bytes() - base) / 2 ** 20, 1),
+        "file_rss_mb": round((rss_bytes("RssFile") - base_file) / 2 ** 20, 1),
+        "lookup_p50_us": round(statistics.median(latencies), 1),
+        "lookup_p99_us": round(sorted(latencies)[int(0.99 * (len(latencies) - 1))], 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pickled docstore vs memory-mapped chunk store")
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--child", nargs=2, metavar=("FORMAT", "FOLDER"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.lookups)
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_corpus(folder, args.chunks, np.random.default_rng(0))
+        sizes = {
+            "pickle": os.path.getsize(os.path.join(folder, "index.pkl")),
+            "chunks": sum(entry.stat().st_size for entry in os.scandir(os.path.join(folder, CHUNKS_DIR))),
+        }
+        print(f"{args.chunks} chunks, {args.lookups} random lookups per format")
+        print(f"{'format':<8} {'disk MB':>8} {'load ms':>9} {'RSS load MB':>12} {'RSS +lookups':>13} "
+              f"{'mapped MB':>10} {'lookup p50 us':>14} {'p99 us':>8}")
+        for fmt in ("pickle", "chunks"):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", fmt, folder,
+                                  "--lookups", str(args.lookups)], capture_output=True, text=True, check=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{fmt:<8} {sizes[fmt] / 2 ** 20:>8.1f} {r['load_ms']:>9} {r['rss_load_mb']:>12} "
+                  f"{r['rss_after_lookups_mb']:>13} {r['file_rss_mb']:>10} {r['lookup_p50_us']:>14} {r['lookup_p99_us']:>8}")
+
+
+if __name__ == "__main__":
+    main()
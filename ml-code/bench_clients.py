@@ -0,0 +1,58 @@
+# bench_clients.py
+# Micro-benchmark: a fresh Groq client per call (old behaviour) vs the pooled client
+# from clients_for_bot, both against the local mock endpoint.
+#
+# to run: python bench_clients.py --calls 200
+
+import os
+import time
+import argparse
+import statistics
+
+from mock_providers import start_mock_server
+
+
+def timed_calls(make_client, calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        client = make_client()
+        client.chat.completions.create(messages=[{"role": "user", "content": "hi"}], model="mock")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label:<16} mean {statistics.mean(timings) * 1000:7.2f} ms   "
+          f"p50 {statistics.median(timings) * 1000:7.2f} ms   "
+          f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1] * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-call latency: fresh vs pooled Groq client")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server()
+    # Must be set before clients_for_bot is imported
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ.setdefault("GROQ_API_KEY", "mock")
+
+    from groq import Groq
+    import clients_for_bot
+
+    try:
+        fresh = timed_calls(lambda: Groq(api_key=os.environ["GROQ_API_KEY"], base_url=base_url), args.calls)
+        pooled = timed_calls(clients_for_bot.get_groq_client, args.calls)
+    finally:
+        server.shutdown()
+
+    report("fresh client", fresh)
+    report("pooled client", pooled)
+    saved = statistics.mean(fresh) - statistics.mean(pooled)
+    print(f"saved per call:  {saved * 1000:.2f} ms (local HTTP, no TLS: real endpoints save more)")
+    print("pool stats:", clients_for_bot.connection_stats()["groq"])
+
+
+if __name__ == "__main__":
+    main()
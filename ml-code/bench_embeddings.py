@@ -0,0 +1,79 @@
+# bench_embeddings.py
+# Index-build embedding throughput: the previous path (HuggingFaceEmbeddings.embed_documents,
+# one process, chunks in document order) against EmbeddingEngine with length-sorted
+# batches over 1..N worker processes. Reports chunks/s, padding overhead and the largest
+# difference from the baseline vectors (after normalization), which should be ~1e-6.
+#
+# Chunks come from the PDFs in --data (chunked like the indexer) or are synthetic.
+#
+# to run: python bench_embeddings.py [--data data/] [--workers 1 2 4] [--batch-sizes 64 256]
+#         python bench_embeddings.py --synthetic 2000
+
+import time
+import argparse
+
+import numpy as np
+
+from embeddings_for_bot import EmbeddingEngine, EMBEDDING_MODEL_NAME, length_batches, padding_overhead
+
+
+def pdf_chunks(data_path):
+    from database_for_bot import create_chunks, load_pdf_files
+
+    return [chunk.page_content for chunk in create_chunks(load_pdf_files(data_path))]
+
+
+def synthetic_chunks(count, rng):
+    # Mixed lengths like real chunks: mostly near the 700-char split size, some short tails
+    words = "patient dose tablet daily fever infection pain blood pressure insulin symptoms doctor".split()
+    lengths = np.where(rng.random(count) < 0.7, rng.integers(90, 130, count), rng.integers(5, 60, count))
+    return [" ".join(rng.choice(words, n)) for n in lengths]
+
+
+def baseline(texts):
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    start = time.perf_counter()
+    vectors = np.asarray(model.embed_documents(texts), dtype="float32")
+    elapsed = time.perf_counter() - start
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding throughput for index builds")
+    parser.add_argument("--data", default="data/", help="PDFs to chunk")
+    parser.add_argument("--synthetic", type=int, default=0, help="use this many synthetic chunks instead of PDFs")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[64, 256])
+    parser.add_argument("--no-baseline", action="store_true", help="skip the HuggingFaceEmbeddings baseline")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texts = synthetic_chunks(args.synthetic, rng) if args.synthetic else pdf_chunks(args.data)
+    print(f"{len(texts)} chunks, {sum(len(t) for t in texts) / len(texts):.0f} chars on average")
+
+    reference = None
+    print(f"{'configuration':<32} {'seconds':>8} {'chunks/s':>9} {'padding':>8} {'max diff':>9}")
+    if not args.no_baseline:
+        reference, seconds = baseline(texts)
+        unsorted = padding_overhead(texts, length_batches(texts, 32, sort_by_length=False))
+        print(f"{'baseline (HF, batch 32)':<32} {seconds:>8.2f} {len(texts) / seconds:>9.1f} {unsorted:>8.0%} {'-':>9}")
+
+    for workers in args.workers:
+        for batch_size in args.batch_sizes:
+            for sort_by_length in (False, True):
+                with EmbeddingEngine(batch_size=batch_size, workers=workers, sort_by_length=sort_by_length) as engine:
+                    engine.embed(texts[:batch_size])  # load the model in every worker
+                    start = time.perf_counter()
+                    vectors = engine.embed(texts)
+                    seconds = time.perf_counter() - start
+                    padding = engine.stats()["padding_overhead"]
+                diff = f"{np.abs(vectors - reference).max():.1e}" if reference is not None else "-"
+                label = f"{workers} workers, batch {batch_size}, {'sorted' if sort_by_length else 'unsorted'}"
+                print(f"{label:<32} {seconds:>8.2f} {len(texts) / seconds:>9.1f} {padding:>8.0%} {diff:>9}")
+
+
+if __name__ == "__main__":
+    main()
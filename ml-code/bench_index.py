@@ -0,0 +1,139 @@
+# bench_index.py
+# Recall vs latency of the approximate index types (ann_for_bot.py) against the exact flat
+# index, on our own chunk vectors. Each type is trained once over all vectors of
+# index.faiss, then searched one query at a time (as the server does) for every
+# nprobe / efSearch value. Recall@k is the share of the flat index's top k that the
+# approximate index also returns; recall@3 is what the chatbot actually uses.
+#
+# Queries are, by default, the opening words of randomly sampled chunks embedded with the
+# bot's model (--queries-file embeds real questions instead); --queries-from vectors uses
+# noisy copies of stored vectors and needs neither the model nor langchain.
+#
+# to run: python bench_index.py [--index vectorstore/db_faiss] [--types ivf ivf_sq8 ivf_pq hnsw]
+#         python bench_index.py --queries-file questions.txt --output index_bench.json
+
+import os
+import json
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+from ann_for_bot import build_ann_index, factory_string, flat_vectors, index_bytes, set_search_params
+from startup_for_bot import DB_FAISS_PATH, RETRIEVER_K
+
+
+def snippet_queries(index_path, count, words, rng):
+    from startup_for_bot import get_embedding_model, load_docstore
+
+    docstore, index_to_docstore_id = load_docstore(index_path)
+    rows = rng.choice(len(index_to_docstore_id), min(count, len(index_to_docstore_id)), replace=False)
+    texts = [" ".join(docstore.search(index_to_docstore_id[int(i)]).page_content.split()[:words]) for i in rows]
+    return np.asarray(get_embedding_model().embed_documents(texts), dtype="float32")
+
+
+def file_queries(path):
+    from startup_for_bot import get_embedding_model
+
+    with open(path, "r", encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+    return np.asarray(get_embedding_model().embed_documents(questions), dtype="float32")
+
+
+def vector_queries(vectors, count, noise, rng):
+    rows = rng.choice(len(vectors), min(count, len(vectors)), replace=False)
+    scale = noise * float(np.linalg.norm(vectors, axis=1).mean()) / np.sqrt(vectors.shape[1])
+    return (vectors[rows] + rng.normal(0, scale, size=(len(rows), vectors.shape[1]))).astype("float32")
+
+
+def measure(index, queries, truth, k):
+    """Latency of single-query searches (ms) and recall against the exact results."""
+    latencies, found = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+
+    def recall(depth):
+        return statistics.mean(len(set(f[:depth]) & set(t[:depth])) / depth for f, t in zip(found, truth))
+
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))], 3),
+        f"recall@{k}": round(recall(k), 4),
+        f"recall@{RETRIEVER_K}": round(recall(min(RETRIEVER_K, k)), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency of approximate FAISS indexes against the flat index")
+    parser.add_argument("--index", default=DB_FAISS_PATH, help="index directory with the flat index.faiss")
+    parser.add_argument("--types", nargs="+", default=["ivf", "ivf_sq8", "ivf_pq", "hnsw", "hnsw_sq8", "sq8"],
+                        help="index types or faiss index_factory strings")
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[16, 32, 64, 128])
+    parser.add_argument("--k", type=int, default=10, help="depth for recall@k")
+    parser.add_argument("--queries", type=int, default=200, help="number of sampled queries")
+    parser.add_argument("--queries-from", choices=["snippets", "vectors"], default="snippets")
+    parser.add_argument("--queries-file", default=None, help="one question per line (embedded with the bot's model)")
+    parser.add_argument("--snippet-words", type=int, default=12)
+    parser.add_argument("--noise", type=float, default=0.3, help="relative noise for --queries-from vectors")
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    import faiss
+
+    rng = np.random.default_rng(0)
+    flat = faiss.read_index(os.path.join(args.index, "index.faiss"))
+    vectors = flat_vectors(flat)
+    if args.queries_file:
+        queries = file_queries(args.queries_file)
+    elif args.queries_from == "snippets":
+        queries = snippet_queries(args.index, args.queries, args.snippet_words, rng)
+    else:
+        queries = vector_queries(vectors, args.queries, args.noise, rng)
+    _, truth = flat.search(queries, args.k)
+    print(f"{flat.ntotal} vectors of dimension {flat.d}, {len(queries)} queries, recall against the flat index")
+
+    rows = [{"type": "flat", "factory": "Flat", "param": "-", "build_s": 0.0, "bytes": index_bytes(flat),
+             **measure(flat, queries, truth, args.k)}]
+    for index_type in args.types:
+        factory = factory_string(index_type, flat.ntotal, flat.d)
+        start = time.perf_counter()
+        try:
+            index = build_ann_index(vectors, factory, flat.metric_type)
+        except RuntimeError as e:
+            print(f"{index_type} ({factory}) could not be built: {e}")
+            continue
+        build_seconds = round(time.perf_counter() - start, 2)
+        size = index_bytes(index)
+        if "IVF" in factory:
+            params = [("nprobe", n) for n in args.nprobe]
+        elif "HNSW" in factory:
+            params = [("efSearch", ef) for ef in args.ef_search]
+        else:
+            params = [(None, None)]
+        for name, value in params:
+            if name:
+                set_search_params(index, nprobe=value if name == "nprobe" else None,
+                                  ef_search=value if name == "efSearch" else None)
+            rows.append({"type": index_type, "factory": factory, "param": f"{name}={value}" if name else "-",
+                         "build_s": build_seconds, "bytes": size, **measure(index, queries, truth, args.k)})
+
+    recall_keys = [key for key in rows[0] if key.startswith("recall@")]
+    print(f"{'type':<10} {'factory':<20} {'param':<13} {'build s':>8} {'MB':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          + " ".join(f"{key:>10}" for key in recall_keys))
+    for row in rows:
+        print(f"{row['type']:<10} {row['factory']:<20} {row['param']:<13} {row['build_s']:>8} "
+              f"{row['bytes'] / 2 ** 20:>8.2f} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+              + " ".join(f"{row[key]:>10}" for key in recall_keys))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
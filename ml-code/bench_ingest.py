@@ -0,0 +1,151 @@
+# bench_ingest.py
+# Memory profile of PDF ingestion on a synthetic corpus: the old path (DirectoryLoader.load()
+# of every page, then one split_documents over all of them) against the streaming path of
+# database_for_bot.py (pages read lazily, chunked per page, new chunks held in batches of
+# INGEST_BATCH_CHUNKS). Each run is a separate process; peak RSS is reported above the
+# RSS after imports, for every corpus size, so growth with the corpus shows directly.
+# Both paths must produce the same chunk ids (the "ids" column).
+#
+# Embedding is left out (the model's memory is the same for both) unless --embed is given.
+#
+# to run: python bench_ingest.py [--pages 500 2000 4000] [--pdfs 4] [--workers 1]
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+WORDS = ("patient dose tablet daily fever infection pain blood pressure insulin symptoms doctor "
+         "treatment chronic acute therapy clinical adverse effect contraindicated renal hepatic").split()
+
+
+def write_synthetic_pdf(path, pages, lines_per_page, rng):
+    """Minimal uncompressed PDF with Helvetica text lines, written incrementally."""
+    offsets = []
+    with open(path, "wb") as f:
+        def obj(number, body):
+            offsets.append((number, f.tell()))
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+        obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+        obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        for i in range(pages):
+            lines = [" ".join(rng.choice(WORDS, rng.integers(8, 16))) for _ in range(lines_per_page)]
+            text = " T* ".join(f"({line}) Tj" for line in lines)
+            stream = f"BT /F1 9 Tf 11 TL 40 760 Td {text} ET".encode()
+            obj(4 + 2 * i, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                           f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+            obj(5 + 2 * i, f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+        xref = f.tell()
+        count = 3 + 2 * pages + 1
+        f.write(f"xref\n0 {count}\n0000000000 65535 f \n".encode())
+        for _, offset in sorted(offsets):
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def peak_rss_bytes():
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def ids_digest(ids_by_file):
+    digest = hashlib.sha256()
+    for path in sorted(ids_by_file):
+        digest.update("".join(ids_by_file[path]).encode())
+    return digest.hexdigest()[:12]
+
+
+def run_child(mode, data_path, workers, embed):
+    """One measurement in this (fresh) process; prints a JSON line."""
+    import database_for_bot as db_module
+
+    base = rss_bytes()
+    start = time.perf_counter()
+    ids_by_file, pages, chunks = {}, 0, 0
+    model = db_module.get_embedding_model() if embed else None
+    if mode == "load":
+        documents = db_module.DirectoryLoader(data_path, glob="*.pdf", loader_cls=db_module.PyPDFLoader).load()
+        all_chunks = db_module.text_splitter.split_documents(documents)
+        pages, chunks = len(documents), len(all_chunks)
+        by_page = {}
+        for chunk in all_chunks:
+            by_page.setdefault((chunk.metadata["source"], chunk.metadata["page"]), []).append(chunk)
+        pairs = []
+        for (source, _), page_chunks in by_page.items():
+            ids = db_module.chunk_ids(page_chunks)
+            ids_by_file.setdefault(source, []).extend(ids)
+            pairs.extend(zip(page_chunks, ids))
+        if model:
+            with model.engine:
+                db_module.add_chunks(None, model, pairs)
+    else:
+        paths = sorted(os.path.join(data_path, name) for name in os.listdir(data_path))
+        pending, db = [], None
+        for path, page_chunks in db_module.stream_pdf_chunks(paths, workers):
+            if page_chunks is None:
+                continue
+            ids = db_module.chunk_ids(page_chunks)
+            ids_by_file.setdefault(path, []).extend(ids)
+            pages += 1
+            chunks += len(page_chunks)
+            pending.extend(zip(page_chunks, ids))
+            if len(pending) >= db_module.INGEST_BATCH_CHUNKS:
+                if model:
+                    db = db_module.add_chunks(db, model, pending)
+                pending = []
+        if model:
+            if pending:
+                db_module.add_chunks(db, model, pending)
+            model.engine.close()
+    print(json.dumps({"pages": pages, "chunks": chunks, "seconds": round(time.perf_counter() - start, 2),
+                      "base_mb": round(base / 2 ** 20, 1), "peak_mb": round(peak_rss_bytes() / 2 ** 20, 1),
+                      "ids": ids_digest(ids_by_file)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of PDF ingestion: load-everything vs streaming")
+    parser.add_argument("--pages", nargs="+", type=int, default=[500, 2000, 4000], help="corpus sizes (total pages)")
+    parser.add_argument("--pdfs", type=int, default=4, help="files the pages are spread over")
+    parser.add_argument("--lines", type=int, default=60, help="text lines per page")
+    parser.add_argument("--workers", type=int, default=1, help="parser processes for the streaming path")
+    parser.add_argument("--embed", action="store_true", help="also embed the chunks (loads the model)")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "DATA"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.workers, args.embed)
+        return
+
+    rng = np.random.default_rng(0)
+    print(f"{'pages':>6} {'mode':<7} {'chunks':>7} {'seconds':>8} {'base MB':>8} {'peak MB':>8} {'growth MB':>10} {'ids':>13}")
+    for total in args.pages:
+        with tempfile.TemporaryDirectory() as data_path:
+            for i in range(args.pdfs):
+                write_synthetic_pdf(os.path.join(data_path, f"book_{i}.pdf"), total // args.pdfs, args.lines, rng)
+            for mode in ("load", "stream"):
+                command = [sys.executable, os.path.abspath(__file__), "--child", mode, data_path,
+                           "--workers", str(args.workers)] + (["--embed"] if args.embed else [])
+                out = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+                r = json.loads(out.strip().splitlines()[-1])
+                print(f"{r['pages']:>6} {mode:<7} {r['chunks']:>7} {r['seconds']:>8} {r['base_mb']:>8} "
+                      f"{r['peak_mb']:>8} {r['peak_mb'] - r['base_mb']:>10.1f} {r['ids']:>13}")
+
+
+if __name__ == "__main__":
+    main()
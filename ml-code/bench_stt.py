@@ -0,0 +1,79 @@
+# bench_stt.py
+# Latency and real-time factor (processing time / audio duration, lower is better) of the
+# STT backends on the sample recordings in temp/, averaged over the samples. The local
+# backend's model load is reported separately from the per-call numbers; the Groq
+# backend needs GROQ_API_KEY.
+#
+# to run: python bench_stt.py [--audio temp/*.mp3] [--backends local groq] [--runs 5]
+
+import os
+import glob
+import time
+import asyncio
+import argparse
+import statistics
+
+from pydub import AudioSegment
+
+from voice_of_patient import get_stt_backend
+
+
+def audio_duration(path):
+    """Seconds of audio; pydub needs ffmpeg, PyAV (installed with faster-whisper) does not."""
+    try:
+        return len(AudioSegment.from_file(path)) / 1000
+    except (OSError, FileNotFoundError):
+        import av
+        with av.open(path) as container:
+            return container.duration / av.time_base
+
+
+async def bench(backend, audio_path, runs, concurrency):
+    timings = []
+    text = language = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        results = await asyncio.gather(*(backend.transcribe(audio_path) for _ in range(concurrency)))
+        timings.append(time.perf_counter() - start)
+        text, language = results[0]
+    return timings, text, language
+
+
+def main():
+    parser = argparse.ArgumentParser(description="STT backends: latency and real-time factor")
+    parser.add_argument("--audio", nargs="+", default=None, help="sample recordings (default: temp/*.mp3)")
+    parser.add_argument("--backends", nargs="+", default=["local", "groq"], choices=["local", "groq"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1, help="transcriptions started at once per run")
+    args = parser.parse_args()
+
+    audio_paths = args.audio or sorted(glob.glob(os.path.join("temp", "*.mp3")))
+    if not audio_paths:
+        parser.error("no sample recordings: pass --audio or put .mp3 files in temp/")
+    durations = {path: audio_duration(path) for path in audio_paths}
+    print(f"audio: {len(audio_paths)} samples ({statistics.mean(durations.values()):.1f}s on average), "
+          f"{args.runs} runs x {args.concurrency} concurrent per sample")
+
+    for name in args.backends:
+        if name == "groq" and not os.environ.get("GROQ_API_KEY"):
+            print(f"{name:<6} skipped (GROQ_API_KEY not set)")
+            continue
+        backend = get_stt_backend(name)
+        start = time.perf_counter()
+        backend.warm_up()
+        load_seconds = time.perf_counter() - start
+
+        p50s, rtfs, worst, languages = [], [], 0.0, {}
+        for path in audio_paths:
+            timings, text, language = asyncio.run(bench(backend, path, args.runs, args.concurrency))
+            p50 = statistics.median(timings)
+            p50s.append(p50)
+            rtfs.append(p50 / (durations[path] * args.concurrency))
+            worst = max(worst, max(timings))
+            languages[language] = languages.get(language, 0) + 1
+        print(f"{name:<6} load {load_seconds:5.1f}s   mean p50 {statistics.mean(p50s) * 1000:7.1f} ms   "
+              f"max {worst * 1000:7.1f} ms   mean RTF {statistics.mean(rtfs):.3f}   languages {languages}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# bench_tts.py
+# Reply synthesis time: one ElevenLabs request for the whole reply vs sentence-parallel
+# synthesis, against the local mock TTS endpoint whose latency grows with text length.
+# The TTS cache is pointed at a scratch directory so every run really synthesizes.
+#
+# to run: python bench_tts.py [--sentences 6] [--ms-per-char 4] [--runs 3]
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+from mock_providers import start_mock_server, MOCK_REPLY
+
+
+def unique_reply(sentences, tag):
+    # Every sentence differs per run and mode, so the TTS cache stays out of the measurement
+    return " ".join(f"{sentence[:-1]} ({tag}-{i})." for i, sentence in enumerate(sentences))
+
+
+async def bench(voice_of_bot, sentences, runs, concurrency):
+    whole, parallel = [], []
+    for run in range(runs):
+        start = time.perf_counter()
+        await voice_of_bot.text_to_speech_with_elevenlabs_async(unique_reply(sentences, f"w{run}"), "en")
+        whole.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await voice_of_bot.text_to_speech_by_sentence_async(unique_reply(sentences, f"s{run}"), "en",
+                                                            concurrency=concurrency)
+        parallel.append(time.perf_counter() - start)
+    return whole, parallel
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whole-reply vs sentence-parallel TTS against the mock server")
+    parser.add_argument("--sentences", type=int, default=6, help="sentences in the reply (the mock reply's sentences, repeated)")
+    parser.add_argument("--ms-per-char", type=float, default=4.0, help="mock TTS time per character")
+    parser.add_argument("--latency", type=float, default=0.15, help="mock fixed latency per request (s)")
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(latency=args.latency, tts_seconds_per_char=args.ms_per_char / 1000)
+    # Must be set before voice_of_bot is imported
+    os.environ["ELEVENLABS_BASE_URL"] = base_url
+    os.environ.setdefault("ELEVENLABS_API_KEY", "mock")
+
+    import voice_of_bot
+    from tts_cache_for_bot import TTSCache
+
+    sentences = [s.strip() + "." for s in MOCK_REPLY.split(".") if s.strip()]
+    sentences = (sentences * args.sentences)[:args.sentences]
+
+    with tempfile.TemporaryDirectory() as folder:
+        voice_of_bot.tts_cache = TTSCache(folder=folder)
+        try:
+            whole, parallel = asyncio.run(bench(voice_of_bot, sentences, args.runs, args.concurrency))
+        finally:
+            server.shutdown()
+
+    print(f"reply: {len(unique_reply(sentences, 'x'))} chars, {args.sentences} sentences, concurrency {args.concurrency}")
+    print(f"whole reply     p50 {statistics.median(whole) * 1000:8.1f} ms")
+    print(f"sentence-level  p50 {statistics.median(parallel) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# bench_uploads.py
+# Peak memory of ingesting one photo upload: the old path (read the whole upload, write it,
+# read it back, base64 it, wrap it in a data URL) vs the streaming path (chunked copy to
+# disk, reduced-scale decode, incremental base64). Each variant runs in its own process
+# so peak RSS is not shared between them.
+#
+# to run: python bench_uploads.py [--photo some.jpg] [--size-mb 10]
+
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+
+def rss_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM (peak RSS) to the current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def make_photo(path, size_mb):
+    """Phone-sized (4032x3024) noisy JPEG, raising quality until it reaches about size_mb."""
+    from PIL import Image
+    bands = [Image.effect_noise((4032, 3024), 64) for _ in range(3)]
+    photo = Image.merge("RGB", bands)
+    for quality in (70, 80, 85, 90, 95):
+        photo.save(path, format="JPEG", quality=quality)
+        if os.path.getsize(path) >= size_mb * 1024 * 1024:
+            break
+
+
+async def ingest(variant, photo_path):
+    from fastapi import UploadFile
+    from brain_of_bot import encode_image, preprocess_image
+    from uploads_for_bot import save_upload_stream, MAX_IMAGE_UPLOAD_BYTES
+
+    # What the multipart parser hands the endpoint: a spooled temp file (1 MB in memory, rest on disk)
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    with open(photo_path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            spooled.write(chunk)
+    spooled.seek(0)
+    upload = UploadFile(spooled, filename=os.path.basename(photo_path))
+
+    target = os.path.join(tempfile.gettempdir(), f"bench_upload_{uuid.uuid4().hex}.jpg")
+    reset_peak_rss()
+    baseline = rss_kb("VmRSS")
+    start = time.perf_counter()
+    try:
+        if variant == "before":
+            data = await upload.read()
+            with open(target, "wb") as f:
+                f.write(data)
+            encoded = encode_image(target)
+            data_url = f"data:image/jpeg;base64,{encoded}"
+        else:
+            await save_upload_stream(upload, target, MAX_IMAGE_UPLOAD_BYTES)
+            data_url, _ = preprocess_image(target)
+        elapsed = time.perf_counter() - start
+        peak = rss_kb("VmHWM")
+    finally:
+        os.remove(target)
+    print(f"{variant:<7} peak RSS +{(peak - baseline) / 1024:7.1f} MB   "
+          f"payload {len(data_url) / 1024 / 1024:6.2f} MB   {elapsed * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS per photo upload: buffered vs streaming ingestion")
+    parser.add_argument("--photo", help="JPEG to upload (default: a generated phone-sized photo)")
+    parser.add_argument("--size-mb", type=float, default=10, help="size of the generated photo")
+    parser.add_argument("--child", choices=["before", "after"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(ingest(args.child, args.photo))
+        return
+
+    photo = args.photo
+    generated = photo is None
+    if generated:
+        photo = os.path.join(tempfile.gettempdir(), "bench_photo.jpg")
+        make_photo(photo, args.size_mb)
+    print(f"photo: {photo} ({os.path.getsize(photo) / 1024 / 1024:.1f} MB)")
+    try:
+        for variant in ("before", "after"):
+            subprocess.run([sys.executable, __file__, "--child", variant, "--photo", photo], check=True)
+    finally:
+        if generated:
+            os.remove(photo)
+
+
+if __name__ == "__main__":
+    main()
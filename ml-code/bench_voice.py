@@ -0,0 +1,104 @@
+# bench_voice.py
+# Requests/sec and bytes sent for repeated playback of one reply clip: the old plain
+# FileResponse vs voice_response (in-memory hot clip, 304 revalidation, Range seeks),
+# both served by uvicorn from a scratch directory.
+#
+# to run: python bench_voice.py [--kb 800] [--seconds 3] [--concurrency 16]
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+
+
+def build_app(folder):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import FileResponse
+    from serving_for_bot import voice_response
+
+    app = FastAPI()
+
+    @app.get("/old/{filename}")
+    async def old(filename: str):
+        return FileResponse(os.path.join(folder, filename), media_type="audio/mpeg", filename=filename)
+
+    @app.get("/new/{filename}")
+    async def new(request: Request, filename: str):
+        return await voice_response(request.headers, os.path.join(folder, filename))
+
+    return app
+
+
+def start_server(app, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def hammer(url, headers, seconds, concurrency):
+    """(requests/sec, average bytes per response, status codes seen)"""
+    import httpx
+
+    done = 0
+    received = 0
+    statuses = set()
+    deadline = time.perf_counter() + seconds
+
+    async def worker(client):
+        nonlocal done, received
+        while time.perf_counter() < deadline:
+            resp = await client.get(url, headers=headers)
+            done += 1
+            received += len(resp.content)
+            statuses.add(resp.status_code)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await client.get(url)  # warm-up (fills the hot cache for /new)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return done / elapsed, received / max(done, 1), sorted(statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Repeated playback of a reply clip: old vs new /download-voice")
+    parser.add_argument("--kb", type=int, default=800, help="clip size")
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of each scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    import httpx
+
+    with tempfile.TemporaryDirectory() as folder:
+        name = "final_bench.mp3"
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(b"ID3" + os.urandom(args.kb * 1024))
+        server = start_server(build_app(folder), args.port)
+        base = f"http://127.0.0.1:{args.port}"
+        etag = httpx.get(f"{base}/new/{name}").headers["etag"]
+
+        scenarios = [
+            ("old: full download", f"{base}/old/{name}", {}),
+            ("new: full download (hot)", f"{base}/new/{name}", {}),
+            ("new: revalidate (304)", f"{base}/new/{name}", {"If-None-Match": etag}),
+            ("new: seek (64 KB range)", f"{base}/new/{name}", {"Range": "bytes=409600-475135"}),
+        ]
+        try:
+            print(f"clip {args.kb} KB, concurrency {args.concurrency}, {args.seconds:.0f}s per scenario")
+            for label, url, headers in scenarios:
+                rps, avg_bytes, statuses = asyncio.run(hammer(url, headers, args.seconds, args.concurrency))
+                print(f"{label:<26} {rps:9.1f} req/s   {avg_bytes / 1024:8.1f} KB/response   status {statuses}")
+        finally:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,135 @@
 # brain_of_bot.py
 
+import io
 import os
 import base64
-from groq import Groq
+from PIL import Image, ImageOps
+from clients_for_bot import get_groq_client, get_async_groq_client
+from resilience_for_bot import call_async, breakers
+from metrics_for_bot import traced, record_token_usage
 
 # Step 1: Setup API key and default model
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 MODEL_NAME = "meta-llama/llama-4-maverick-17b-128e-instruct"
+# Photos are downsized to this longest side before upload; phone photos are often 4000px+
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", "1280"))
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", "85"))
 
 
 # Step 2: Encode image to base64
+@traced("encode_image")
 def encode_image(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode("utf-8")
 
 
+def encode_data_url(stream, mime="image/jpeg", chunk_size=3 * 64 * 1024):
+    """
+    data:<mime>;base64,... read from a binary stream in chunks (a multiple of 3 bytes, so
+    the pieces concatenate into valid base64) without holding the raw bytes in memory.
+    """
+    out = bytearray(f"data:{mime};base64,".encode("ascii"))
+    while chunk := stream.read(chunk_size):
+        out += base64.b64encode(chunk)
+    return out.decode("ascii")
+
+
+@traced("image_preprocess")
+def preprocess_image(image_path, max_side=IMAGE_MAX_SIDE, quality=IMAGE_JPEG_QUALITY):
+    """
+    Decode, apply the EXIF orientation, shrink to max_side and re-encode as JPEG.
+    Small upright JPEGs are sent as they are. Returns (data_url, info); the data URL can be
+    passed wherever an encoded image is expected.
+    """
+    original_bytes = os.path.getsize(image_path)
+    try:
+        with Image.open(image_path) as image:
+            orientation = image.getexif().get(0x0112, 1)
+            if image.format == "JPEG" and orientation == 1 and max(image.size) <= max_side:
+                with open(image_path, "rb") as f:
+                    return encode_data_url(f), {"original_bytes": original_bytes, "sent_bytes": original_bytes,
+                                                "size": list(image.size), "recompressed": False}
+            # JPEGs are decoded directly at a reduced scale, never at full phone resolution
+            image.draft("RGB", (max_side, max_side))
+            if orientation != 1:
+                image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=quality, optimize=True)
+    except Exception as e:
+        # Not something Pillow can read; let the model decide what to do with it
+        print(f"Image preprocessing skipped for {image_path}: {e}")
+        with open(image_path, "rb") as f:
+            return encode_data_url(f), {"original_bytes": original_bytes, "sent_bytes": original_bytes,
+                                        "recompressed": False}
+    sent_bytes = out.tell()
+    out.seek(0)
+    return encode_data_url(out), {"original_bytes": original_bytes, "sent_bytes": sent_bytes,
+                                  "size": list(image.size), "recompressed": True}
+
+
 # Step 3: Wrapper for calling Groq chat completion
+@traced("llm_chat")
 def groq_chat_completion(chat_messages, model=MODEL_NAME):
     """
     Call Groq chat completions with the given messages.
     chat_messages = [ {"role": "system|user|assistant", "content": str or multimodal list}, ... ]
     """
-    client = Groq(api_key=GROQ_API_KEY)
+    client = get_groq_client(GROQ_API_KEY)
     resp = client.chat.completions.create(
         messages=chat_messages,
         model=model
     )
+    record_token_usage(model, resp.usage)
     return resp.choices[0].message.content
 
 
-# Step 4: Multimodal (image+text) query with conversation context
-def analyze_image_with_query_full_conversation(user_text, encoded_image, conversation_messages):
+# Step 3b: Async variant, so the FastAPI event loop is never blocked on Groq
+@traced("llm_chat")
+async def groq_chat_completion_async(chat_messages, model=MODEL_NAME):
     """
-    Use this when you have system prompt + previous turns in conversation_messages.
+    Same as groq_chat_completion but awaits the pooled AsyncGroq client, with retries,
+    the request's deadline and the Groq circuit breaker (resilience_for_bot).
+    """
+    client = get_async_groq_client(GROQ_API_KEY)
+    resp = await call_async("groq", lambda: client.chat.completions.create(
+        messages=chat_messages,
+        model=model
+    ))
+    record_token_usage(model, resp.usage)
+    return resp.choices[0].message.content
 
-    Params:
-      user_text (str): what the patient said (+ optional RAG context)
-      encoded_image (str): base64 string from encode_image
-      conversation_messages (list): existing conversation list, e.g.
-        [{"role":"system","content":"..."},
-         {"role":"user","content":"..."},
-         {"role":"assistant","content":"..."}]
+
+@traced("llm_chat_stream")
+async def groq_chat_completion_stream(chat_messages, model=MODEL_NAME):
+    """
+    Stream the chat completion, yielding text deltas as Groq produces them.
+    Opening the stream is retried; once tokens flow, a failure is reported to the breaker
+    and raised (the text already sent cannot be taken back).
+    """
+    client = get_async_groq_client(GROQ_API_KEY)
+    stream = await call_async("groq", lambda: client.chat.completions.create(
+        messages=chat_messages,
+        model=model,
+        stream=True
+    ))
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            # Groq reports usage on the last chunk, under x_groq
+            record_token_usage(model, getattr(getattr(chunk, "x_groq", None), "usage", None))
+    except Exception:
+        breakers["groq"].record_failure()
+        raise
+
+
+def build_multimodal_messages(user_text, encoded_image, conversation_messages):
+    """
+    Copy conversation_messages into chat API shape and append the latest user
+    turn with BOTH text and image.
     """
     chat_messages = []
     for m in conversation_messages:
@@ -54,10 +143,39 @@ def analyze_image_with_query_full_conversation(user_text, encoded_image, convers
         {"type": "text", "text": user_text},
         {
             "type": "image_url",
-            "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}
+            # preprocess_image already returns a data URL, encode_image returns bare base64
+            "image_url": {"url": encoded_image if encoded_image.startswith("data:")
+                          else f"data:image/jpeg;base64,{encoded_image}"}
         }
     ]
     chat_messages.append({"role": "user", "content": multimodal_user_content})
+    return chat_messages
+
+
+# Step 4: Multimodal (image+text) query with conversation context
+@traced("llm_vision")
+def analyze_image_with_query_full_conversation(user_text, encoded_image, conversation_messages):
+    """
+    Use this when you have system prompt + previous turns in conversation_messages.
+
+    Params:
+      user_text (str): what the patient said (+ optional RAG context)
+      encoded_image (str): base64 string from encode_image, or a data URL from preprocess_image
+      conversation_messages (list): existing conversation list, e.g.
+        [{"role":"system","content":"..."},
+         {"role":"user","content":"..."},
+         {"role":"assistant","content":"..."}]
+    """
+    chat_messages = build_multimodal_messages(user_text, encoded_image, conversation_messages)
 
     # Call Groq
-    return groq_chat_completion(chat_messages, model=MODEL_NAME)
\ No newline at end of file
+    return groq_chat_completion(chat_messages, model=MODEL_NAME)
+
+
+@traced("llm_vision")
+async def analyze_image_with_query_full_conversation_async(user_text, encoded_image, conversation_messages):
+    """
+    Async variant of analyze_image_with_query_full_conversation (same params).
+    """
+    chat_messages = build_multimodal_messages(user_text, encoded_image, conversation_messages)
+    return await groq_chat_completion_async(chat_messages, model=MODEL_NAME)
@@ -0,0 +1,132 @@
+# chunks_for_bot.py
+# Compact on-disk chunk store, replacing the pickled langchain docstore (index.pkl).
+# The indexer writes, next to index.faiss, a chunks/ directory with:
+#  - text.bin: every chunk's UTF-8 text followed by its metadata as JSON, in FAISS order;
+#  - offsets.npy: (start, end of text, end of metadata) per FAISS position;
+#  - ids.npy: docstore id per FAISS position;
+#  - sorted_ids.npy / sorted_positions.npy: the ids sorted, for id -> position lookups.
+# Everything is memory-mapped: opening the store reads nothing, only chunks that are
+# retrieved are decoded into Documents, worker processes share the pages through the
+# page cache, and nothing is unpickled.
+
+import os
+import json
+import mmap
+from collections.abc import Mapping
+
+import numpy as np
+
+CHUNKS_DIR = "chunks"
+TEXT_FILE = "text.bin"
+OFFSETS_FILE = "offsets.npy"
+IDS_FILE = "ids.npy"
+SORTED_IDS_FILE = "sorted_ids.npy"
+SORTED_POSITIONS_FILE = "sorted_positions.npy"
+
+
+def write_chunk_store(path, docstore, index_to_docstore_id):
+    """Write the chunks of a langchain docstore in FAISS position order (positions 0..n-1)."""
+    os.makedirs(path, exist_ok=True)
+    n = len(index_to_docstore_id)
+    offsets = np.zeros((n, 3), dtype=np.int64)
+    ids = []
+    with open(os.path.join(path, TEXT_FILE), "wb") as f:
+        position = 0
+        for i in range(n):
+            doc_id = index_to_docstore_id[i]
+            doc = docstore.search(doc_id)
+            text = doc.page_content.encode("utf-8")
+            metadata = json.dumps(doc.metadata, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+            f.write(text)
+            f.write(metadata)
+            offsets[i] = (position, position + len(text), position + len(text) + len(metadata))
+            position = offsets[i, 2]
+            ids.append(doc_id.encode("utf-8"))
+
+    ids = np.array(ids, dtype=f"S{max((len(x) for x in ids), default=1)}")
+    order = np.argsort(ids, kind="stable")
+    np.save(os.path.join(path, OFFSETS_FILE), offsets)
+    np.save(os.path.join(path, IDS_FILE), ids)
+    np.save(os.path.join(path, SORTED_IDS_FILE), ids[order])
+    np.save(os.path.join(path, SORTED_POSITIONS_FILE), order.astype(np.int64))
+
+
+class PositionIds(Mapping):
+    """Read-only {FAISS position: docstore id} over the memory-mapped ids (langchain's index_to_docstore_id)."""
+
+    def __init__(self, ids):
+        self._ids = ids
+
+    def __getitem__(self, position):
+        # -1 (no result) must not wrap around to the last chunk
+        if not 0 <= position < len(self._ids):
+            raise KeyError(position)
+        return self._ids[position].decode("utf-8")
+
+    def __iter__(self):
+        return iter(range(len(self._ids)))
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class ChunkStore:
+    """Docstore-compatible reader: search(doc_id) returns a Document, or langchain's "not found" string."""
+
+    def __init__(self, path):
+        from langchain_core.documents import Document
+
+        self.path = path
+        self._document = Document
+        self.offsets = self._map(OFFSETS_FILE)
+        self.ids = self._map(IDS_FILE)
+        self.sorted_ids = self._map(SORTED_IDS_FILE)
+        self.sorted_positions = self._map(SORTED_POSITIONS_FILE)
+        self.index_to_docstore_id = PositionIds(self.ids)
+        with open(os.path.join(path, TEXT_FILE), "rb") as f:
+            # mmap cannot map an empty file
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        if hasattr(self._blob, "madvise") and hasattr(mmap, "MADV_RANDOM"):
+            # Lookups are random: no readahead of neighbouring chunks
+            self._blob.madvise(mmap.MADV_RANDOM)
+
+    def _map(self, name):
+        # Plain ndarray view of the mapping: indexing an np.memmap costs ~10x more per call
+        return np.asarray(np.load(os.path.join(self.path, name), mmap_mode="r"))
+
+    def position(self, doc_id):
+        key = doc_id.encode("utf-8")
+        i = int(np.searchsorted(self.sorted_ids, key))
+        if i < len(self.sorted_ids) and self.sorted_ids[i] == key:
+            return int(self.sorted_positions[i])
+        return None
+
+    def get(self, position):
+        start, text_end, end = self.offsets[position].tolist()
+        return self._document(
+            id=self.ids[position].decode("utf-8"),
+            page_content=self._blob[start:text_end].decode("utf-8"),
+            metadata=json.loads(self._blob[text_end:end].decode("utf-8")),
+        )
+
+    def search(self, doc_id):
+        position = self.position(doc_id)
+        if position is None:
+            return f"ID {doc_id} not found."
+        return self.get(position)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def disk_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, name))
+                   for name in (TEXT_FILE, OFFSETS_FILE, IDS_FILE, SORTED_IDS_FILE, SORTED_POSITIONS_FILE))
+
+
+def load_in_memory_docstore(store):
+    """(InMemoryDocstore, {position: id}) with every chunk materialized, for the indexer's updates."""
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    index_to_docstore_id = dict(enumerate(id_.decode("utf-8") for id_ in store.ids))
+    docs = {doc_id: store.get(position) for position, doc_id in index_to_docstore_id.items()}
+    return InMemoryDocstore(docs), index_to_docstore_id
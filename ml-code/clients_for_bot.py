@@ -0,0 +1,184 @@
+# clients_for_bot.py
+# One long-lived, keep-alive HTTP connection pool per provider (Groq, ElevenLabs),
+# shared by brain_of_bot, voice_of_patient and voice_of_bot instead of building a
+# new SDK client (and TLS handshake) on every call.
+
+import os
+import threading
+import importlib.util
+
+import httpx
+from groq import Groq, AsyncGroq
+from elevenlabs import ElevenLabs, AsyncElevenLabs
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# ---- Pool settings (env overridable) ----
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "20"))
+HTTP_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+# HTTP/2 needs the optional "h2" package (pip install httpx[http2])
+HTTP2 = os.environ.get("HTTP2", "0") == "1"
+
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL")
+ELEVENLABS_BASE_URL = os.environ.get("ELEVENLABS_BASE_URL")
+
+
+# ---- Connection reuse metrics ----
+class ConnectionStats:
+    """
+    Counts requests and newly opened TCP connections for one provider,
+    fed by httpcore trace events.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def record(self, event_name):
+        with self._lock:
+            if event_name == "connection.connect_tcp.started":
+                self.new_connections += 1
+            elif event_name in ("http11.send_request_headers.started", "http2.send_request_headers.started"):
+                self.requests += 1
+
+    def snapshot(self):
+        with self._lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+            }
+
+
+stats = {"groq": ConnectionStats(), "elevenlabs": ConnectionStats()}
+
+
+def _sync_trace_hook(provider):
+    def trace(event_name, info):
+        stats[provider].record(event_name)
+
+    def on_request(request):
+        request.extensions["trace"] = trace
+    return on_request
+
+
+def _async_trace_hook(provider):
+    async def trace(event_name, info):
+        stats[provider].record(event_name)
+
+    async def on_request(request):
+        request.extensions["trace"] = trace
+    return on_request
+
+
+def _http2_enabled():
+    if HTTP2 and importlib.util.find_spec("h2") is None:
+        print("[clients] HTTP2=1 but the h2 package is not installed, falling back to HTTP/1.1")
+        return False
+    return HTTP2
+
+
+def _pool_kwargs():
+    return {
+        "limits": httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        "http2": _http2_enabled(),
+    }
+
+
+# ---- Registry ----
+_lock = threading.Lock()
+_clients = {}
+_async_http_clients = []
+
+
+def _sync_http_client(provider):
+    return httpx.Client(event_hooks={"request": [_sync_trace_hook(provider)]}, **_pool_kwargs())
+
+
+def _async_http_client(provider):
+    http_client = httpx.AsyncClient(event_hooks={"request": [_async_trace_hook(provider)]}, **_pool_kwargs())
+    _async_http_clients.append(http_client)
+    return http_client
+
+
+def _get_or_create(key, factory):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+    return client
+
+
+def get_groq_client(api_key=None):
+    api_key = api_key or os.environ.get("GROQ_API_KEY")
+    return _get_or_create(("groq", api_key), lambda: Groq(
+        api_key=api_key,
+        base_url=GROQ_BASE_URL,
+        http_client=_sync_http_client("groq"),
+        max_retries=0,
+    ))
+
+
+def get_async_groq_client(api_key=None):
+    """
+    Async clients hold connections bound to the running event loop, so they
+    must only be used from the server's loop (see close_async_clients).
+    """
+    api_key = api_key or os.environ.get("GROQ_API_KEY")
+    return _get_or_create(("async_groq", api_key), lambda: AsyncGroq(
+        api_key=api_key,
+        base_url=GROQ_BASE_URL,
+        http_client=_async_http_client("groq"),
+        # Retries are done by resilience_for_bot (backoff, deadline, circuit breaker)
+        max_retries=0,
+    ))
+
+
+def get_elevenlabs_client(api_key=None):
+    api_key = api_key or os.environ.get("ELEVENLABS_API_KEY")
+    return _get_or_create(("elevenlabs", api_key), lambda: ElevenLabs(
+        api_key=api_key,
+        base_url=ELEVENLABS_BASE_URL,
+        timeout=HTTP_TIMEOUT,
+        httpx_client=_sync_http_client("elevenlabs"),
+    ))
+
+
+def get_async_elevenlabs_client(api_key=None):
+    api_key = api_key or os.environ.get("ELEVENLABS_API_KEY")
+    return _get_or_create(("async_elevenlabs", api_key), lambda: AsyncElevenLabs(
+        api_key=api_key,
+        base_url=ELEVENLABS_BASE_URL,
+        timeout=HTTP_TIMEOUT,
+        httpx_client=_async_http_client("elevenlabs"),
+    ))
+
+
+async def close_async_clients():
+    """Close pooled async connections; call on app shutdown."""
+    with _lock:
+        for key in [k for k in _clients if k[0].startswith("async_")]:
+            del _clients[key]
+        http_clients = list(_async_http_clients)
+        _async_http_clients.clear()
+    for http_client in http_clients:
+        await http_client.aclose()
+
+
+def connection_stats():
+    return {provider: s.snapshot() for provider, s in stats.items()}
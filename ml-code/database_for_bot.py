@@ -1,44 +1,336 @@
+# database_for_bot.py
+# Incremental FAISS indexer for the PDFs in data/.
+# Only new or changed PDFs are parsed, only chunks that are not already in the index are
+# embedded, and vectors of deleted files are removed. The updated index is written next
+# to the live one and swapped in, and the server picks it up via manifest.json.
+# The BM25 index for hybrid retrieval (bm25.npz) is rebuilt over all chunks with every version,
+# and so is the trained approximate index (index.ann.faiss, see ann_for_bot.py) when
+# --index-type is not "flat".
+# PDFs are read page by page in parser processes and chunked per page; new chunks are
+# embedded by embeddings_for_bot.py in bounded batches (INGEST_BATCH_CHUNKS) and added to
+# the index batch by batch, so memory does not grow with the size of the PDFs.
+# Chunk texts and metadata are saved in the memory-mapped chunk store (chunks_for_bot.py),
+# not in a pickled docstore.
+#
+# to run: python database_for_bot.py [--data data/] [--index vectorstore/db_faiss] [--full] [--index-type ivf_sq8]
+
 from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
 import os
+import json
+import time
+import shutil
+import hashlib
+import queue
+import argparse
+import multiprocessing
+from collections import Counter
+
+from hybrid_for_bot import BM25Index, BM25_FILE
+from ann_for_bot import ANN_FILE, INDEX_TYPE, ann_from_flat
+from embeddings_for_bot import EmbeddingEngine, EMBED_BATCH_SIZE, EMBED_WORKERS
+from chunks_for_bot import CHUNKS_DIR, ChunkStore, load_in_memory_docstore, write_chunk_store
 
 from dotenv import load_dotenv
 load_dotenv()
 
-# Step 1: Load raw PDF(s)
-DATA_PATH="data/"
+DATA_PATH = "data/"
+DB_FAISS_PATH = "vectorstore/db_faiss"
+MANIFEST_NAME = "manifest.json"
+# New chunks held in memory before they are embedded and added to the index
+INGEST_BATCH_CHUNKS = int(os.environ.get("INGEST_BATCH_CHUNKS", "2048"))
+# Parsed pages waiting for the indexer (parsers block when it falls behind)
+INGEST_QUEUE_PAGES = 256
+
+# Step 1: Load raw PDF(s), lazily, one page at a time
 def load_pdf_files(data):
     loader = DirectoryLoader(data,
                              glob='*.pdf',
                              loader_cls=PyPDFLoader)
-    
-    documents=loader.load()
-    return documents
 
-documents=load_pdf_files(data=DATA_PATH)
-#print("Length of PDF pages: ", len(documents))
+    return loader.lazy_load()
 
 # Step 2: Create Chunks
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=700,
+                                               chunk_overlap=75)
+
+def iter_page_chunks(pages):
+    """Chunks of each page, page by page. split_documents splits every page on its own anyway."""
+    for page in pages:
+        yield text_splitter.split_documents([page])
+
 def create_chunks(extracted_data):
-    text_splitter=RecursiveCharacterTextSplitter(chunk_size=700,
-                                                 chunk_overlap=75)
-    text_chunks=text_splitter.split_documents(extracted_data)
-    return text_chunks
+    return [chunk for chunks in iter_page_chunks(extracted_data) for chunk in chunks]
+
+# Step 3: Create Vector Embeddings
+class EngineEmbeddings(Embeddings):
+    """langchain Embeddings over an EmbeddingEngine (the FAISS object needs one)."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def embed_documents(self, texts):
+        return self.engine.embed(texts).tolist()
+
+    def embed_query(self, text):
+        return self.engine.embed([text])[0].tolist()
+
+
+def get_embedding_model(batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS):
+    return EngineEmbeddings(EmbeddingEngine(batch_size=batch_size, workers=workers))
+
+
+# ---- Hashing ----
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_ids(chunks):
+    """
+    Stable id per chunk: hash of source, page and text (plus an occurrence counter for
+    text repeated on the same page), so unchanged chunks keep their id across edits.
+    """
+    seen = Counter()
+    ids = []
+    for chunk in chunks:
+        key = (chunk.metadata.get("source"), chunk.metadata.get("page"), chunk.page_content)
+        seen[key] += 1
+        raw = f"{key[0]}\x00{key[1]}\x00{seen[key]}\x00{key[2]}"
+        ids.append(hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32])
+    return ids
+
+
+
+# ---- Streaming ingestion ----
+def _parse_worker(tasks, results):
+    """Parser process: PDFs from tasks until None; (path, chunks of a page) and (path, None) per file to results."""
+    for path in iter(tasks.get, None):
+        try:
+            for chunks in iter_page_chunks(PyPDFLoader(path).lazy_load()):
+                results.put((path, chunks))
+            results.put((path, None))
+        except Exception as e:
+            results.put((path, RuntimeError(f"{type(e).__name__}: {e}")))
+    results.put(None)
+
+def stream_pdf_chunks(paths, workers=None, queue_pages=INGEST_QUEUE_PAGES):
+    """
+    Yield (path, chunks of one page) for every page of every PDF, then (path, None) once a
+    file is complete. Pages of a file come in order, files interleave when parsed by
+    several processes. At most queue_pages parsed pages wait in memory.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        for path in paths:
+            for chunks in iter_page_chunks(PyPDFLoader(path).lazy_load()):
+                yield path, chunks
+            yield path, None
+        return
+
+    # spawn: the parent may already run torch (the in-process embedder)
+    context = multiprocessing.get_context("spawn")
+    tasks, results = context.Queue(), context.Queue(maxsize=queue_pages)
+    for path in paths:
+        tasks.put(path)
+    for _ in range(workers):
+        tasks.put(None)
+    parsers = [context.Process(target=_parse_worker, args=(tasks, results), daemon=True) for _ in range(workers)]
+    for parser in parsers:
+        parser.start()
+    try:
+        running = workers
+        while running:
+            try:
+                item = results.get(timeout=5)
+            except queue.Empty:
+                if not any(parser.is_alive() for parser in parsers):
+                    raise RuntimeError("PDF parser processes exited unexpectedly")
+                continue
+            if item is None:
+                running -= 1
+                continue
+            path, chunks = item
+            if isinstance(chunks, Exception):
+                raise RuntimeError(f"Failed to parse {path}") from chunks
+            yield path, chunks
+    finally:
+        for parser in parsers:
+            if parser.is_alive():
+                parser.terminate()
+            parser.join()
+
+def add_chunks(db, embedding_model, pending):
+    """Embed [(chunk, chunk_id)] and add them to db (created if None), batch by batch as they are embedded."""
+    texts = [chunk.page_content for chunk, _ in pending]
+    for rows, vectors in embedding_model.engine.embed_stream(texts):
+        text_embeddings = [(texts[i], vector) for i, vector in zip(rows, vectors)]
+        metadatas = [pending[i][0].metadata for i in rows]
+        ids = [pending[i][1] for i in rows]
+        if db is None:
+            db = FAISS.from_embeddings(text_embeddings, embedding_model, metadatas=metadatas, ids=ids)
+        else:
+            db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return db
+
+
+# ---- Manifest ----
+def load_manifest(index_path):
+    manifest_path = os.path.join(index_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(index_path, manifest):
+    with open(os.path.join(index_path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+# Step 4: Store embeddings in FAISS (atomically)
+def load_index_for_update(index_path, embedding_model):
+    """The live index as a FAISS store with an in-memory docstore that chunks can be added to and deleted from."""
+    import faiss
+
+    if not os.path.isdir(os.path.join(index_path, CHUNKS_DIR)):
+        # Written before the chunk store existed
+        return FAISS.load_local(index_path, embedding_model, allow_dangerous_deserialization=True)
+    docstore, index_to_docstore_id = load_in_memory_docstore(ChunkStore(os.path.join(index_path, CHUNKS_DIR)))
+    return FAISS(embedding_function=embedding_model, index=faiss.read_index(os.path.join(index_path, "index.faiss")),
+                 docstore=docstore, index_to_docstore_id=index_to_docstore_id)
+
+
+def write_index_atomically(db, manifest, index_path, ann_index=None):
+    """
+    Save to a sibling directory and swap it in with renames. manifest.json is
+    written last inside the new directory, so a reader that sees the new version
+    also sees a complete index.
+    """
+    import faiss
+
+    tmp_path = f"{index_path}.tmp-{os.getpid()}"
+    old_path = f"{index_path}.old-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    faiss.write_index(db.index, os.path.join(tmp_path, "index.faiss"))
+    write_chunk_store(os.path.join(tmp_path, CHUNKS_DIR), db.docstore, db.index_to_docstore_id)
+    BM25Index.from_docstore(db).save(os.path.join(tmp_path, BM25_FILE))
+    if ann_index is not None:
+        faiss.write_index(ann_index, os.path.join(tmp_path, ANN_FILE))
+    save_manifest(tmp_path, manifest)
+
+    if os.path.exists(index_path):
+        os.replace(index_path, old_path)
+    os.replace(tmp_path, index_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def build_index(data_path=DATA_PATH, index_path=DB_FAISS_PATH, workers=None, batch_size=EMBED_BATCH_SIZE, full=False,
+                index_type=INDEX_TYPE, embed_workers=EMBED_WORKERS):
+    start = time.perf_counter()
+    pdf_paths = sorted(os.path.join(data_path, name) for name in os.listdir(data_path) if name.lower().endswith(".pdf"))
+    current_hashes = {path: file_sha256(path) for path in pdf_paths}
+
+    manifest = None if full else load_manifest(index_path)
+    if manifest is None and os.path.exists(index_path) and not full:
+        print(f"No {MANIFEST_NAME} in {index_path}, rebuilding the whole index")
+    previous_files = manifest["files"] if manifest else {}
+
+    changed = [p for p in pdf_paths if previous_files.get(p, {}).get("sha256") != current_hashes[p]]
+    deleted = [p for p in previous_files if p not in current_hashes]
+    print(f"{len(pdf_paths)} PDFs: {len(changed)} new/changed, {len(deleted)} deleted")
+
+    # Switching the index type rewrites the index even if no PDF changed
+    same_type = manifest and manifest.get("index", {}).get("type", "flat") == index_type
+    if manifest and not changed and not deleted and same_type:
+        print("Index is up to date")
+        return manifest
+
+    embedding_model = get_embedding_model(batch_size=batch_size, workers=embed_workers)
+    db = load_index_for_update(index_path, embedding_model) if manifest else None
+
+    remove_ids = set()
+    for path in deleted:
+        remove_ids.update(previous_files[path]["chunk_ids"])
+    if db is not None and remove_ids:
+        db.delete(list(remove_ids))
+
+    # Stream pages of changed PDFs; only chunk ids are kept per file, chunk texts only
+    # until their batch is embedded
+    files = {p: info for p, info in previous_files.items() if p in current_hashes}
+    old_ids = {path: set(previous_files.get(path, {}).get("chunk_ids", [])) for path in changed}
+    file_ids = {path: [] for path in changed}
+    pending = []
+    embedded = 0
+    removed = len(remove_ids)
+    with embedding_model.engine:
+        for path, chunks in stream_pdf_chunks(changed, workers):
+            if chunks is None:
+                files[path] = {"sha256": current_hashes[path], "chunk_ids": file_ids.pop(path)}
+                continue
+            # Ids only count repeats within a page, so one page at a time gives the same ids
+            ids = chunk_ids(chunks)
+            file_ids[path].extend(ids)
+            pending.extend((chunk, chunk_id) for chunk, chunk_id in zip(chunks, ids) if chunk_id not in old_ids[path])
+            if len(pending) >= INGEST_BATCH_CHUNKS:
+                db = add_chunks(db, embedding_model, pending)
+                embedded += len(pending)
+                pending = []
+        if pending:
+            db = add_chunks(db, embedding_model, pending)
+            embedded += len(pending)
+    if embedded:
+        embed_stats = embedding_model.engine.stats()
+        print(f"Embedded {embed_stats['chunks']} chunks in {embed_stats['seconds']}s "
+              f"({embed_stats['chunks_per_second']} chunks/s, {embed_stats['workers']} workers, "
+              f"batch {embed_stats['batch_size']}, padding overhead {embed_stats['padding_overhead']:.0%})")
+
+    # Chunks that disappeared from changed files
+    stale_ids = set()
+    for path in changed:
+        stale_ids.update(old_ids[path] - set(files[path]["chunk_ids"]))
+    if db is not None and stale_ids:
+        db.delete(list(stale_ids))
+    removed += len(stale_ids)
+
+    if db is None:
+        print("No documents to index")
+        return manifest
+
+    ann_index, factory = ann_from_flat(db.index, index_type)
+    new_manifest = {
+        "version": (manifest["version"] if manifest else 0) + 1,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "index": {"type": index_type, "factory": factory, "vectors": db.index.ntotal},
+        "files": files,
+    }
+    write_index_atomically(db, new_manifest, index_path, ann_index)
+
+    print(f"Embedded {embedded} chunks, removed {removed}, "
+          f"index version {new_manifest['version']} written in {time.perf_counter() - start:.1f}s")
+    return new_manifest
 
-text_chunks=create_chunks(extracted_data=documents)
-#print("Length of Text Chunks: ", len(text_chunks))
 
-# Step 3: Create Vector Embeddings 
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally (re)build the FAISS index from PDFs")
+    parser.add_argument("--data", default=DATA_PATH, help="directory with the source PDFs")
+    parser.add_argument("--index", default=DB_FAISS_PATH, help="FAISS index directory")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="chunks per embedding batch")
+    parser.add_argument("--embed-workers", type=int, default=EMBED_WORKERS,
+                        help="embedding processes, each with its own model copy (1 = in this process)")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and rebuild everything")
+    parser.add_argument("--index-type", default=INDEX_TYPE,
+                        help="flat, ivf, ivf_sq8, ivf_pq, hnsw, hnsw_sq8, sq8 or a faiss index_factory string")
+    args = parser.parse_args()
 
-def get_embedding_model():
-    embedding_model=HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    return embedding_model
+    build_index(args.data, args.index, workers=args.workers, batch_size=args.batch_size, full=args.full,
+                index_type=args.index_type, embed_workers=args.embed_workers)
 
-embedding_model=get_embedding_model()
 
-# Step 4: Store embeddings in FAISS
-DB_FAISS_PATH="vectorstore/db_faiss"
-db=FAISS.from_documents(text_chunks, embedding_model)
-db.save_local(DB_FAISS_PATH)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# embeddings_for_bot.py
+# Embedding engine for index builds (database_for_bot.py):
+#  - chunks are sorted by length before batching, so each batch pads to a similar length
+#    (sentence-transformers only sorts inside one encode() call, i.e. one batch here);
+#  - large batches (EMBED_BATCH_SIZE) are fanned out to a process pool, each worker loads
+#    the model once and gets an equal share of the CPU threads;
+#  - results stream back in batch order (embed_stream) so they can go into the index while
+#    later batches are still running, or fill one preallocated, L2-normalized float32
+#    array in the original order (embed).
+# workers=1 embeds in this process with the same batching.
+
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "256"))
+# Each worker holds its own copy of the model (~100 MB for MiniLM)
+EMBED_WORKERS = int(os.environ.get("EMBED_WORKERS", str(max(1, min(4, (os.cpu_count() or 1) // 2)))))
+
+
+def load_sentence_transformer(model_name, threads):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(max(1, threads))
+    return SentenceTransformer(model_name, device="cpu")
+
+
+# ---- Worker process ----
+_worker_model = None
+
+
+def _init_worker(load_model, model_name, threads):
+    global _worker_model
+    _worker_model = load_model(model_name, threads)
+
+
+def _encode(model, texts):
+    # One batch per call: the texts are already length-sorted and batch-sized
+    return np.asarray(model.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False),
+                      dtype="float32")
+
+
+def _encode_in_worker(texts):
+    return _encode(_worker_model, texts)
+
+
+def length_batches(texts, batch_size, sort_by_length=True):
+    """Index arrays of the texts in each batch, longest texts first when sorting."""
+    order = np.argsort([-len(t) for t in texts], kind="stable") if sort_by_length else np.arange(len(texts))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def padding_overhead(texts, batches):
+    """Padded characters / real characters - 1: how much work goes to padding (chars as a proxy for tokens)."""
+    real = sum(len(t) for t in texts) or 1
+    padded = sum(max(len(texts[i]) for i in rows) * len(rows) for rows in batches if len(rows))
+    return padded / real - 1
+
+
+class EmbeddingEngine:
+    """Batched, optionally multi-process document embedding. Use as a context manager (or close())."""
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS,
+                 normalize=True, sort_by_length=True, load_model=load_sentence_transformer):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+        self.normalize = normalize
+        self.sort_by_length = sort_by_length
+        self.load_model = load_model
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // self.workers)
+        self._pool = None
+        self._model = None
+        self._lock = threading.Lock()
+        self.counters = {"chunks": 0, "batches": 0, "seconds": 0.0, "padding_overhead": 0.0}
+
+    def _start(self):
+        with self._lock:
+            if self.workers == 1:
+                if self._model is None:
+                    self._model = self.load_model(self.model_name, self.threads_per_worker)
+            elif self._pool is None:
+                # spawn: workers must not inherit a forked copy of torch's thread pools
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(self.load_model, self.model_name, self.threads_per_worker),
+                )
+
+    def _normalize(self, vectors):
+        if self.normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            np.divide(vectors, np.maximum(norms, 1e-12), out=vectors)
+        return vectors
+
+    def embed_stream(self, texts):
+        """Yield (rows, vectors) per batch in submission order; rows index into texts."""
+        if not texts:
+            return
+        self._start()
+        start = time.perf_counter()
+        batches = length_batches(texts, self.batch_size, self.sort_by_length)
+        if self._pool is None:
+            results = (_encode(self._model, [texts[i] for i in rows]) for rows in batches)
+        else:
+            results = self._pool.map(_encode_in_worker, [[texts[i] for i in rows] for rows in batches])
+        for rows, vectors in zip(batches, results):
+            yield rows, self._normalize(vectors)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.counters["chunks"] += len(texts)
+            self.counters["batches"] += len(batches)
+            self.counters["seconds"] += elapsed
+            self.counters["padding_overhead"] = round(padding_overhead(texts, batches), 3)
+
+    def embed(self, texts):
+        """(len(texts), dim) float32 array in the order of texts."""
+        out = None
+        for rows, vectors in self.embed_stream(texts):
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype="float32")
+            out[rows] = vectors
+        return out if out is not None else np.zeros((0, 0), dtype="float32")
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        with self._lock:
+            seconds = self.counters["seconds"]
+            return {
+                **self.counters,
+                "seconds": round(seconds, 3),
+                "chunks_per_second": round(self.counters["chunks"] / seconds, 1) if seconds else 0.0,
+                "workers": self.workers,
+                "batch_size": self.batch_size,
+            }
@@ -346,28 +346,44 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks, Form
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, BackgroundTasks, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import json
 import uuid
 import time
-from collections import defaultdict
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 
 # ---- Import your pipeline functions (assumed present) ----
-from brain_of_bot import encode_image, analyze_image_with_query_full_conversation, groq_chat_completion
-from voice_of_patient import transcribe_with_groq
-from voice_of_bot import text_to_speech_with_elevenlabs
-
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-# from groq import Groq  # Remove unused import
-
-# ---- Load FAISS vector DB (keep as-is) ----
-DB_FAISS_PATH = "vectorstore/db_faiss"
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-db = FAISS.load_local(DB_FAISS_PATH, embedding_model, allow_dangerous_deserialization=True)
-retriever = db.as_retriever(search_kwargs={"k": 3})
+from brain_of_bot import (preprocess_image, analyze_image_with_query_full_conversation_async, groq_chat_completion_async,
+                          groq_chat_completion_stream, build_multimodal_messages)
+from voice_of_patient import get_stt_backend, normalize_audio, EmptyRecordingError
+from language_of_patient import language_id
+from voice_of_bot import text_to_speech_with_fallback_async, text_to_speech_by_sentence_async
+from tts_cache_for_bot import tts_cache
+from clients_for_bot import close_async_clients, connection_stats
+from stream_of_bot import ReplyStream
+from startup_for_bot import KnowledgeBase, INDEX_RELOAD_INTERVAL
+from memory_of_bot import ConversationMemory, estimate_tokens
+from retrieval_for_bot import CachedRetriever
+from pipeline_for_bot import StageGraph
+from uploads_for_bot import save_upload_stream, MAX_AUDIO_UPLOAD_BYTES, MAX_IMAGE_UPLOAD_BYTES
+from resilience_for_bot import request_budget, resilience_stats, CircuitOpenError, DeadlineExceeded, BREAKER_RESET_SECONDS
+from metrics_for_bot import metrics
+from artifacts_for_bot import voice_artifacts, upload_artifacts, collect_artifacts_forever
+from serving_for_bot import voice_response, voice_clips
+
+# ---- FAISS vector DB ----
+# Loaded in the background at startup (see lifespan), /ready reports progress
+knowledge = KnowledgeBase()
+knowledge_task = None
+# LRU + near-duplicate cache in front of the FAISS search, invalidated on index reloads
+retriever = CachedRetriever(knowledge)
+# Groq Whisper or local faster-whisper, per STT_BACKEND
+stt_backend = get_stt_backend()
 
 # ---- System Prompt (single canonical content field) ----
 SYSTEM_PROMPT_TEMPLATE = """You have to act as a professional doctor and give your response as such, I know you are not but this is for learning purpose.
@@ -395,8 +411,55 @@ Keep your answer concise, direct, and helpful, without preambles and prioritise
 Now, respond in the same language as the patient's query, which is detected as: {detected_language}.
 """
 
+# ---- Concurrency settings ----
+# MAX_CONCURRENT_REQUESTS: consultations processed at once per worker, extra requests wait their turn
+# EXECUTOR_WORKERS: threads for blocking work (embedding, base64, file writes)
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("MAX_CONCURRENT_REQUESTS", "8"))
+EXECUTOR_WORKERS = int(os.environ.get("EXECUTOR_WORKERS", "4"))
+# TTS_SENTENCE_CACHE=1: synthesize replies sentence by sentence, several at a time, joined in order;
+# repeated sentences come from the cache and a failed sentence falls back to gTTS
+TTS_SENTENCE_CACHE = os.environ.get("TTS_SENTENCE_CACHE", "0") == "1"
+
+executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="healthmate")
+request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+@asynccontextmanager
+async def lifespan(app):
+    global knowledge_task
+    # asyncio.to_thread (used here and in the pipeline modules) runs on the default executor
+    asyncio.get_running_loop().set_default_executor(executor)
+    knowledge_task = asyncio.create_task(asyncio.to_thread(knowledge.load))
+    stt_task = asyncio.create_task(warm_up_stt())
+    reload_task = asyncio.create_task(watch_index()) if INDEX_RELOAD_INTERVAL > 0 else None
+    # Age/size-bounded outputs/voices and temp/, replies of active conversations kept
+    gc_task = asyncio.create_task(collect_artifacts_forever())
+    yield
+    gc_task.cancel()
+    if reload_task:
+        reload_task.cancel()
+    if not stt_task.done():
+        stt_task.cancel()
+    await close_async_clients()
+    executor.shutdown(wait=False)
+
+async def warm_up_stt():
+    # Local STT loads its model here instead of on the first consultation
+    try:
+        await asyncio.to_thread(stt_backend.warm_up)
+    except Exception as e:
+        print(f"STT warm-up failed ({stt_backend.name}): {e}")
+
+async def watch_index():
+    # Hot-swap the index when database_for_bot.py publishes a new version
+    while True:
+        await asyncio.sleep(INDEX_RELOAD_INTERVAL)
+        try:
+            await asyncio.to_thread(knowledge.reload_if_changed)
+        except Exception as e:
+            print(f"Index reload failed, keeping the current one: {e}")
+
 # ---- FastAPI app ----
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -405,14 +468,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    # Refuse from Content-Length before the multipart body is parsed and spooled
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and \
+            int(content_length) > MAX_AUDIO_UPLOAD_BYTES + MAX_IMAGE_UPLOAD_BYTES + 64 * 1024:
+        return JSONResponse(status_code=413, content={"error": "Upload too large"})
+    return await call_next(request)
+
+http_requests = metrics.counter("healthmate_http_requests_total", "HTTP requests", ["method", "route", "status"])
+http_seconds = metrics.histogram("healthmate_http_request_seconds", "HTTP time to response headers", ["method", "route"])
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route template ("/download-voice/{filename}"), not the raw path, to keep label values bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        http_requests.inc(method=request.method, route=route, status=status)
+        http_seconds.observe(time.perf_counter() - start, method=request.method, route=route)
+
 # Ensure directories exist
 os.makedirs("outputs/voices", exist_ok=True)
 os.makedirs("temp", exist_ok=True)
+# The TTS cache's LRU skips clips that active conversations link to
+tts_cache.retained = voice_artifacts.is_referenced
 
 # ---- Conversation Memory ----
-# Each conversation is a list of messages of shape:
-# {"role": "system"|"user"|"assistant", "content": "string", optional "assistant_audio": "<url>"}
-conversations = defaultdict(list)
+# System prompt stored once per conversation, RAG context added per turn only, prompt trimmed
+# to PROMPT_TOKEN_BUDGET with older turns rolled into a running summary, idle conversations evicted.
+SUMMARY_PROMPT = """You keep short notes for a doctor. Merge the previous summary and the new conversation turns
+into one brief paragraph: symptoms and how long they lasted, conditions discussed, advice and medicines suggested,
+and anything the patient asked to remember. Write it in the patient's language. Do not add anything new."""
+
+async def summarize_turns(previous_summary, turns):
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+    # Background compaction gets its own budget, not what is left of the request that scheduled it
+    with request_budget():
+        return await groq_chat_completion_async([
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Previous summary: {previous_summary or '(none)'}\n\nNew turns:\n{transcript}"},
+        ])
+
+memory = ConversationMemory(summarize=summarize_turns)
 
 # ---- Helpers ----
 def cleanup_file(path: str):
@@ -438,71 +542,136 @@ def messages_for_model(conversation_messages):
             out.append({"role": role, "content": content})
     return out
 
+async def wait_for_knowledge():
+    # Requests that arrive during warm start wait for the index instead of failing
+    if not knowledge.ready:
+        if knowledge_task is None:
+            await asyncio.to_thread(knowledge.load)
+        else:
+            await asyncio.shield(knowledge_task)
+
+def save_upload(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
 # ---- Core Processing ----
-def process_inputs(audio_filepath: str, image_filepath: str = None, conversation_id: str = "default"):
+async def prepare_turn(audio_filepath: str, image_filepath: str = None, conversation_id: str = "default"):
+    """
+    Steps shared by the blocking and streaming endpoints that do not touch the
+    conversation, run as a stage graph: audio normalization -> STT -> RAG retrieval, with
+    image preprocessing in parallel since it does not need the transcript.
+    Raises EmptyRecordingError before any network call if the recording has no speech.
+    Returns (stt_text, detected_language, rag_context, encoded_image_or_None, graph);
+    graph.timings has per-stage milliseconds and later steps add theirs to it.
+    """
+    graph = StageGraph()
+
+    # 0) Audio: 16 kHz mono, silence trimmed, small encoding (Whisper needs nothing more)
+    async def audio(results):
+        stt_path, info = await asyncio.to_thread(normalize_audio, audio_filepath)
+        print(f"[{conversation_id}] audio {info['original_bytes']} -> {info['sent_bytes']} bytes")
+        return stt_path
+
     # 1) STT
-    stt_text, detected_language = transcribe_with_groq(
-        stt_model="whisper-large-v3",
-        audio_filepath=audio_filepath,
-        GROQ_API_KEY=os.environ.get("GROQ_API_KEY")
-    )
+    async def stt(results):
+        stt_path = results["audio"]
+        try:
+            return await stt_backend.transcribe(stt_path, conversation_id)
+        finally:
+            if stt_path != audio_filepath:
+                await asyncio.to_thread(cleanup_file, stt_path)
+
+    # 2) RAG retrieval (query embedding + FAISS search are CPU work)
+    async def retrieve(results):
+        await wait_for_knowledge()
+        docs = await asyncio.to_thread(retriever.invoke, results["stt"][0])
+        return "\n\n".join([d.page_content for d in docs]) if docs else ""
+
+    # Image: EXIF orientation, resize, JPEG recompress, base64 (independent of the transcript)
+    async def image(results):
+        encoded, info = await asyncio.to_thread(preprocess_image, image_filepath)
+        print(f"[{conversation_id}] image {info['original_bytes']} -> {info['sent_bytes']} bytes")
+        return encoded
+
+    graph.add("audio", audio)
+    graph.add("stt", stt, after=["audio"])
+    graph.add("retrieve", retrieve, after=["stt"])
+    if image_filepath:
+        graph.add("image", image)
+    results = await graph.run()
 
-    # 2) RAG retrieval
-    docs = retriever.invoke(stt_text)
-    rag_context = "\n\n".join([d.page_content for d in docs]) if docs else ""
+    stt_text, detected_language = results["stt"]
+    return stt_text, detected_language, results["retrieve"], results.get("image"), graph
 
-    # 3) Ensure conversation exists and has system message
-    msgs = conversations[conversation_id]
-    if not msgs:
-        system_content = SYSTEM_PROMPT_TEMPLATE.format(detected_language=detected_language)
-        msgs.append({"role": "system", "content": system_content})
+async def build_turn_prompt(conversation_id: str, stt_text: str, detected_language: str, rag_context: str):
+    """
+    Budgeted history to send before the new user message. Call it while holding
+    memory.lock(conversation_id) and keep holding it until the turn is stored.
+    Returns (prompt_msgs, user_content).
+    """
+    # 3) Ensure conversation exists (system prompt is fixed at the first turn)
+    conversation = await memory.get(conversation_id, SYSTEM_PROMPT_TEMPLATE.format(detected_language=detected_language))
 
     # 4) Build user message content
     user_content = f"Patient said: {stt_text}"
 
-    # Append reference to system instead of patient turn
-    if rag_context and msgs and msgs[0]["role"] == "system":
-        msgs[0]["content"] += f"\n\n(Reference for you, not to be shown to patient): {rag_context}"
+    # Reference goes into this turn's system message only, it is not stored
+    prompt_msgs, trimmed = memory.build_prompt(conversation, user_content, rag_context)
+    if trimmed:
+        print(f"[{conversation_id}] {trimmed} older messages left out of the prompt (summarized)")
+    return prompt_msgs, user_content
+
+async def process_inputs(audio_filepath: str, image_filepath: str = None, conversation_id: str = "default"):
+    stt_text, detected_language, rag_context, encoded, graph = await prepare_turn(
+        audio_filepath, image_filepath, conversation_id
+    )
+    # Concurrent turns of one conversation are applied one after the other
+    async with memory.lock(conversation_id):
+        return await reply_to_turn(conversation_id, stt_text, detected_language, rag_context, encoded, graph)
+
+async def reply_to_turn(conversation_id, stt_text, detected_language, rag_context, encoded, graph):
+    with graph.timed("prompt"):
+        prompt_msgs, user_content = await build_turn_prompt(conversation_id, stt_text, detected_language, rag_context)
+    prompt_tokens = estimate_tokens(prompt_msgs + [{"content": user_content}])
+    print(f"[{conversation_id}] prompt tokens (estimate): {prompt_tokens}")
 
     # 5) Generate assistant reply
-    if image_filepath:
-        encoded = encode_image(image_filepath)
-        assistant_text = analyze_image_with_query_full_conversation(
-            user_text=user_content,
-            encoded_image=encoded,
-            conversation_messages=msgs
-        )
-        # For image flow, append user and assistant after getting response
-        msgs.append({"role": "user", "content": user_content})
-        msgs.append({"role": "assistant", "content": assistant_text})
-    else:
-        # Append user first
-        msgs.append({"role": "user", "content": user_content})
-        chat_messages = [{"role": m["role"], "content": m["content"]} for m in msgs]
-        assistant_text = groq_chat_completion(chat_messages)
-        # already appended user above
-        msgs.append({"role": "assistant", "content": assistant_text})
+    with graph.timed("llm"):
+        if encoded:
+            assistant_text = await analyze_image_with_query_full_conversation_async(
+                user_text=user_content,
+                encoded_image=encoded,
+                conversation_messages=prompt_msgs
+            )
+        else:
+            chat_messages = prompt_msgs + [{"role": "user", "content": user_content}]
+            assistant_text = await groq_chat_completion_async(chat_messages)
 
     # 6) TTS for assistant reply
     assistant_audio_file = None
     assistant_audio_url = None
     try:
-        voice_info = text_to_speech_with_elevenlabs(
-            input_text=assistant_text,
-            language_code=detected_language
-        )
+        # Both fall back to gTTS when ElevenLabs fails; if that fails too the reply is text-only
+        synthesize = text_to_speech_by_sentence_async if TTS_SENTENCE_CACHE else text_to_speech_with_fallback_async
+        with graph.timed("tts"):
+            voice_info = await synthesize(
+                input_text=assistant_text,
+                language_code=detected_language
+            )
+        # Content-addressed file in outputs/voices: identical replies share one file and URL
         assistant_audio_file = voice_info["file"]
-
-        # Make sure the file is moved into outputs/voices
-        final_path = os.path.join("outputs", "voices", os.path.basename(assistant_audio_file))
-        os.replace(assistant_audio_file, final_path)
+        final_path = assistant_audio_file
 
         assistant_audio_url = f"http://127.0.0.1:8000/download-voice/{os.path.basename(final_path)}"
-        msgs[-1]["assistant_audio"] = assistant_audio_url
     except Exception as e:
         print("TTS error:", e)
 
-    return stt_text, assistant_text, assistant_audio_file, detected_language, msgs
+    await memory.add_turn(conversation_id, user_content, assistant_text, assistant_audio_url)
+    # Renews the conversation's hold on its earlier replies too
+    voice_artifacts.retain(conversation_id, os.path.basename(assistant_audio_file) if assistant_audio_file else None)
+    memory.schedule_compaction(conversation_id)
+
+    return stt_text, assistant_text, assistant_audio_file, detected_language, await memory.messages(conversation_id), prompt_tokens, graph.timings
 
 # ---- Endpoints ----
 @app.post("/analyze")
@@ -516,21 +685,32 @@ async def analyze(
     if not conversation_id:
         conversation_id = str(uuid.uuid4())
 
-    # Save uploads temporarily
+    # Stream uploads to temp/ in chunks (size limits enforced while copying)
     audio_path = os.path.join("temp", f"temp_audio_{uuid.uuid4().hex}.mp3")
-    with open(audio_path, "wb") as f:
-        f.write(await audio.read())
+    await save_upload_stream(audio, audio_path, MAX_AUDIO_UPLOAD_BYTES)
 
     image_path = None
     if image:
         image_path = os.path.join("temp", f"temp_image_{uuid.uuid4().hex}.jpg")
-        with open(image_path, "wb") as f:
-            f.write(await image.read())
+        try:
+            await save_upload_stream(image, image_path, MAX_IMAGE_UPLOAD_BYTES)
+        except HTTPException:
+            cleanup_file(audio_path)
+            raise
 
     try:
-        stt_text, doctor_response, doctor_voice, detected_language, messages = process_inputs(
-            audio_path, image_path, conversation_id
-        )
+        async with request_slots:
+            with request_budget():
+                stt_text, doctor_response, doctor_voice, detected_language, messages, prompt_tokens, timings = await process_inputs(
+                    audio_path, image_path, conversation_id
+                )
+    except EmptyRecordingError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except CircuitOpenError as e:
+        # Groq has been failing: answer fast instead of queueing more doomed requests
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(BREAKER_RESET_SECONDS))})
+    except (DeadlineExceeded, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=504, detail=str(e) or "Request time budget exhausted")
     finally:
         if background_tasks:
             background_tasks.add_task(cleanup_file, audio_path)
@@ -543,20 +723,229 @@ async def analyze(
         "detected_language": detected_language,
         "conversation_id": conversation_id,  # return the conversation id (new or existing)
         "doctor_voice_url": f"http://127.0.0.1:8000/download-voice/{os.path.basename(doctor_voice)}" if doctor_voice else None,
-        "messages": messages
+        "messages": messages,
+        "prompt_tokens": prompt_tokens,  # estimate for this turn's request
+        "timings": timings  # milliseconds per pipeline stage
     }
 
 @app.get("/download-voice/{filename}")
-async def download_voice(filename: str):
-    file_path = os.path.join("outputs", "voices", filename)
-    if os.path.exists(file_path):
-        # ✅ Do NOT delete immediately, let frontend handle caching
-        return FileResponse(file_path, media_type="audio/mpeg", filename=filename)
+async def download_voice(request: Request, filename: str):
+    # Flat or sharded; files are removed by the artifact GC, not after download.
+    # ETag/304, immutable Cache-Control, Range, hot clips from memory (serving_for_bot)
+    file_path = voice_artifacts.path_for(filename)
+    if file_path:
+        return await voice_response(request.headers, file_path)
     return JSONResponse(status_code=404, content={"error": "File not found"})
 
 @app.post("/reset/{conversation_id}")
 async def reset_conversation(conversation_id: str):
     # Delete server-side memory for that conversation id
-    if conversation_id in conversations:
-        del conversations[conversation_id]
-    return {"status": f"Conversation {conversation_id} cleared"}
\ No newline at end of file
+    await memory.reset(conversation_id)
+    language_id.forget(conversation_id)
+    voice_artifacts.release(conversation_id)
+    return {"status": f"Conversation {conversation_id} cleared"}
+
+@app.get("/ready")
+async def ready():
+    # 200 once the embedding model and index are loaded, 503 while warming up or after a failure
+    report = knowledge.report()
+    return JSONResponse(status_code=200 if knowledge.ready else 503, content=report)
+
+@app.get("/retrieval-stats")
+async def retrieval_stats():
+    return retriever.stats()
+
+@app.get("/tts-cache-stats")
+async def tts_cache_stats():
+    return tts_cache.stats()
+
+@app.get("/language-stats")
+async def language_stats():
+    # Where detected languages came from (whisper/script/classifier/conversation) and agreement
+    return language_id.stats()
+
+@app.get("/memory-stats")
+async def memory_stats():
+    return await memory.stats()
+
+@app.get("/client-stats")
+async def client_stats():
+    # Requests vs newly opened connections per provider pool
+    return connection_stats()
+
+@app.get("/artifact-stats")
+async def artifact_stats():
+    # Files and bytes kept, stored, expired and evicted in outputs/voices and temp/
+    return {"voices": voice_artifacts.stats(), "uploads": upload_artifacts.stats(), "hot_clips": voice_clips.stats()}
+
+@app.get("/resilience-stats")
+async def resilience_stats_endpoint():
+    # Circuit state, failures, retries, trips and fast rejections per provider
+    return resilience_stats()
+
+# ---- Metrics ----
+# Span/stage histograms and token counters are recorded where the work happens; the
+# components' own counters are read at scrape time
+def numeric_stats(**components):
+    return {(component, key): value for component, stats in components.items()
+            for key, value in stats.items() if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+metrics.add_collector("healthmate_component_stat", "Counters and sizes reported by the caches and language ID",
+                      "gauge", lambda: numeric_stats(retrieval=retriever.stats(), tts_cache=tts_cache.stats(),
+                                                     language=language_id.stats(), voice_artifacts=voice_artifacts.stats(),
+                                                     upload_artifacts=upload_artifacts.stats(),
+                                                     hot_clips=voice_clips.stats()), ["component", "stat"])
+metrics.add_collector("healthmate_circuit_state", "Provider circuit breaker: 0 closed, 1 half-open, 2 open",
+                      "gauge", lambda: {(name, ): BREAKER_STATES[stats["state"]] for name, stats in resilience_stats().items()},
+                      ["provider"])
+metrics.add_collector("healthmate_provider_events_total", "Provider calls, failures, retries, trips and rejections",
+                      "counter", lambda: {(name, key): value for name, stats in resilience_stats().items()
+                                          for key, value in stats.items() if key not in ("state", "consecutive_failures")},
+                      ["provider", "event"])
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# ---- Streaming replies ----
+# stream_id -> ReplyStream, kept until the full reply audio has been written to outputs/voices
+reply_streams = {}
+# finish_reply_stream tasks, referenced until done (the loop only keeps weak references)
+reply_tasks = set()
+
+def sse_event(event: str, data: dict):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def finish_reply_stream(reply: ReplyStream, chat_messages, conversation_id, user_content, conversation_lock):
+    """
+    Run the stream to the end, then store the full reply audio and conversation turn.
+    Releases conversation_lock (taken before the prompt was built) when done.
+    """
+    try:
+        assistant_text = await reply.run(groq_chat_completion_stream(chat_messages))
+        if reply.error:
+            return None
+
+        voice_url = voice_name = None
+        audio_bytes = reply.audio_bytes()
+        if audio_bytes:
+            final_path = voice_artifacts.new_path(f"final_{reply.stream_id}.mp3")
+            await asyncio.to_thread(save_upload, final_path, audio_bytes)
+            voice_artifacts.register(final_path)
+            # The client fetches it right after "done"
+            voice_clips.put(final_path, audio_bytes)
+            voice_name = os.path.basename(final_path)
+            voice_url = f"http://127.0.0.1:8000/download-voice/{voice_name}"
+
+        await memory.add_turn(conversation_id, user_content, assistant_text, voice_url)
+        voice_artifacts.retain(conversation_id, voice_name)
+        memory.schedule_compaction(conversation_id)
+        return voice_url
+    finally:
+        reply_streams.pop(reply.stream_id, None)
+        await conversation_lock.release()
+
+@app.post("/analyze-stream")
+async def analyze_stream(
+    audio: UploadFile = File(...),
+    image: UploadFile = File(None),
+    conversation_id: str = Form(None),
+    background_tasks: BackgroundTasks = None
+):
+    """
+    Server-Sent Events version of /analyze. Events, in order:
+      start    {conversation_id, speech_to_text, detected_language, voice_stream_url, timings}
+      token    {text}            every LLM delta
+      sentence {index, text}     every complete sentence (its audio is being synthesized)
+      done     {doctor_response, doctor_voice_url}
+    Point an <audio> element at voice_stream_url right after "start": playback begins
+    as soon as the first sentence is synthesized.
+    """
+    if not conversation_id:
+        conversation_id = str(uuid.uuid4())
+
+    audio_path = os.path.join("temp", f"temp_audio_{uuid.uuid4().hex}.mp3")
+    await save_upload_stream(audio, audio_path, MAX_AUDIO_UPLOAD_BYTES)
+
+    image_path = None
+    if image:
+        image_path = os.path.join("temp", f"temp_image_{uuid.uuid4().hex}.jpg")
+        try:
+            await save_upload_stream(image, image_path, MAX_IMAGE_UPLOAD_BYTES)
+        except HTTPException:
+            cleanup_file(audio_path)
+            raise
+
+    if background_tasks:
+        background_tasks.add_task(cleanup_file, audio_path)
+        if image_path:
+            background_tasks.add_task(cleanup_file, image_path)
+
+    async def events():
+        async with request_slots:
+            # finish_task is created inside, so it inherits this request's deadline
+            with request_budget():
+                try:
+                    stt_text, detected_language, rag_context, encoded, graph = await prepare_turn(
+                        audio_path, image_path, conversation_id
+                    )
+                except Exception as e:
+                    yield sse_event("error", {"error": str(e)})
+                    return
+
+                # Held until finish_reply_stream has stored the turn
+                conversation_lock = memory.lock(conversation_id)
+                await conversation_lock.acquire()
+                handed_off = False
+                try:
+                    try:
+                        prompt_msgs, user_content = await build_turn_prompt(
+                            conversation_id, stt_text, detected_language, rag_context
+                        )
+                    except Exception as e:
+                        yield sse_event("error", {"error": str(e)})
+                        return
+
+                    if encoded:
+                        chat_messages = build_multimodal_messages(user_content, encoded, prompt_msgs)
+                    else:
+                        chat_messages = prompt_msgs + [{"role": "user", "content": user_content}]
+
+                    reply = ReplyStream(uuid.uuid4().hex, language_code=detected_language)
+                    reply_streams[reply.stream_id] = reply
+                    # Runs as its own task so the reply is still saved if the client disconnects;
+                    # from here on it owns conversation_lock
+                    finish_task = asyncio.create_task(finish_reply_stream(reply, chat_messages, conversation_id, user_content, conversation_lock))
+                    reply_tasks.add(finish_task)
+                    finish_task.add_done_callback(reply_tasks.discard)
+                    handed_off = True
+                finally:
+                    # Also on a disconnect (CancelledError / GeneratorExit) before the hand-off
+                    if not handed_off:
+                        await asyncio.shield(conversation_lock.release())
+
+                yield sse_event("start", {
+                    "conversation_id": conversation_id,
+                    "speech_to_text": stt_text,
+                    "detected_language": detected_language,
+                    "prompt_tokens": estimate_tokens(chat_messages),
+                    "timings": graph.timings,
+                    "voice_stream_url": f"http://127.0.0.1:8000/stream-voice/{reply.stream_id}",
+                })
+                while (event := await reply.events.get()) is not None:
+                    yield sse_event(event["event"], event["data"])
+
+                voice_url = await asyncio.shield(finish_task)
+                yield sse_event("done", {"doctor_response": reply.text, "doctor_voice_url": voice_url})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/stream-voice/{stream_id}")
+async def stream_voice(request: Request, stream_id: str):
+    # Live stream while the reply is generating, the saved file afterwards
+    reply = reply_streams.get(stream_id)
+    if reply:
+        return StreamingResponse(reply.audio(), media_type="audio/mpeg")
+    return await download_voice(request, f"final_{os.path.basename(stream_id)}.mp3")
@@ -0,0 +1,254 @@
+# hybrid_for_bot.py
+# Hybrid retrieval over the FAISS chunks. MiniLM vectors match meaning but miss exact drug
+# and condition names, so candidates come from two searches over the same chunk set:
+#  - FAISS (vector) and BM25 (an inverted index built by database_for_bot.py next to the
+#    FAISS index as bm25.npz), fused with reciprocal rank fusion;
+#  - optionally rescored by a small CPU cross-encoder (RERANKER_MODEL), all pairs in batches;
+#  - deduplicated: a chunk is dropped if it repeats a better one or shares its split
+#    overlap (chunk_overlap=75 puts the same sentence, often the matched term, in two
+#    neighbouring chunks), so the k chunks sent to the LLM are k different passages.
+
+import os
+import re
+import threading
+
+import numpy as np
+
+from metrics_for_bot import span
+
+BM25_FILE = "bm25.npz"
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Candidates taken from each search before fusion
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", "20"))
+RRF_K = 60
+# Cross-encoder for reranking the fused candidates, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2 (off by default)
+RERANKER_MODEL = os.environ.get("RERANKER_MODEL", "")
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "12"))
+RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", "32"))
+# Share of a chunk's word 5-grams found in a better chunk above which it counts as a repeat
+DEDUP_CONTAINMENT = 0.8
+# Shortest tail/head match that counts as the splitter's overlap
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 100
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i if in into is it its me my of on or so such that the
+their then there these they this to was we were what when which who will with you your do does did
+can could should would am been being he she him her them our us not no
+""".split())
+
+
+def tokenize(text):
+    return [t for t in re.findall(r"\w+", text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 with the per-posting weights precomputed at build time, stored as CSR arrays:
+    postings of term t are doc_index[offsets[t]:offsets[t + 1]] with weights[...] alongside.
+    A query is then a sum of array slices.
+    """
+
+    def __init__(self, doc_ids, vocabulary, offsets, doc_index, weights):
+        self.doc_ids = list(doc_ids)
+        self.terms = {term: i for i, term in enumerate(vocabulary)}
+        self.offsets = offsets
+        self.doc_index = doc_index
+        self.weights = weights
+
+    @classmethod
+    def build(cls, doc_ids, texts, k1=BM25_K1, b=BM25_B):
+        postings = {}
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[i] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((i, tf))
+
+        avg_length = float(lengths.mean()) if len(texts) and lengths.mean() > 0 else 1.0
+        vocabulary = sorted(postings)
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        doc_index, weights = [], []
+        for t, term in enumerate(vocabulary):
+            docs = np.array([i for i, _ in postings[term]], dtype=np.int32)
+            tf = np.array([tf for _, tf in postings[term]], dtype=np.float32)
+            idf = np.log(1 + (len(texts) - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = k1 * (1 - b + b * lengths[docs] / avg_length)
+            doc_index.append(docs)
+            weights.append((idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+            offsets[t + 1] = offsets[t] + len(docs)
+        return cls(
+            doc_ids, vocabulary, offsets,
+            np.concatenate(doc_index) if doc_index else np.zeros(0, dtype=np.int32),
+            np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32),
+        )
+
+    @classmethod
+    def from_docstore(cls, db):
+        """Build over every chunk of a langchain FAISS store (for indexes written before bm25.npz)."""
+        doc_ids = list(db.index_to_docstore_id.values())
+        docs = [db.docstore.search(doc_id) for doc_id in doc_ids]
+        pairs = [(doc_id, doc.page_content) for doc_id, doc in zip(doc_ids, docs) if not isinstance(doc, str)]
+        return cls.build([doc_id for doc_id, _ in pairs], [text for _, text in pairs])
+
+    def save(self, path):
+        vocabulary = sorted(self.terms, key=self.terms.get)
+        # Plain arrays (no pickle): strings as unicode arrays
+        np.savez(path, doc_ids=np.array(self.doc_ids, dtype=str), vocabulary=np.array(vocabulary, dtype=str),
+                 offsets=self.offsets, doc_index=self.doc_index, weights=self.weights)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["doc_ids"].tolist(), data["vocabulary"].tolist(), data["offsets"],
+                       data["doc_index"], data["weights"])
+
+    def search(self, query, k):
+        """[(doc_id, score)] best first, only chunks containing a query term."""
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.terms.get(term)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            # A document appears once per term, so fancy-index addition is exact
+            scores[self.doc_index[start:end]] += self.weights[start:end]
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.doc_ids[i], float(scores[i])) for i in candidates]
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+
+def load_or_build_bm25(path, db):
+    """bm25.npz written by the indexer, else built in memory from the docstore."""
+    file = os.path.join(path, BM25_FILE)
+    if os.path.exists(file):
+        return BM25Index.load(file)
+    print(f"[retrieval] no {BM25_FILE} in {path}, building the BM25 index from the docstore")
+    return BM25Index.from_docstore(db)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """rankings: lists of doc ids, best first. Returns doc ids by fused score."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+# ---- Reranking ----
+class CrossEncoderReranker:
+    """sentence-transformers CrossEncoder, loaded on first use; all pairs scored in batches."""
+
+    def __init__(self, model_name=RERANKER_MODEL, batch_size=RERANK_BATCH_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name, device="cpu")
+            return self._model
+
+    def score_many(self, requests):
+        """requests: [(query, [text, ...])]. One batched predict over every pair; [[score, ...]] back."""
+        pairs = [(query, text) for query, texts in requests for text in texts]
+        if not pairs:
+            return [[] for _ in requests]
+        scores = self._get_model().predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        out, i = [], 0
+        for _, texts in requests:
+            out.append([float(s) for s in scores[i:i + len(texts)]])
+            i += len(texts)
+        return out
+
+    def score(self, query, texts):
+        return self.score_many([(query, texts)])[0]
+
+
+# ---- Deduplication ----
+def _shingles(text, n=5):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+
+def _share_overlap(a, b):
+    """True if one chunk starts with the other's tail (the text splitter's chunk_overlap)."""
+    a, b = a.strip(), b.strip()
+    for first, second in ((a, b), (b, a)):
+        for size in range(min(MAX_OVERLAP_CHARS, len(first), len(second)), MIN_OVERLAP_CHARS - 1, -1):
+            if second.startswith(first[-size:]):
+                return True
+    return False
+
+
+def deduplicate(docs, k):
+    """First k of docs (best first) that neither repeat nor overlap an earlier pick. Returns indices."""
+    kept, kept_shingles = [], []
+    for i, doc in enumerate(docs):
+        shingles = _shingles(doc.page_content)
+        if any(len(shingles & other) >= DEDUP_CONTAINMENT * len(shingles) for other in kept_shingles):
+            continue
+        if any(_share_overlap(doc.page_content, docs[j].page_content) for j in kept):
+            continue
+        kept.append(i)
+        kept_shingles.append(shingles)
+        if len(kept) == k:
+            break
+    return kept
+
+
+class HybridSearcher:
+    """FAISS + BM25 candidates, RRF, optional cross-encoder, dedup; returns docstore ids."""
+
+    def __init__(self, candidates=HYBRID_CANDIDATES, reranker_model=RERANKER_MODEL, rerank_candidates=RERANK_CANDIDATES):
+        self.candidates = candidates
+        self.reranker = CrossEncoderReranker(reranker_model) if reranker_model else None
+        self.rerank_candidates = rerank_candidates
+        self._lock = threading.Lock()
+        self.counters = {"searches": 0, "lexical_only": 0, "dropped_duplicates": 0, "reranked": 0}
+
+    def search(self, db, bm25, vector, query, k):
+        n = max(self.candidates, k)
+        _, indices = db.index.search(vector.reshape(1, -1), n)
+        vector_ids = [db.index_to_docstore_id[i] for i in indices[0] if i != -1]
+        with span("retrieval_bm25"):
+            lexical_ids = [doc_id for doc_id, _ in bm25.search(query, n)]
+        fused = reciprocal_rank_fusion([vector_ids, lexical_ids])
+
+        pool = fused[:max(self.rerank_candidates, k * 3)]
+        docs = [db.docstore.search(doc_id) for doc_id in pool]
+        pool = [doc_id for doc_id, doc in zip(pool, docs) if not isinstance(doc, str)]
+        docs = [doc for doc in docs if not isinstance(doc, str)]
+
+        if self.reranker and docs:
+            with span("retrieval_rerank"):
+                scores = self.reranker.score(query, [doc.page_content for doc in docs])
+            order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+            pool, docs = [pool[i] for i in order], [docs[i] for i in order]
+
+        kept = deduplicate(docs, k)
+        with self._lock:
+            self.counters["searches"] += 1
+            self.counters["lexical_only"] += sum(1 for i in kept if pool[i] not in vector_ids)
+            # Candidates passed over on the way to the last pick
+            self.counters["dropped_duplicates"] += kept[-1] + 1 - len(kept) if kept else 0
+            self.counters["reranked"] += bool(self.reranker)
+        return [pool[i] for i in kept]
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "reranker": self.reranker.model_name if self.reranker else None}
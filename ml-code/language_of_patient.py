@@ -0,0 +1,197 @@
+# language_of_patient.py
+# Language of what the patient said, which picks the reply language (system prompt) and
+# the TTS language. In order of preference:
+#  1. the language Whisper already detected from the audio (verbose_json / faster-whisper),
+#  2. the Unicode script, for scripts used by a single language (Devanagari, Tamil, ...),
+#  3. a text classifier loaded once: fastText lid.176 if LANGUAGE_ID_MODEL points at it,
+#     otherwise langdetect with a fixed seed so the same text always gives the same answer.
+# Short utterances ("yes", "ok thanks") are unreliable for 2. and 3., so they reuse the
+# conversation's previous language.
+
+import os
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# Path to a fastText language-ID model (lid.176.ftz / lid.176.bin); optional
+LANGUAGE_ID_MODEL = os.environ.get("LANGUAGE_ID_MODEL", "")
+# Below this many letters a text-only guess defers to the conversation's language
+SHORT_TEXT_CHARS = 25
+DEFAULT_LANGUAGE = "en"
+MAX_CACHED_CONVERSATIONS = 10000
+# Every Nth Whisper-detected utterance is also run through the text classifier to track agreement
+AGREEMENT_SAMPLE_EVERY = 10
+
+# Whisper reports language names (verbose_json) or codes (faster-whisper)
+WHISPER_LANGUAGES = {
+    "english": "en", "chinese": "zh", "german": "de", "spanish": "es", "russian": "ru", "korean": "ko",
+    "french": "fr", "japanese": "ja", "portuguese": "pt", "turkish": "tr", "polish": "pl", "catalan": "ca",
+    "dutch": "nl", "arabic": "ar", "swedish": "sv", "italian": "it", "indonesian": "id", "hindi": "hi",
+    "finnish": "fi", "vietnamese": "vi", "hebrew": "he", "ukrainian": "uk", "greek": "el", "malay": "ms",
+    "czech": "cs", "romanian": "ro", "danish": "da", "hungarian": "hu", "tamil": "ta", "norwegian": "no",
+    "thai": "th", "urdu": "ur", "croatian": "hr", "bulgarian": "bg", "lithuanian": "lt", "latin": "la",
+    "maori": "mi", "malayalam": "ml", "welsh": "cy", "slovak": "sk", "telugu": "te", "persian": "fa",
+    "latvian": "lv", "bengali": "bn", "serbian": "sr", "azerbaijani": "az", "slovenian": "sl",
+    "kannada": "kn", "estonian": "et", "macedonian": "mk", "breton": "br", "basque": "eu",
+    "icelandic": "is", "armenian": "hy", "nepali": "ne", "mongolian": "mn", "bosnian": "bs",
+    "kazakh": "kk", "albanian": "sq", "swahili": "sw", "galician": "gl", "marathi": "mr", "punjabi": "pa",
+    "sinhala": "si", "khmer": "km", "shona": "sn", "yoruba": "yo", "somali": "so", "afrikaans": "af",
+    "occitan": "oc", "georgian": "ka", "belarusian": "be", "tajik": "tg", "sindhi": "sd", "gujarati": "gu",
+    "amharic": "am", "yiddish": "yi", "lao": "lo", "uzbek": "uz", "faroese": "fo", "haitian creole": "ht",
+    "pashto": "ps", "turkmen": "tk", "nynorsk": "nn", "maltese": "mt", "sanskrit": "sa",
+    "luxembourgish": "lb", "myanmar": "my", "tibetan": "bo", "tagalog": "tl", "malagasy": "mg",
+    "assamese": "as", "tatar": "tt", "hawaiian": "haw", "lingala": "ln", "hausa": "ha", "bashkir": "ba",
+    "javanese": "jw", "sundanese": "su", "cantonese": "yue",
+}
+
+# Scripts written by (practically) one language; first word of the Unicode character name
+SCRIPT_LANGUAGES = {
+    "DEVANAGARI": "hi", "BENGALI": "bn", "GURMUKHI": "pa", "GUJARATI": "gu", "ORIYA": "or", "TAMIL": "ta",
+    "TELUGU": "te", "KANNADA": "kn", "MALAYALAM": "ml", "SINHALA": "si", "THAI": "th", "HANGUL": "ko",
+    "HIRAGANA": "ja", "KATAKANA": "ja", "GREEK": "el", "HEBREW": "he", "GEORGIAN": "ka", "ARMENIAN": "hy",
+}
+
+
+def whisper_language_code(language):
+    """ISO 639-1 code for Whisper's "english"/"en" style output, None if unknown."""
+    if not language:
+        return None
+    language = language.strip().lower()
+    if language in WHISPER_LANGUAGES.values():
+        return language
+    return WHISPER_LANGUAGES.get(language)
+
+
+def script_language(text):
+    """Language implied by the dominant script when that script is single-language, else None."""
+    counts = {}
+    letters = 0
+    for ch in text:
+        if not ch.isalpha():
+            continue
+        letters += 1
+        script = unicodedata.name(ch, "").split(" ")[0]
+        if script in SCRIPT_LANGUAGES:
+            counts[script] = counts.get(script, 0) + 1
+    if not counts:
+        return None
+    script, count = max(counts.items(), key=lambda item: item[1])
+    # Kana beats CJK ideographs for Japanese; ideographs alone are left to the classifier
+    return SCRIPT_LANGUAGES[script] if count * 2 >= letters or SCRIPT_LANGUAGES[script] == "ja" else None
+
+
+class TextLanguageClassifier:
+    """fastText if a model is configured, else seeded langdetect. Loaded once, thread-safe."""
+
+    def __init__(self, model_path=LANGUAGE_ID_MODEL):
+        self.model_path = model_path
+        self.backend = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self.backend is not None:
+                return
+            if self.model_path:
+                try:
+                    import fasttext
+                    self._model = fasttext.load_model(self.model_path)
+                    self.backend = "fasttext"
+                    return
+                except Exception as e:
+                    print(f"[language] fastText model {self.model_path} unavailable ({e}), using langdetect")
+            from langdetect import DetectorFactory, detect
+            DetectorFactory.seed = 0
+            self._model = detect
+            self.backend = "langdetect"
+
+    def predict(self, text):
+        self._load()
+        text = " ".join(text.split())
+        if not text:
+            return None
+        try:
+            if self.backend == "fasttext":
+                labels, _ = self._model.predict(text)
+                return labels[0].replace("__label__", "")
+            # langdetect returns "zh-cn" / "zh-tw"
+            return self._model(text).split("-")[0]
+        except Exception:
+            return None
+
+
+class LanguageIdentifier:
+    def __init__(self, classifier=None, max_conversations=MAX_CACHED_CONVERSATIONS):
+        self.classifier = classifier or TextLanguageClassifier()
+        self.max_conversations = max_conversations
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"whisper": 0, "script": 0, "classifier": 0, "conversation": 0, "default": 0,
+                         "agreement_checks": 0, "agreements": 0}
+        self.seconds = 0.0
+
+    def _remember(self, conversation_id, language):
+        if conversation_id is None:
+            return
+        with self._lock:
+            self._conversations[conversation_id] = language
+            self._conversations.move_to_end(conversation_id)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+
+    def _conversation_language(self, conversation_id):
+        with self._lock:
+            return self._conversations.get(conversation_id)
+
+    def forget(self, conversation_id):
+        with self._lock:
+            self._conversations.pop(conversation_id, None)
+
+    def _decide(self, text, whisper_language, conversation_id):
+        """(language, source)"""
+        code = whisper_language_code(whisper_language)
+        if code:
+            return code, "whisper"
+        code = script_language(text)
+        if code:
+            return code, "script"
+        previous = self._conversation_language(conversation_id)
+        if previous and sum(ch.isalpha() for ch in text) < SHORT_TEXT_CHARS:
+            return previous, "conversation"
+        code = self.classifier.predict(text)
+        if code:
+            return code, "classifier"
+        return previous or DEFAULT_LANGUAGE, "conversation" if previous else "default"
+
+    def detect(self, text, whisper_language=None, conversation_id=None):
+        start = time.perf_counter()
+        language, source = self._decide(text, whisper_language, conversation_id)
+        with self._lock:
+            self.counters[source] += 1
+            check = source == "whisper" and self.counters["whisper"] % AGREEMENT_SAMPLE_EVERY == 0
+        if check and sum(ch.isalpha() for ch in text) >= SHORT_TEXT_CHARS:
+            guess = script_language(text) or self.classifier.predict(text)
+            with self._lock:
+                self.counters["agreement_checks"] += 1
+                self.counters["agreements"] += guess == language
+        self._remember(conversation_id, language)
+        with self._lock:
+            self.seconds += time.perf_counter() - start
+        return language
+
+    def stats(self):
+        with self._lock:
+            calls = sum(self.counters[k] for k in ("whisper", "script", "classifier", "conversation", "default"))
+            return {
+                **self.counters,
+                "agreement_rate": round(self.counters["agreements"] / self.counters["agreement_checks"], 3)
+                if self.counters["agreement_checks"] else None,
+                "avg_ms": round(self.seconds / calls * 1000, 3) if calls else 0.0,
+                "classifier_backend": self.classifier.backend,
+                "conversations": len(self._conversations),
+            }
+
+
+language_id = LanguageIdentifier()
@@ -0,0 +1,256 @@
+# load_test.py
+# End-to-end benchmark of /analyze while Groq and ElevenLabs are replaced by local stubs
+# (mock_providers.py, with configurable latency, jitter and error rate). Sends --requests
+# multipart requests, --concurrency at a time, cycling through the sample recordings in
+# temp/, and reports latency percentiles, throughput, errors, per-stage times from the
+# responses, provider calls and the app's peak memory.
+#
+# Save a run with --output and compare later runs against it with --baseline, so every
+# performance change can be measured against the same numbers.
+#
+# to run: python load_test.py --requests 100 --concurrency 8 --latency 0.5
+#         python load_test.py --output baseline.json
+#         python load_test.py --baseline baseline.json [--error-rate 0.05]
+#         python load_test.py --url http://127.0.0.1:8000   (an app that is already running)
+
+import os
+import sys
+import json
+import time
+import glob
+import asyncio
+import argparse
+import threading
+import statistics
+from contextlib import nullcontext
+
+from mock_providers import start_mock_server
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0..100) of a non-empty list."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class RSSSampler:
+    """Peak resident memory of this process (the in-process app), sampled on a thread."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.start_bytes = self.peak_bytes = self.current()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            pass
+        try:
+            import resource
+            # Lifetime peak; kilobytes on Linux, bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+        except ImportError:
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = self.current()
+            if rss is not None:
+                self.peak_bytes = max(self.peak_bytes or 0, rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def read_sample(path):
+    """(file name, bytes) of an upload, read once before the app starts."""
+    with open(path, "rb") as f:
+        return os.path.basename(path), f.read()
+
+
+async def post_analyze(client, url, audio, image=None):
+    """(seconds, status, response json or None); audio and image are (file name, bytes)."""
+    files = {"audio": (*audio, "audio/mpeg")}
+    if image:
+        files["image"] = (*image, "image/jpeg")
+    start = time.perf_counter()
+    try:
+        resp = await client.post(url, files=files)
+        body = resp.json() if resp.status_code == 200 else None
+        return time.perf_counter() - start, resp.status_code, body
+    except Exception as e:
+        return time.perf_counter() - start, type(e).__name__, None
+
+
+async def run_load(url, audio_samples, image, requests, concurrency, warmup, on_measure_start=None):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        for i in range(warmup):
+            await post_analyze(client, url, audio_samples[i % len(audio_samples)], image)
+        if on_measure_start:
+            on_measure_start()
+
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            async with slots:
+                return await post_analyze(client, url, audio_samples[i % len(audio_samples)], image)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(requests)))
+        return results, time.perf_counter() - start
+
+
+def start_app(port):
+    import uvicorn
+
+    config = uvicorn.Config("gradio_app:app", host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def summarize(results, wall_seconds, rss, provider_calls, settings):
+    ok = [(seconds, body) for seconds, status, body in results if status == 200]
+    errors = {}
+    for _, status, _ in results:
+        if status != 200:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+    latencies = [seconds for seconds, _ in ok]
+    stages = {}
+    for _, body in ok:
+        for stage, ms in (body.get("timings") or {}).items():
+            stages.setdefault(stage, []).append(ms)
+
+    summary = {
+        "settings": settings,
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "requests_per_second": round(len(ok) / wall_seconds, 2) if wall_seconds else 0.0,
+        "stage_p50_ms": {stage: round(statistics.median(ms), 1) for stage, ms in sorted(stages.items())},
+        "provider_calls": provider_calls,
+    }
+    if latencies:
+        summary["latency_ms"] = {
+            "mean": round(statistics.mean(latencies) * 1000, 1),
+            **{f"p{q}": round(percentile(latencies, q) * 1000, 1) for q in (50, 95, 99)},
+            "max": round(max(latencies) * 1000, 1),
+        }
+    if rss and rss.peak_bytes:
+        summary["rss_mb"] = {"start": round(rss.start_bytes / 2 ** 20, 1), "peak": round(rss.peak_bytes / 2 ** 20, 1)}
+    return summary
+
+
+def print_summary(summary, baseline=None):
+    def delta(value, old):
+        if old in (None, 0) or value is None:
+            return ""
+        return f"  ({(value - old) / old * 100:+.1f}% vs baseline {old})"
+
+    base_latency = (baseline or {}).get("latency_ms", {})
+    settings = summary["settings"]
+    print(f"{summary['requests']} requests, concurrency {settings['concurrency']}, provider latency "
+          f"{settings['latency']}s +-{settings['jitter'] * 100:.0f}%, error rate {settings['error_rate']}")
+    print(f"ok {summary['ok']}   errors {summary['errors'] or 0}")
+    for key, value in summary.get("latency_ms", {}).items():
+        print(f"latency {key:<5} {value:9.1f} ms{delta(value, base_latency.get(key))}")
+    print(f"throughput    {summary['requests_per_second']:9.2f} req/s"
+          f"{delta(summary['requests_per_second'], (baseline or {}).get('requests_per_second'))}")
+    if "rss_mb" in summary:
+        print(f"app RSS       {summary['rss_mb']['start']:.1f} MB at start, {summary['rss_mb']['peak']:.1f} MB peak"
+              f"{delta(summary['rss_mb']['peak'], (baseline or {}).get('rss_mb', {}).get('peak'))}")
+    if summary["stage_p50_ms"]:
+        print("stage p50 ms  " + "  ".join(f"{stage} {ms}" for stage, ms in summary["stage_p50_ms"].items()))
+    if summary["provider_calls"]:
+        print("provider calls " + "  ".join(f"{name} {c['calls']} ({c['errors']} failed)"
+                                            for name, c in sorted(summary["provider_calls"].items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /analyze benchmark against local provider stubs")
+    parser.add_argument("--requests", type=int, default=50, help="measured requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=2, help="requests sent (one at a time) before measuring")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub latency per provider call (s)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="stub latency varies by +- this fraction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of provider calls failing with 503")
+    parser.add_argument("--tts-ms-per-char", type=float, default=0.0, help="extra stub TTS time per character")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", default=None, help="benchmark an already running app (no stubs, no RSS)")
+    parser.add_argument("--audio", nargs="+", default=None, help="sample recordings (default: temp/*.mp3)")
+    parser.add_argument("--image", default=None, help="also upload this image with every request")
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="JSON from an earlier --output run to compare with")
+    args = parser.parse_args()
+
+    audio_paths = args.audio or sorted(glob.glob(os.path.join("temp", "*.mp3")))
+    if not audio_paths:
+        parser.error("no sample recordings: pass --audio or put .mp3 files in temp/")
+    # Read up front: the inputs cannot change (or disappear) while the app under test runs
+    audio_samples = [read_sample(path) for path in audio_paths]
+    image = read_sample(args.image) if args.image else None
+
+    settings = {"concurrency": args.concurrency, "latency": args.latency, "jitter": args.jitter,
+                "error_rate": args.error_rate, "tts_ms_per_char": args.tts_ms_per_char,
+                "image": bool(args.image), "url": args.url}
+    mock_server = app_server = None
+    if args.url:
+        url = args.url.rstrip("/") + "/analyze"
+    else:
+        mock_server, base_url = start_mock_server(latency=args.latency, tts_seconds_per_char=args.tts_ms_per_char / 1000,
+                                                  error_rate=args.error_rate, jitter=args.jitter)
+        # Must be set before gradio_app (and the provider modules) are imported
+        os.environ["GROQ_BASE_URL"] = base_url
+        os.environ["ELEVENLABS_BASE_URL"] = base_url
+        os.environ.setdefault("GROQ_API_KEY", "mock")
+        os.environ.setdefault("ELEVENLABS_API_KEY", "mock")
+        app_server = start_app(args.port)
+        url = f"http://127.0.0.1:{args.port}/analyze"
+
+    # Memory is only meaningful when the app runs in this process
+    rss = RSSSampler() if app_server else None
+    try:
+        with rss or nullcontext():
+            results, wall_seconds = asyncio.run(run_load(
+                url, audio_samples, image, args.requests, args.concurrency, args.warmup,
+                # Provider calls are counted for the measured requests only
+                on_measure_start=mock_server.stats.clear if mock_server else None,
+            ))
+    finally:
+        if app_server:
+            app_server.should_exit = True
+        if mock_server:
+            mock_server.shutdown()
+
+    summary = summarize(results, wall_seconds, rss, mock_server.stats if mock_server else {}, settings)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_summary(summary, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
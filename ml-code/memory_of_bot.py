@@ -0,0 +1,199 @@
+# memory_of_bot.py
+# Bounded conversation memory.
+#  - The system prompt is stored once; RAG context is attached to the current turn's
+#    request only, never accumulated into the stored conversation.
+#  - Each request is trimmed to a token budget (oldest turns first). Trimmed turns are
+#    later rolled into a running summary, off the request path, so the prompt stays small.
+#    Part of the budget is a fixed reserve for the turn's reference and user message, so
+#    the summarizer (which has neither) trims exactly the turns the request would.
+#  - Idle conversations are evicted by TTL and by an LRU cap.
+# Conversations are kept in a ConversationStore (store_for_bot), so several workers can share them.
+
+import os
+import time
+import asyncio
+
+from store_for_bot import create_store
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "3000"))
+# Held back from the history for the current turn: RETRIEVER_K ~700-char chunks of
+# reference (~550 tokens with the header) plus the patient's message
+TURN_RESERVE_TOKENS = int(os.environ.get("PROMPT_TURN_RESERVE_TOKENS", "800"))
+MAX_CONVERSATIONS = int(os.environ.get("MAX_CONVERSATIONS", "1000"))
+CONVERSATION_TTL = float(os.environ.get("CONVERSATION_TTL", str(2 * 60 * 60)))
+# How often idle conversations are swept out of the store
+EVICTION_INTERVAL = 60
+
+REFERENCE_HEADER = "(Reference for you, not to be shown to patient): "
+SUMMARY_HEADER = "Summary of the earlier conversation with this patient: "
+
+
+def estimate_tokens(messages):
+    """
+    Rough token count for chat messages (about 4 characters per token plus a few tokens
+    of per-message overhead). Good enough for budgeting; Groq's usage is authoritative.
+    """
+    total = 0
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, list):
+            text = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        else:
+            text = content or ""
+        total += len(text) // 4 + 4
+    return total
+
+
+class ConversationMemory:
+    """
+    Conversations keyed by id. Each one is a plain dict:
+      {"system": str, "summary": str, "turns": [{"role", "content", optional "assistant_audio"}],
+       "summarized_upto": int, "updated_at": float}
+    turns[:summarized_upto] are covered by summary and no longer sent to the model.
+
+    Hold lock(conversation_id) from build_prompt to add_turn so concurrent turns of one
+    conversation are applied in order, even across workers with a shared store.
+    """
+
+    def __init__(self, store=None, token_budget=PROMPT_TOKEN_BUDGET, max_conversations=MAX_CONVERSATIONS,
+                 ttl=CONVERSATION_TTL, summarize=None, turn_reserve=TURN_RESERVE_TOKENS):
+        self.store = store or create_store(ttl=ttl, max_conversations=max_conversations)
+        self.token_budget = token_budget
+        self.turn_reserve = turn_reserve
+        self.ttl = ttl
+        # async fn(previous_summary, turns) -> new summary
+        self.summarize = summarize
+        self._compacting = set()
+        # The loop only keeps weak references to tasks: hold scheduled compactions until done
+        self._compaction_tasks = set()
+        self._last_eviction = 0.0
+        self.counters = {"evicted": 0, "summaries": 0, "summary_failures": 0}
+
+    # ---- storage ----
+    async def _evict(self):
+        if time.time() - self._last_eviction < EVICTION_INTERVAL:
+            return
+        self._last_eviction = time.time()
+        self.counters["evicted"] += await self.store.evict_idle(self.ttl)
+
+    def lock(self, conversation_id):
+        return self.store.lock(conversation_id)
+
+    async def get(self, conversation_id, system_prompt):
+        """Conversation for conversation_id, created with system_prompt if new."""
+        await self._evict()
+        conversation = await self.store.load(conversation_id)
+        if conversation is None:
+            conversation = {"system": system_prompt, "summary": "", "turns": [],
+                            "summarized_upto": 0, "updated_at": time.time()}
+            await self.store.save(conversation_id, conversation)
+        return conversation
+
+    async def reset(self, conversation_id):
+        return await self.store.delete(conversation_id)
+
+    async def add_turn(self, conversation_id, user_content, assistant_text, assistant_audio=None):
+        conversation = await self.store.load(conversation_id)
+        if conversation is None:
+            return
+        conversation["turns"].append({"role": "user", "content": user_content})
+        assistant = {"role": "assistant", "content": assistant_text}
+        if assistant_audio:
+            assistant["assistant_audio"] = assistant_audio
+        conversation["turns"].append(assistant)
+        conversation["updated_at"] = time.time()
+        await self.store.save(conversation_id, conversation)
+
+    async def messages(self, conversation_id):
+        """Full stored history in the /analyze "messages" shape (system first)."""
+        conversation = await self.store.load(conversation_id)
+        if conversation is None:
+            return []
+        return [{"role": "system", "content": conversation["system"]}] + list(conversation["turns"])
+
+    # ---- prompt building ----
+    def _system_message(self, conversation, rag_context):
+        content = conversation["system"]
+        if conversation["summary"]:
+            content += f"\n\n{SUMMARY_HEADER}{conversation['summary']}"
+        if rag_context:
+            content += f"\n\n{REFERENCE_HEADER}{rag_context}"
+        return {"role": "system", "content": content}
+
+    def build_prompt(self, conversation, user_content, rag_context=""):
+        """
+        Messages to send for this turn, excluding the new user message itself:
+        system (+ summary + this turn's reference) followed by as many recent turns as
+        fit in the budget. Returns (messages, trimmed_turn_count).
+        The history gets the budget minus the stored system prompt and summary and minus
+        turn_reserve, never minus this turn's actual reference or message: compact() has
+        neither and must trim the same turns. A larger reference overshoots the budget
+        instead of dropping turns that would never be summarized.
+        """
+        system = self._system_message(conversation, rag_context)
+        budget = self.token_budget - estimate_tokens([self._system_message(conversation, "")]) - self.turn_reserve
+
+        recent = conversation["turns"][conversation["summarized_upto"]:]
+        kept = []
+        # Walk back over user/assistant pairs so a turn is never split
+        for i in range(len(recent) - 2, -1, -2):
+            pair = [{"role": m["role"], "content": m["content"]} for m in recent[i:i + 2]]
+            cost = estimate_tokens(pair)
+            if cost > budget:
+                break
+            budget -= cost
+            kept = pair + kept
+        trimmed = len(recent) - len(kept)
+        return [system] + kept, trimmed
+
+    # ---- summarization ----
+    async def compact(self, conversation_id):
+        """
+        Roll the turns that no longer fit the budget into the running summary.
+        Run it after the reply is sent; on failure the turns are just left out of the prompt.
+        The summary is computed outside the conversation lock and applied only if no other
+        compaction got there first.
+        """
+        if self.summarize is None or conversation_id in self._compacting:
+            return
+        self._compacting.add(conversation_id)
+        try:
+            conversation = await self.store.load(conversation_id)
+            if conversation is None:
+                return
+            # Same reserve for the reference and message as the request's prompt
+            _, trimmed = self.build_prompt(conversation, "")
+            if not trimmed:
+                return
+            start = conversation["summarized_upto"]
+            upto = start + trimmed
+            summary = await self.summarize(conversation["summary"], conversation["turns"][start:upto])
+
+            async with self.lock(conversation_id):
+                latest = await self.store.load(conversation_id)
+                if latest is None or latest["summarized_upto"] != start:
+                    return
+                latest["summary"] = summary.strip()
+                latest["summarized_upto"] = upto
+                await self.store.save(conversation_id, latest)
+            self.counters["summaries"] += 1
+        except Exception as e:
+            self.counters["summary_failures"] += 1
+            print(f"Conversation summary failed for {conversation_id}: {e}")
+        finally:
+            self._compacting.discard(conversation_id)
+
+    def schedule_compaction(self, conversation_id):
+        if self.summarize is not None:
+            task = asyncio.get_running_loop().create_task(self.compact(conversation_id))
+            self._compaction_tasks.add(task)
+            task.add_done_callback(self._compaction_tasks.discard)
+
+    async def stats(self):
+        return {
+            **self.counters,
+            "store": type(self.store).__name__,
+            "conversations": await self.store.count(),
+            "token_budget": self.token_budget,
+            "turn_reserve": self.turn_reserve,
+        }
@@ -0,0 +1,130 @@
+# mock_providers.py
+# Local stand-ins for the Groq and ElevenLabs HTTP APIs, used by the load test and benchmarks.
+# Point the app at them with GROQ_BASE_URL / ELEVENLABS_BASE_URL. Latency can be jittered
+# and a fraction of calls can fail with 503, to exercise retries and circuit breakers.
+#
+# to run standalone: python mock_providers.py --port 9100 --latency 0.5 [--error-rate 0.05]
+
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+MOCK_TRANSCRIPT = "I have had a fever and a headache since yesterday."
+MOCK_REPLY = (
+    "Based on the symptoms you describe, this could be a common viral infection or the flu, "
+    "but this is not a confirmed diagnosis. Rest, drink plenty of fluids and consult a real doctor "
+    "if the fever does not go down."
+)
+# Not a playable MP3, just enough bytes to look like one to the app
+MOCK_AUDIO = b"ID3" + b"\x00" * 16 * 1024
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    # Latency is drawn uniformly from latency * (1 +- jitter)
+    jitter = 0.0
+    # Fraction of calls answered with 503
+    error_rate = 0.0
+    # Extra TTS time per character of text, so long replies take longer like the real API
+    tts_seconds_per_char = 0.0
+    # Shared per server: {"stt": {"calls": n, "errors": n}, ...}
+    stats = None
+    stats_lock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self, endpoint, failed):
+        with self.stats_lock:
+            counts = self.stats.setdefault(endpoint, {"calls": 0, "errors": 0})
+            counts["calls"] += 1
+            counts["errors"] += failed
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request_body = self.rfile.read(length)
+        time.sleep(max(0.0, self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)))
+
+        endpoint = ("stt" if "/audio/transcriptions" in self.path else
+                    "chat" if "/chat/completions" in self.path else
+                    "tts" if self.path.startswith("/v1/text-to-speech/") else "other")
+        failed = endpoint != "other" and random.random() < self.error_rate
+        self._count(endpoint, failed)
+        if failed:
+            self._send(503, json.dumps({"error": {"message": "mock provider overloaded"}}).encode())
+            return
+
+        if self.path.startswith("/openai/v1/audio/transcriptions"):
+            # verbose_json shape (the app reads "language" from it)
+            self._send(200, json.dumps({"text": MOCK_TRANSCRIPT, "language": "english", "duration": 3.2,
+                                        "segments": []}).encode())
+        elif self.path.startswith("/openai/v1/chat/completions"):
+            body = {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "mock",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": MOCK_REPLY},
+                    "finish_reason": "stop",
+                }],
+                # Rough 4-characters-per-token figures, so token metrics move under load tests
+                "usage": {"prompt_tokens": len(request_body) // 4, "completion_tokens": len(MOCK_REPLY) // 4,
+                          "total_tokens": (len(request_body) + len(MOCK_REPLY)) // 4},
+            }
+            self._send(200, json.dumps(body).encode())
+        elif self.path.startswith("/v1/text-to-speech/"):
+            if self.tts_seconds_per_char:
+                text = json.loads(request_body or b"{}").get("text", "")
+                time.sleep(len(text) * self.tts_seconds_per_char)
+            self._send(200, MOCK_AUDIO, content_type="audio/mpeg")
+        else:
+            self._send(404, json.dumps({"error": "unknown path"}).encode())
+
+
+def start_mock_server(port=0, latency=0.0, tts_seconds_per_char=0.0, error_rate=0.0, jitter=0.0):
+    """
+    Start the mock server on a background thread.
+    Returns (server, base_url); call server.shutdown() to stop it. server.stats holds
+    calls and injected errors per endpoint (stt, chat, tts).
+    """
+    stats = {}
+    handler = type("Handler", (MockProviderHandler,), {"latency": latency, "jitter": jitter,
+                                                        "error_rate": error_rate,
+                                                        "tts_seconds_per_char": tts_seconds_per_char,
+                                                        "stats": stats, "stats_lock": threading.Lock()})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Groq/ElevenLabs stand-in")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency varies by +- this fraction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.port, args.latency, error_rate=args.error_rate, jitter=args.jitter)
+    print(f"Mock providers listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
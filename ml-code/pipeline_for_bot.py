@@ -0,0 +1,73 @@
+# pipeline_for_bot.py
+# Small stage graph for the request pipeline. Each stage names the stages it needs;
+# stages whose inputs are ready run at the same time (e.g. image preprocessing runs
+# while the audio is still being transcribed), and every stage is timed (returned per
+# request, and observed in healthmate_stage_seconds for /metrics).
+
+import time
+import asyncio
+from contextlib import contextmanager
+
+from metrics_for_bot import metrics
+
+stage_seconds = metrics.histogram("healthmate_stage_seconds", "Time per request pipeline stage", ["stage"])
+
+
+class StageGraph:
+    """
+    graph = StageGraph()
+    graph.add("stt", transcribe)                      # async fn(results) -> value
+    graph.add("retrieve", retrieve, after=["stt"])    # results["stt"] is available here
+    results = await graph.run()
+    graph.timings                                     # {"stt": ms, "retrieve": ms, ...}
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.timings = {}
+
+    def add(self, name, fn, after=()):
+        missing = [dep for dep in after if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {name!r} depends on unknown stages {missing} (add them first)")
+        self.stages[name] = (fn, tuple(after))
+        return self
+
+    async def run(self):
+        """Run every stage as soon as its dependencies finish. The first failure cancels the rest."""
+        results = {}
+        tasks = {}
+
+        async def run_stage(name, fn, after):
+            if after:
+                await asyncio.gather(*(tasks[dep] for dep in after))
+            start = time.perf_counter()
+            try:
+                results[name] = await fn(results)
+            finally:
+                self._record(name, time.perf_counter() - start)
+            return results[name]
+
+        for name, (fn, after) in self.stages.items():
+            tasks[name] = asyncio.create_task(run_stage(name, fn, after))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return results
+
+    @contextmanager
+    def timed(self, name):
+        """Time a step that runs outside the graph (LLM, TTS) alongside the graph stages."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def _record(self, name, seconds):
+        self.timings[name] = round(seconds * 1000, 1)
+        stage_seconds.observe(seconds, stage=name)
@@ -0,0 +1,227 @@
+# resilience_for_bot.py
+# Retries, deadlines and circuit breakers for the provider calls (Groq, ElevenLabs, gTTS).
+#  - Retries back off exponentially with full jitter, asynchronously (no time.sleep on the loop).
+#  - Every request gets a time budget (REQUEST_BUDGET_SECONDS); each call's timeout is
+#    capped by what is left of it, and no retry is started that could not finish in time.
+#  - A breaker per provider opens after consecutive failures, so calls fail fast (and the
+#    caller uses its fallback: gTTS for speech, a text-only reply) until a trial call succeeds.
+
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+
+REQUEST_BUDGET_SECONDS = float(os.environ.get("REQUEST_BUDGET_SECONDS", "60"))
+RETRY_ATTEMPTS = int(os.environ.get("RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "4"))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+
+# Absolute time.monotonic() deadline of the current request, None outside a request
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class CircuitOpenError(Exception):
+    """The provider's breaker is open; the call was not attempted."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out."""
+
+
+# ---- Deadlines ----
+@contextmanager
+def request_budget(seconds=REQUEST_BUDGET_SECONDS):
+    """Give everything called inside (including tasks and to_thread calls started here) `seconds` in total."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        try:
+            _deadline.reset(token)
+        except ValueError:
+            # An async generator (SSE body) closed from another context; its context is gone anyway
+            pass
+
+
+def remaining(timeout=None):
+    """Seconds this call may take: timeout capped by the request budget (None = unlimited)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Request time budget exhausted")
+    return left if timeout is None else min(timeout, left)
+
+
+# ---- Circuit breaker ----
+class CircuitBreaker:
+    """
+    closed -> (failure_threshold consecutive failures) -> open -> (reset_seconds) ->
+    half-open: one trial call; success closes the breaker, failure opens it again.
+    A trial that is cancelled (release_trial) or never reports back within reset_seconds
+    frees the slot for the next caller, so the breaker cannot stay half-open forever.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "failures": 0, "retries": 0, "trips": 0, "rejected": 0, "deadline_exceeded": 0}
+
+    def before_call(self):
+        """Raise CircuitOpenError instead of calling an unhealthy provider."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._trial_running = False
+            if self._trial_running and time.monotonic() - self._trial_started >= self.reset_seconds:
+                # The trial's caller vanished without recording a result
+                self._trial_running = False
+            if self.state == "open" or (self.state == "half_open" and self._trial_running):
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            if self.state == "half_open":
+                self._trial_running = True
+                self._trial_started = time.monotonic()
+            self.counters["calls"] += 1
+
+    def release_trial(self):
+        """The call was cancelled: no verdict on the provider, let the next call be the trial."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.counters["failures"] += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                if self.state != "open":
+                    self.counters["trips"] += 1
+                    print(f"[resilience] {self.name} circuit opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, **self.counters}
+
+
+breakers = {name: CircuitBreaker(name) for name in ("groq", "elevenlabs", "gtts")}
+
+
+def resilience_stats():
+    return {name: breaker.stats() for name, breaker in breakers.items()}
+
+
+# ---- Retries ----
+def backoff_delay(attempt, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+    """Full jitter: uniform in [0, min(max_delay, base_delay * 2**attempt)]."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def retryable(error):
+    """
+    Network errors, timeouts, 408/409/429 and 5xx are worth retrying; other 4xx and
+    invalid arguments (ValueError, e.g. a language gTTS does not support) are not.
+    """
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded, ValueError, TypeError)):
+        return False
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is None or status in (408, 409, 429) or status >= 500
+
+
+def _start_attempt(breaker, timeout=None):
+    """Check the breaker and the budget; returns this attempt's timeout."""
+    try:
+        breaker.before_call()
+        return remaining(timeout)
+    except DeadlineExceeded:
+        breaker.counters["deadline_exceeded"] += 1
+        raise
+
+
+def _retry_delay(provider, breaker, error, attempt, attempts, base_delay):
+    """Backoff before the next attempt, or None if the error should be raised now."""
+    if not retryable(error):
+        # The provider answered; a bad request says nothing about its health
+        breaker.record_success()
+        return None
+    breaker.record_failure()
+    if attempt + 1 >= attempts or breaker.state == "open":
+        return None
+    delay = backoff_delay(attempt, base_delay)
+    deadline = _deadline.get()
+    if deadline is not None and time.monotonic() + delay >= deadline:
+        return None
+    breaker.counters["retries"] += 1
+    print(f"[resilience] {provider} attempt {attempt + 1}/{attempts} failed ({error!r}), retrying in {delay:.2f}s")
+    return delay
+
+
+async def call_async(provider, make_call, attempts=RETRY_ATTEMPTS, timeout=None, base_delay=RETRY_BASE_DELAY):
+    """
+    await make_call() through the provider's breaker, with a per-attempt timeout capped by
+    the request budget and jittered exponential backoff between attempts.
+    make_call is a zero-argument function returning a new awaitable each time.
+    """
+    breaker = breakers[provider]
+    for attempt in range(attempts):
+        call_timeout = _start_attempt(breaker, timeout)
+        try:
+            result = await asyncio.wait_for(make_call(), call_timeout)
+        except Exception as e:
+            delay = _retry_delay(provider, breaker, e, attempt, attempts, base_delay)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+        except BaseException:
+            # Cancelled (client disconnect): neither a success nor a failure
+            breaker.release_trial()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+def call_sync(provider, make_call, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY):
+    """
+    Blocking variant of call_async for synchronous SDKs. Only use it off the event loop
+    (CLI, or inside asyncio.to_thread); timeouts are left to the HTTP client.
+    """
+    breaker = breakers[provider]
+    for attempt in range(attempts):
+        _start_attempt(breaker)
+        try:
+            result = make_call()
+        except Exception as e:
+            delay = _retry_delay(provider, breaker, e, attempt, attempts, base_delay)
+            if delay is None:
+                raise
+            time.sleep(delay)
+        except BaseException:
+            breaker.release_trial()
+            raise
+        else:
+            breaker.record_success()
+            return result
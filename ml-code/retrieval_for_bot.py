@@ -0,0 +1,172 @@
+# retrieval_for_bot.py
+# Cache in front of the FAISS retriever. Patients ask very repetitive questions, so we
+# keep (normalized query -> embedding) and (normalized query -> top-k chunk ids) in LRU
+# caches, can reuse results of a near-identical earlier query (opt-in), and drop cached
+# results whenever the index version changes. Misses go to the hybrid FAISS + BM25 search
+# (hybrid_for_bot.py) unless RETRIEVAL_MODE=vector.
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics_for_bot import traced
+from hybrid_for_bot import HybridSearcher
+
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.environ.get("RETRIEVAL_CACHE_TTL", "3600"))
+# Cosine similarity above which a cached query's results are reused (0 disables, the default).
+# Off unless set: short medical questions that differ by a negation or a drug name ("with X"
+# vs "without X") easily reach 0.97, and would be served the other question's chunks.
+RETRIEVAL_NEAR_DUP_THRESHOLD = float(os.environ.get("RETRIEVAL_NEAR_DUP_THRESHOLD", "0"))
+# "hybrid" (FAISS + BM25, fused and deduplicated) or "vector" (FAISS only)
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+
+
+def normalize_query(text):
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+class LRUCache:
+    """Size- and TTL-bounded LRU map. Not thread-safe on its own."""
+
+    def __init__(self, max_size=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        value, stored_at = item
+        if self.ttl and time.monotonic() - stored_at > self.ttl:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = (value, time.monotonic())
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def items(self):
+        return [(k, v) for k, (v, _) in self._items.items()]
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class CachedRetriever:
+    """
+    Drop-in replacement for db.as_retriever(...): invoke(query) returns the top-k Documents.
+
+    Results are stored as docstore ids and materialized on every call, and they are tied to
+    the knowledge base's index version. Embeddings only depend on the model, so they
+    survive index reloads.
+    """
+
+    def __init__(self, knowledge, max_size=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL,
+                 near_dup_threshold=RETRIEVAL_NEAR_DUP_THRESHOLD, mode=RETRIEVAL_MODE):
+        self.knowledge = knowledge
+        self.near_dup_threshold = near_dup_threshold
+        self.hybrid = HybridSearcher() if mode == "hybrid" else None
+        self.embeddings = LRUCache(max_size, ttl)
+        self.results = LRUCache(max_size, ttl)
+        self.index_version = None
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "near_hits": 0, "misses": 0, "embedding_hits": 0, "invalidations": 0}
+        self.latency = {"hit_seconds": 0.0, "miss_seconds": 0.0}
+
+    def _check_version(self):
+        version = (self.knowledge.version, id(self.knowledge.db))
+        if version != self.index_version:
+            if self.index_version is not None:
+                self.counters["invalidations"] += 1
+            self.results.clear()
+            self.index_version = version
+
+    def _embed(self, key, query):
+        with self._lock:
+            vector = self.embeddings.get(key)
+            if vector is not None:
+                self.counters["embedding_hits"] += 1
+                return vector
+        vector = np.asarray(self.knowledge.embedding_model.embed_query(query), dtype="float32")
+        with self._lock:
+            self.embeddings.put(key, vector)
+        return vector
+
+    def _near_duplicate(self, vector):
+        cached = self.results.items()
+        if not cached or self.near_dup_threshold <= 0:
+            return None
+        matrix = np.stack([entry["vector"] for _, entry in cached])
+        sims = matrix @ vector / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector) + 1e-12)
+        best = int(np.argmax(sims))
+        return cached[best][1] if sims[best] >= self.near_dup_threshold else None
+
+    def _search(self, vector, query):
+        db, bm25 = self.knowledge.db, self.knowledge.bm25
+        if self.hybrid and bm25 is not None:
+            return self.hybrid.search(db, bm25, vector, query, self.knowledge.k)
+        _, indices = db.index.search(vector.reshape(1, -1), self.knowledge.k)
+        return [db.index_to_docstore_id[i] for i in indices[0] if i != -1]
+
+    def _materialize(self, doc_ids):
+        docstore = self.knowledge.db.docstore
+        return [doc for doc in (docstore.search(doc_id) for doc_id in doc_ids) if not isinstance(doc, str)]
+
+    @traced("retrieval")
+    def invoke(self, query):
+        start = time.perf_counter()
+        key = normalize_query(query)
+
+        with self._lock:
+            self._check_version()
+            entry = self.results.get(key)
+            if entry is not None:
+                self.counters["exact_hits"] += 1
+                self.latency["hit_seconds"] += time.perf_counter() - start
+                return self._materialize(entry["doc_ids"])
+
+        vector = self._embed(key, query)
+
+        with self._lock:
+            entry = self._near_duplicate(vector)
+            if entry is not None:
+                self.counters["near_hits"] += 1
+                self.results.put(key, entry)
+                self.latency["hit_seconds"] += time.perf_counter() - start
+                return self._materialize(entry["doc_ids"])
+
+        doc_ids = self._search(vector, query)
+        with self._lock:
+            self.results.put(key, {"vector": vector, "doc_ids": doc_ids})
+            self.counters["misses"] += 1
+            self.latency["miss_seconds"] += time.perf_counter() - start
+        return self._materialize(doc_ids)
+
+    def stats(self):
+        with self._lock:
+            hits = self.counters["exact_hits"] + self.counters["near_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "avg_hit_ms": round(self.latency["hit_seconds"] / hits * 1000, 3) if hits else 0.0,
+                "avg_miss_ms": round(self.latency["miss_seconds"] / self.counters["misses"] * 1000, 3)
+                if self.counters["misses"] else 0.0,
+                "cached_queries": len(self.results),
+                "cached_embeddings": len(self.embeddings),
+                "hybrid": self.hybrid.stats() if self.hybrid else None,
+            }
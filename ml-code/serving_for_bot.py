@@ -0,0 +1,193 @@
+# serving_for_bot.py
+# HTTP serving of reply audio for /download-voice:
+#  - strong ETags and Last-Modified, answered with 304 when the browser already has the clip
+#    (tts_<sha256>.mp3 names are content hashes; final_/reply_ files are written once);
+#  - Cache-Control immutable, so replays do not even revalidate;
+#  - single byte ranges (206 / 416), so seeking in the <audio> element does not restart
+#    the download;
+#  - recently generated or played clips are served from a small in-memory LRU, larger or
+#    colder ones by FileResponse (which handles ranges itself and uses zero-copy
+#    "pathsend" when the ASGI server supports it).
+
+import os
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from starlette.responses import Response, FileResponse
+
+from artifacts_for_bot import VOICE_MAX_AGE
+
+VOICE_HOT_CACHE_BYTES = int(os.environ.get("VOICE_HOT_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Clips above this are always streamed from disk
+VOICE_HOT_CACHE_MAX_ITEM = int(os.environ.get("VOICE_HOT_CACHE_MAX_ITEM", str(4 * 1024 * 1024)))
+# Content-addressed clips never change; others live until the artifact GC removes them
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PRIVATE_CACHE_CONTROL = f"private, max-age={int(VOICE_MAX_AGE)}, immutable"
+CONTENT_ADDRESSED_PREFIX = "tts_"
+MEDIA_TYPE = "audio/mpeg"
+
+
+class ClipCache:
+    """LRU of clip bytes keyed by path; an entry is only used while size and mtime still match."""
+
+    def __init__(self, max_bytes=VOICE_HOT_CACHE_BYTES, max_item=VOICE_HOT_CACHE_MAX_ITEM):
+        self.max_bytes = max_bytes
+        self.max_item = max_item
+        self._entries = OrderedDict()  # path -> (mtime_ns, size, data)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, path, st):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self._entries.move_to_end(path)
+                self.counters["hits"] += 1
+                return entry[2]
+            if entry:
+                self._drop(path)
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, path, data, st=None):
+        """Remember a clip that was just written or read (st: its os.stat, taken if omitted)."""
+        if len(data) > self.max_item:
+            return
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return
+        if st.st_size != len(data):
+            return
+        with self._lock:
+            if path in self._entries:
+                self._drop(path)
+            self._entries[path] = (st.st_mtime_ns, st.st_size, data)
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                self._drop(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+
+    def _drop(self, path):
+        self.total_bytes -= self._entries.pop(path)[1]
+
+    def discard(self, path):
+        with self._lock:
+            if path in self._entries:
+                self._drop(path)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+voice_clips = ClipCache()
+
+
+def clip_etag(path, st):
+    """Strong validator: the content hash in tts_ names, else a hash of name, size and mtime."""
+    name = os.path.basename(path)
+    if name.startswith(CONTENT_ADDRESSED_PREFIX):
+        return f'"{name[len(CONTENT_ADDRESSED_PREFIX):].rsplit(".", 1)[0]}"'
+    return '"' + hashlib.sha1(f"{name}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest() + '"'
+
+
+def _etag_matches(header, etag):
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def _not_modified(request_headers, etag, st):
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(st.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range, None to send the whole file
+    (absent, malformed or multi-range headers), "unsatisfiable" for a 416.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                return "unsatisfiable"
+            start, end = max(0, size - length), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return "unsatisfiable"
+    return start, min(end, size - 1)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def voice_response(request_headers, path):
+    """Response for GET of the clip at path (which must exist), honouring validators and Range."""
+    try:
+        st = await asyncio.to_thread(os.stat, path)
+    except OSError:
+        voice_clips.discard(path)
+        return Response(status_code=404)
+
+    name = os.path.basename(path)
+    etag = clip_etag(path, st)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if name.startswith(CONTENT_ADDRESSED_PREFIX) else PRIVATE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{name}"',
+    }
+    if _not_modified(request_headers, etag, st):
+        return Response(status_code=304, headers=headers)
+
+    data = voice_clips.get(path, st)
+    if data is None and st.st_size <= voice_clips.max_item:
+        data = await asyncio.to_thread(_read, path)
+        voice_clips.put(path, data, st)
+    if data is None:
+        # Large clip: Starlette streams it (and handles Range) from disk
+        return FileResponse(path, media_type=MEDIA_TYPE, headers=headers, stat_result=st)
+
+    # A Range is only honoured if If-Range (when sent) still names this version
+    if_range = request_headers.get("if-range")
+    byte_range = parse_range(request_headers.get("range"), len(data)) if if_range in (None, etag) else None
+    if byte_range == "unsatisfiable":
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+    if byte_range:
+        start, end = byte_range
+        return Response(data[start:end + 1], status_code=206, media_type=MEDIA_TYPE,
+                        headers={**headers, "Content-Range": f"bytes {start}-{end}/{len(data)}"})
+    return Response(data, media_type=MEDIA_TYPE, headers=headers)
@@ -0,0 +1,208 @@
+# startup_for_bot.py
+# Warm start for the RAG knowledge base. Nothing heavy (torch, transformers, faiss,
+# langchain) is imported until load() runs, so importing gradio_app stays fast and
+# uvicorn can accept connections (and answer /ready) while the model loads.
+
+import os
+import json
+import time
+import pickle
+import threading
+from pathlib import Path
+
+from hybrid_for_bot import load_or_build_bm25
+from ann_for_bot import ANN_FILE, set_search_params
+from chunks_for_bot import CHUNKS_DIR, ChunkStore
+
+DB_FAISS_PATH = os.environ.get("DB_FAISS_PATH", "vectorstore/db_faiss")
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+RETRIEVER_K = 3
+
+# "torch" (default) or "onnx" for the ONNX Runtime CPU export of the embedder
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+# ONNX file inside the model repo; the qint8 exports are dynamically quantized.
+# Query vectors from a quantized embedder drift slightly from the fp32 vectors in the index.
+EMBEDDING_ONNX_FILE = os.environ.get("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx2.onnx")
+# Memory-map index.faiss so every worker process shares one copy of the vectors in page cache
+FAISS_MMAP = os.environ.get("FAISS_MMAP", "1") == "1"
+# Seconds between checks for a new index written by database_for_bot.py (0 disables)
+INDEX_RELOAD_INTERVAL = float(os.environ.get("INDEX_RELOAD_INTERVAL", "30"))
+# Serve the trained index.ann.faiss when the indexer wrote one ("0" forces the exact flat index)
+FAISS_USE_ANN = os.environ.get("FAISS_USE_ANN", "1") == "1"
+
+
+def get_embedding_model(backend=EMBEDDING_BACKEND):
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    model_kwargs = {"device": "cpu"}
+    if backend == "onnx":
+        model_kwargs.update({"backend": "onnx", "model_kwargs": {"file_name": EMBEDDING_ONNX_FILE}})
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME, model_kwargs=model_kwargs)
+
+
+def read_faiss_index(index_file, mmap=FAISS_MMAP):
+    """
+    Read index.faiss with the mmap flags, falling back to a plain read.
+    IO_FLAG_MMAP maps IVF inverted lists; flat indexes are only mapped by faiss
+    versions that have IO_FLAG_MMAP_IFC, older ones silently read them into RAM.
+    """
+    import faiss
+
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(str(index_file), flags), True
+        except RuntimeError as e:
+            print(f"[startup] mmap not supported for {index_file} ({e}), reading into memory")
+    return faiss.read_index(str(index_file)), False
+
+
+def read_index_version(path=DB_FAISS_PATH):
+    """Version from the indexer's manifest.json, None for indexes built without one."""
+    try:
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+def load_docstore(path=DB_FAISS_PATH):
+    """
+    (docstore, index_to_docstore_id) from the memory-mapped chunk store, or from the
+    pickled index.pkl of indexes written before it.
+    """
+    path = Path(path)
+    if (path / CHUNKS_DIR).is_dir():
+        store = ChunkStore(str(path / CHUNKS_DIR))
+        return store, store.index_to_docstore_id
+    print(f"[startup] no {CHUNKS_DIR}/ in {path}, unpickling index.pkl (rebuild the index to convert it)")
+    with open(path / "index.pkl", "rb") as f:
+        return pickle.load(f)
+
+
+def load_vectorstore(embedding_model, path=DB_FAISS_PATH, mmap=FAISS_MMAP, use_ann=FAISS_USE_ANN):
+    """
+    Equivalent of FAISS.load_local(path, embedding_model, allow_dangerous_deserialization=True)
+    but with control over how index.faiss is read, and using the approximate index.ann.faiss
+    (same ids, FAISS_NPROBE / FAISS_EF_SEARCH applied) when there is one. Chunks come from
+    the lazily read chunk store instead of the pickled docstore.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    path = Path(path)
+    if use_ann and (path / ANN_FILE).exists():
+        index, mapped = read_faiss_index(path / ANN_FILE, mmap=mmap)
+        set_search_params(index)
+    else:
+        index, mapped = read_faiss_index(path / "index.faiss", mmap=mmap)
+    docstore, index_to_docstore_id = load_docstore(path)
+    db = FAISS(
+        embedding_function=embedding_model,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+    return db, mapped
+
+
+class KnowledgeBase:
+    """
+    Embedding model + FAISS index + retriever, loaded once per process.
+
+    status is "not_loaded" -> "loading" -> "ready" (or "failed"); phases holds the
+    seconds spent in each startup step for the /ready endpoint.
+    """
+
+    def __init__(self, path=DB_FAISS_PATH, k=RETRIEVER_K):
+        self.path = path
+        self.k = k
+        self.status = "not_loaded"
+        self.error = None
+        self.phases = {}
+        self.mmap = False
+        self.version = None
+        self.embedding_model = None
+        self.db = None
+        self.bm25 = None
+        self._retriever = None
+        self._lock = threading.Lock()
+
+    def _phase(self, name, fn):
+        start = time.perf_counter()
+        result = fn()
+        self.phases[name] = round(time.perf_counter() - start, 3)
+        return result
+
+    def load(self):
+        with self._lock:
+            if self.status == "ready":
+                return self
+            self.status = "loading"
+            self.phases = {}
+            try:
+                self._phase("import_dependencies", lambda: (
+                    __import__("langchain_huggingface"),
+                    __import__("langchain_community.vectorstores"),
+                    __import__("faiss"),
+                ))
+                self.embedding_model = self._phase("load_embedding_model", get_embedding_model)
+                self.version = read_index_version(self.path)
+                self.db, self.mmap = self._phase("load_index", lambda: load_vectorstore(self.embedding_model, self.path))
+                self.bm25 = self._phase("load_bm25", lambda: load_or_build_bm25(self.path, self.db))
+                self._retriever = self.db.as_retriever(search_kwargs={"k": self.k})
+                # First query pays tokenizer/session initialisation; do it before real traffic
+                self._phase("warmup_query", lambda: self.embedding_model.embed_query("warmup"))
+                self.status = "ready"
+                print(f"[startup] knowledge base ready in {sum(self.phases.values()):.2f}s {self.phases}")
+            except Exception as e:
+                self.status = "failed"
+                self.error = str(e)
+                print(f"[startup] knowledge base failed to load: {e}")
+                raise
+        return self
+
+    def reload_if_changed(self):
+        """
+        Swap in a newer index written by database_for_bot.py. The old index keeps
+        serving until the new one is fully loaded. Returns True if it swapped.
+        """
+        if not self.ready:
+            return False
+        version = read_index_version(self.path)
+        if version is None or version == self.version:
+            return False
+        start = time.perf_counter()
+        db, mapped = load_vectorstore(self.embedding_model, self.path)
+        bm25 = load_or_build_bm25(self.path, db)
+        with self._lock:
+            self.db, self.bm25, self.mmap, self.version = db, bm25, mapped, version
+            self._retriever = db.as_retriever(search_kwargs={"k": self.k})
+            self.phases["last_reload"] = round(time.perf_counter() - start, 3)
+        print(f"[startup] hot-swapped index to version {version}")
+        return True
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+    @property
+    def retriever(self):
+        # Lazy path for scripts that never ran load() explicitly
+        if not self.ready:
+            self.load()
+        return self._retriever
+
+    def report(self):
+        return {
+            "status": self.status,
+            "error": self.error,
+            "phases": self.phases,
+            "total_seconds": round(sum(self.phases.values()), 3),
+            "embedding_backend": EMBEDDING_BACKEND,
+            "faiss_mmap": self.mmap,
+            "faiss_index": type(self.db.index).__name__ if self.db is not None else None,
+            "bm25_chunks": len(self.bm25) if self.bm25 is not None else None,
+            "chunk_store": type(self.db.docstore).__name__ if self.db is not None else None,
+            "index_version": self.version,
+            "index_path": str(self.path),
+        }
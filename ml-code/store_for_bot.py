@@ -0,0 +1,357 @@
+# store_for_bot.py
+# Where conversations live. The in-memory store is per process (single uvicorn worker);
+# the SQLite (WAL) and Redis stores are shared, so a follow-up conversation_id can land
+# on any worker. Every store also hands out a per-conversation lock so two concurrent
+# turns of the same conversation are applied one after the other.
+#
+# SESSION_STORE=memory|sqlite|redis picks the backend. Every backend honours the
+# conversation TTL and the MAX_CONVERSATIONS cap (oldest updated conversations go first).
+
+import os
+import json
+import time
+import uuid
+import zlib
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory")
+SESSION_SQLITE_PATH = os.environ.get("SESSION_SQLITE_PATH", "sessions.db")
+SESSION_REDIS_URL = os.environ.get("SESSION_REDIS_URL", "redis://localhost:6379/0")
+# A lock held longer than this (e.g. by a crashed worker) is considered stale
+SESSION_LOCK_TIMEOUT = float(os.environ.get("SESSION_LOCK_TIMEOUT", "120"))
+LOCK_POLL_INTERVAL = 0.05
+
+
+def dumps(conversation):
+    """Compact serialized conversation: minified JSON, zlib-compressed."""
+    raw = json.dumps(conversation, separators=(",", ":"), ensure_ascii=False)
+    return zlib.compress(raw.encode("utf-8"), 6)
+
+
+def loads(data):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+class ConversationLock:
+    """async with store.lock(conversation_id): ... (acquire/release also usable directly)."""
+
+    async def acquire(self):
+        raise NotImplementedError
+
+    async def release(self):
+        raise NotImplementedError
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.release()
+
+
+class ConversationStore:
+    """Interface shared by the backends. Conversations are plain JSON-able dicts."""
+
+    async def load(self, conversation_id):
+        raise NotImplementedError
+
+    async def save(self, conversation_id, conversation):
+        raise NotImplementedError
+
+    async def delete(self, conversation_id):
+        raise NotImplementedError
+
+    def lock(self, conversation_id):
+        raise NotImplementedError
+
+    async def evict_idle(self, ttl):
+        """Delete conversations not updated for ttl seconds, then any over the cap; returns how many."""
+        raise NotImplementedError
+
+    async def count(self):
+        raise NotImplementedError
+
+
+# ---- In-memory ----
+class _LocalLock(ConversationLock):
+    """
+    Shares the store's asyncio.Lock for the conversation. The lock entry counts its holder
+    and waiters and is dropped when the count reaches zero, so a waiter and a new caller
+    can never end up on different locks.
+    """
+
+    def __init__(self, store, conversation_id):
+        self.store = store
+        self.conversation_id = conversation_id
+        self._entry = None
+
+    async def acquire(self):
+        entry = self.store._locks.setdefault(self.conversation_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self.store._unref_lock(self.conversation_id, entry)
+            raise
+        self._entry = entry
+
+    async def release(self):
+        entry, self._entry = self._entry, None
+        entry[0].release()
+        self.store._unref_lock(self.conversation_id, entry)
+
+
+class InMemoryStore(ConversationStore):
+    def __init__(self, max_conversations=None):
+        self.max_conversations = max_conversations
+        self._items = OrderedDict()
+        self._locks = {}  # conversation id -> [asyncio.Lock, holders + waiters]
+        self.evicted = 0
+
+    async def load(self, conversation_id):
+        conversation = self._items.get(conversation_id)
+        if conversation is not None:
+            self._items.move_to_end(conversation_id)
+        return conversation
+
+    async def save(self, conversation_id, conversation):
+        self._items[conversation_id] = conversation
+        self._items.move_to_end(conversation_id)
+        while self.max_conversations and len(self._items) > self.max_conversations:
+            self._items.popitem(last=False)
+            self.evicted += 1
+
+    async def delete(self, conversation_id):
+        return self._items.pop(conversation_id, None) is not None
+
+    def _unref_lock(self, conversation_id, entry):
+        entry[1] -= 1
+        if entry[1] == 0 and self._locks.get(conversation_id) is entry:
+            del self._locks[conversation_id]
+
+    def lock(self, conversation_id):
+        return _LocalLock(self, conversation_id)
+
+    async def evict_idle(self, ttl):
+        cutoff = time.time() - ttl
+        stale = [cid for cid, c in self._items.items() if c.get("updated_at", 0) < cutoff]
+        for cid in stale:
+            await self.delete(cid)
+        self.evicted += len(stale)
+        return len(stale)
+
+    async def count(self):
+        return len(self._items)
+
+
+# ---- SQLite (WAL) ----
+class _SQLiteLock(ConversationLock):
+    def __init__(self, store, conversation_id):
+        self.store = store
+        self.conversation_id = conversation_id
+        self.token = uuid.uuid4().hex
+
+    async def acquire(self):
+        while not await asyncio.to_thread(self.store._try_lock, self.conversation_id, self.token):
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+    async def release(self):
+        await asyncio.to_thread(self.store._unlock, self.conversation_id, self.token)
+
+
+class SQLiteStore(ConversationStore):
+    """
+    One SQLite file shared by all workers on the host. WAL lets readers run alongside
+    the single writer; locks are rows with an expiry so a dead worker cannot wedge a
+    conversation.
+    """
+
+    def __init__(self, path=SESSION_SQLITE_PATH, ttl=None, max_conversations=None, lock_timeout=SESSION_LOCK_TIMEOUT):
+        self.path = path
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self.lock_timeout = lock_timeout
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations (id TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS locks (id TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _execute(self, sql, params=()):
+        with self._db_lock:
+            cursor = self._conn.execute(sql, params)
+            return cursor.fetchall(), cursor.rowcount
+
+    def _load(self, conversation_id):
+        rows, _ = self._execute("SELECT data FROM conversations WHERE id = ?", (conversation_id,))
+        return loads(rows[0][0]) if rows else None
+
+    def _save(self, conversation_id, conversation):
+        self._execute(
+            "INSERT INTO conversations (id, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (conversation_id, dumps(conversation), conversation.get("updated_at", time.time())),
+        )
+
+    def _try_lock(self, conversation_id, token):
+        now = time.time()
+        _, inserted = self._execute(
+            "INSERT OR IGNORE INTO locks (id, token, expires_at) VALUES (?, ?, ?)",
+            (conversation_id, token, now + self.lock_timeout),
+        )
+        if inserted:
+            return True
+        _, taken_over = self._execute(
+            "UPDATE locks SET token = ?, expires_at = ? WHERE id = ? AND expires_at < ?",
+            (token, now + self.lock_timeout, conversation_id, now),
+        )
+        return taken_over > 0
+
+    def _unlock(self, conversation_id, token):
+        self._execute("DELETE FROM locks WHERE id = ? AND token = ?", (conversation_id, token))
+
+    async def load(self, conversation_id):
+        return await asyncio.to_thread(self._load, conversation_id)
+
+    async def save(self, conversation_id, conversation):
+        await asyncio.to_thread(self._save, conversation_id, conversation)
+
+    async def delete(self, conversation_id):
+        _, deleted = await asyncio.to_thread(self._execute, "DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        return deleted > 0
+
+    def lock(self, conversation_id):
+        return _SQLiteLock(self, conversation_id)
+
+    def _evict(self, ttl):
+        deleted = 0
+        if ttl:
+            _, deleted = self._execute("DELETE FROM conversations WHERE updated_at < ?", (time.time() - ttl,))
+        if self.max_conversations:
+            # Everything past the newest max_conversations, walked on the updated_at index
+            _, over = self._execute(
+                "DELETE FROM conversations WHERE id IN "
+                "(SELECT id FROM conversations ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_conversations,),
+            )
+            deleted += over
+        return deleted
+
+    async def evict_idle(self, ttl=None):
+        return await asyncio.to_thread(self._evict, ttl or self.ttl)
+
+    async def count(self):
+        rows, _ = await asyncio.to_thread(self._execute, "SELECT COUNT(*) FROM conversations")
+        return rows[0][0]
+
+
+# ---- Redis protocol ----
+# Compare-and-delete so a worker never releases a lock that expired and was taken by another
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class _RedisLock(ConversationLock):
+    def __init__(self, store, conversation_id):
+        self.store = store
+        self.key = store._key("lock", conversation_id)
+        self.token = uuid.uuid4().hex
+
+    async def acquire(self):
+        timeout_ms = int(self.store.lock_timeout * 1000)
+        while not await self.store.client.set(self.key, self.token, nx=True, px=timeout_ms):
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+    async def release(self):
+        await self.store.client.eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+
+
+class RedisStore(ConversationStore):
+    """
+    Anything speaking the Redis protocol (Redis, Valkey, KeyDB, or fakeredis in tests via
+    client=fakeredis.aioredis.FakeRedis()). Idle eviction is Redis' own key expiry; the
+    cap uses a sorted set of conversation ids by last update.
+    Needs the optional "redis" package unless a client is passed in.
+    """
+
+    def __init__(self, url=SESSION_REDIS_URL, ttl=None, max_conversations=None, lock_timeout=SESSION_LOCK_TIMEOUT,
+                 prefix="healthmate", client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis_asyncio
+            except ImportError as e:
+                raise RuntimeError("SESSION_STORE=redis needs the 'redis' package (pip install redis)") from e
+            client = redis_asyncio.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self.lock_timeout = lock_timeout
+        self.prefix = prefix
+        self._index = f"{prefix}:conversations"
+
+    def _key(self, kind, conversation_id):
+        return f"{self.prefix}:{kind}:{conversation_id}"
+
+    async def load(self, conversation_id):
+        data = await self.client.get(self._key("conv", conversation_id))
+        return loads(data) if data else None
+
+    async def save(self, conversation_id, conversation):
+        ttl = int(self.ttl) if self.ttl else None
+        await self.client.set(self._key("conv", conversation_id), dumps(conversation), ex=ttl)
+        if self.max_conversations:
+            await self.client.zadd(self._index, {conversation_id: conversation.get("updated_at", time.time())})
+
+    async def delete(self, conversation_id):
+        if self.max_conversations:
+            await self.client.zrem(self._index, conversation_id)
+        return await self.client.delete(self._key("conv", conversation_id)) > 0
+
+    def lock(self, conversation_id):
+        return _RedisLock(self, conversation_id)
+
+    async def evict_idle(self, ttl=None):
+        # Keys carry their own expiry (set on every save); only the cap is enforced here
+        if not self.max_conversations:
+            return 0
+        ttl = ttl or self.ttl
+        if ttl:
+            # Ids of keys that already expired
+            await self.client.zremrangebyscore(self._index, "-inf", time.time() - ttl)
+        over = await self.client.zcard(self._index) - self.max_conversations
+        if over <= 0:
+            return 0
+        oldest = [cid.decode("utf-8") if isinstance(cid, bytes) else cid
+                  for cid in await self.client.zrange(self._index, 0, over - 1)]
+        deleted = await self.client.delete(*(self._key("conv", cid) for cid in oldest))
+        await self.client.zrem(self._index, *oldest)
+        return deleted
+
+    async def count(self):
+        total = 0
+        async for _ in self.client.scan_iter(match=self._key("conv", "*")):
+            total += 1
+        return total
+
+
+def create_store(kind=SESSION_STORE, ttl=None, max_conversations=None):
+    if kind == "memory":
+        return InMemoryStore(max_conversations=max_conversations)
+    if kind == "sqlite":
+        return SQLiteStore(ttl=ttl, max_conversations=max_conversations)
+    if kind == "redis":
+        return RedisStore(ttl=ttl, max_conversations=max_conversations)
+    raise ValueError(f"Unknown SESSION_STORE: {kind!r} (expected memory, sqlite or redis)")
@@ -0,0 +1,171 @@
+# stream_of_bot.py
+# Streaming reply pipeline: LLM tokens -> sentences -> per-sentence TTS, so the patient
+# hears the first sentence while the rest of the answer is still being generated.
+
+import re
+import asyncio
+
+from voice_of_bot import stream_elevenlabs_audio, gtts_audio_bytes_async, concat_mp3
+
+# Sentences synthesized at the same time for one reply
+TTS_STREAM_CONCURRENCY = 3
+# Do not cut before this many characters (no segments like "Yes." or "1." on their own)
+MIN_SENTENCE_CHARS = 20
+
+# End of sentence: . ! ? (and the Devanagari/CJK equivalents) followed by whitespace
+SENTENCE_END = re.compile(r"[.!?।。！？]+[\"')\]]*\s+")
+# A period after one of these is not a sentence end ("see Dr. Smith", "e.g. ibuprofen").
+# Kept small: "No." or "etc." end sentences as often as not.
+ABBREVIATION = re.compile(r"(?<![\w.])(?:dr|mr|mrs|ms|prof|vs|e\.g|i\.e)\.$", re.IGNORECASE)
+
+
+class SentenceSegmenter:
+    """
+    Accumulates streamed text and hands back complete sentences as soon as they end.
+    """
+
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, delta):
+        self.buffer += delta
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            if match.end() - start >= self.min_chars and not self._after_abbreviation(match):
+                sentences.append(self.buffer[start:match.end()].strip())
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def _after_abbreviation(self, match):
+        end = match.start() + 1
+        return match.group().rstrip() == "." and ABBREVIATION.search(self.buffer, max(0, end - 8), end) is not None
+
+    def flush(self):
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+
+class SentenceAudio:
+    """MP3 bytes for one sentence, readable while they are still arriving."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.changed = asyncio.Condition()
+
+    async def append(self, chunk):
+        async with self.changed:
+            self.chunks.append(chunk)
+            self.changed.notify_all()
+
+    async def finish(self):
+        async with self.changed:
+            self.done = True
+            self.changed.notify_all()
+
+    async def read(self):
+        sent = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: self.done or len(self.chunks) > sent)
+                new_chunks = self.chunks[sent:]
+                done = self.done
+            for chunk in new_chunks:
+                yield chunk
+            sent += len(new_chunks)
+            if done and sent == len(self.chunks):
+                return
+
+
+class ReplyStream:
+    """
+    One streamed doctor reply.
+
+    run() consumes the token stream, publishes text events for SSE (None marks the
+    end of the text) and starts TTS for each sentence as soon as it is complete. audio() yields the MP3 in sentence
+    order and can be read by several clients while the reply is still generating.
+    """
+
+    def __init__(self, stream_id, language_code="en", tts_concurrency=TTS_STREAM_CONCURRENCY):
+        self.stream_id = stream_id
+        self.language_code = language_code
+        self.text = ""
+        self.sentences = []
+        self.segments = []
+        self.events = asyncio.Queue()
+        self.finished = asyncio.Event()
+        self.error = None
+        self._tts_slots = asyncio.Semaphore(tts_concurrency)
+        self._tts_tasks = []
+        self._segments_changed = asyncio.Condition()
+
+    async def _synthesize(self, sentence, segment):
+        started = False
+        try:
+            async with self._tts_slots:
+                async for chunk in stream_elevenlabs_audio(sentence):
+                    started = True
+                    await segment.append(chunk)
+        except Exception as e:
+            print(f"[Stream TTS Error] {e}")
+            if not started:
+                # ElevenLabs failed (or its circuit is open) before any audio: voice it with gTTS
+                try:
+                    await segment.append(await gtts_audio_bytes_async(sentence, self.language_code))
+                except Exception as e:
+                    # Keep going: the text is still delivered, this sentence is just silent
+                    print(f"[Stream TTS Error] gTTS fallback failed: {e}")
+        finally:
+            await segment.finish()
+
+    async def _add_sentence(self, sentence):
+        segment = SentenceAudio()
+        self.sentences.append(sentence)
+        async with self._segments_changed:
+            self.segments.append(segment)
+            self._segments_changed.notify_all()
+        self._tts_tasks.append(asyncio.create_task(self._synthesize(sentence, segment)))
+        await self.events.put({"event": "sentence", "data": {"index": len(self.sentences) - 1, "text": sentence}})
+
+    async def run(self, token_stream):
+        segmenter = SentenceSegmenter()
+        try:
+            async for delta in token_stream:
+                self.text += delta
+                await self.events.put({"event": "token", "data": {"text": delta}})
+                for sentence in segmenter.feed(delta):
+                    await self._add_sentence(sentence)
+            for sentence in segmenter.flush():
+                await self._add_sentence(sentence)
+        except Exception as e:
+            self.error = str(e)
+            await self.events.put({"event": "error", "data": {"error": self.error}})
+        finally:
+            async with self._segments_changed:
+                self.finished.set()
+                self._segments_changed.notify_all()
+            # Text is complete: tell the SSE reader, then wait for the remaining audio
+            await self.events.put(None)
+            await asyncio.gather(*self._tts_tasks)
+        return self.text
+
+    async def audio(self):
+        index = 0
+        while True:
+            async with self._segments_changed:
+                await self._segments_changed.wait_for(
+                    lambda: self.finished.is_set() or len(self.segments) > index
+                )
+                if index >= len(self.segments):
+                    return
+                segment = self.segments[index]
+            async for chunk in segment.read():
+                yield chunk
+            index += 1
+
+    def audio_bytes(self):
+        """Full MP3 once run() has returned: segments in order, as voice_of_bot.concat_mp3 joins them."""
+        return concat_mp3([b"".join(segment.chunks) for segment in self.segments if segment.chunks])
@@ -0,0 +1,124 @@
+# tts_cache_for_bot.py
+# Content-addressed cache for synthesized speech. A clip is stored once as
+# outputs/voices/tts_<hash>.mp3, where the hash covers everything that changes the audio
+# (provider, text, language, voice, model, voice settings), so identical replies reuse
+# the same file and the same download URL. Total size is bounded with LRU eviction;
+# clips linked from active conversations are skipped (see artifacts_for_bot).
+
+import os
+import json
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Same directory /download-voice serves from, so cached clips are directly downloadable
+TTS_CACHE_DIR = "outputs/voices"
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CACHE_PREFIX = "tts_"
+
+
+def tts_cache_key(**params):
+    """sha256 over the synthesis parameters (text, language, voice_id, model, settings, ...)."""
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    Size-bounded LRU of audio files on disk. Recency survives restarts through file mtimes.
+    """
+
+    def __init__(self, folder=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self.total_bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "evicted_bytes": 0}
+        # Optional fn(path) -> True while the clip must not be evicted
+        self.retained = None
+        os.makedirs(folder, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.folder):
+            if name.startswith(CACHE_PREFIX) and name.endswith(".mp3"):
+                path = os.path.join(self.folder, name)
+                st = os.stat(path)
+                found.append((st.st_mtime, name[len(CACHE_PREFIX):-len(".mp3")], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.total_bytes += size
+
+    def path_for(self, key):
+        return os.path.join(self.folder, f"{CACHE_PREFIX}{key}.mp3")
+
+    def lookup(self, key):
+        """Path of the cached clip (marked as recently used), or None."""
+        path = self.path_for(key)
+        with self._lock:
+            if key in self._entries and os.path.exists(path):
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+            else:
+                if key in self._entries:
+                    self.total_bytes -= self._entries.pop(key)
+                self.counters["misses"] += 1
+                return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def adopt(self, key, src_path):
+        """Move a freshly written file into the cache under key and return its cache path."""
+        path = self.path_for(key)
+        os.replace(src_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+        return path
+
+    def store(self, key, data):
+        tmp_path = self.temp_path()
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return self.adopt(key, tmp_path)
+
+    def temp_path(self):
+        """Scratch file for synthesizers that insist on writing to a path themselves."""
+        return os.path.join(self.folder, f".tmp_{uuid.uuid4().hex}.mp3")
+
+    def _evict(self):
+        for key in list(self._entries)[:-1]:
+            if self.total_bytes <= self.max_bytes:
+                break
+            if self.retained and self.retained(self.path_for(key)):
+                continue
+            size = self._entries.pop(key)
+            self.total_bytes -= size
+            self.counters["evictions"] += 1
+            self.counters["evicted_bytes"] += size
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+tts_cache = TTSCache()
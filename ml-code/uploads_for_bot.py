@@ -0,0 +1,46 @@
+# uploads_for_bot.py
+# Upload ingestion: uploads are copied to temp/ in fixed-size chunks with size limits
+# enforced while copying, so a request never holds a whole recording or photo in memory.
+
+import os
+import asyncio
+
+from fastapi import HTTPException, UploadFile
+
+from metrics_for_bot import traced
+
+# Groq's transcription endpoint takes at most 25 MB; photos are downsized before upload anyway
+MAX_AUDIO_UPLOAD_BYTES = int(os.environ.get("MAX_AUDIO_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+MAX_IMAGE_UPLOAD_BYTES = int(os.environ.get("MAX_IMAGE_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@traced("upload_save")
+async def save_upload_stream(upload: UploadFile, path: str, max_bytes: int, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Copy an upload to path chunk by chunk and return its size. Raises 413 (and removes
+    the partial file) once max_bytes is exceeded, 400 for an empty upload.
+    """
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while chunk := await upload.read(chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413,
+                                        detail=f"{upload.filename or 'upload'} is larger than {max_bytes} bytes")
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        _remove(path)
+        raise
+    if size == 0:
+        _remove(path)
+        raise HTTPException(status_code=400, detail=f"{upload.filename or 'upload'} is empty")
+    return size
@@ -22,77 +22,300 @@ def text_to_speech_with_gtts_old(input_text, output_filepath):
 #Step1b: Setup Text to Speech–TTS–model with ElevenLabs
 import os
 import uuid
+import asyncio
 from datetime import datetime
-from elevenlabs import ElevenLabs, VoiceSettings
+from elevenlabs import VoiceSettings
+
+# ElevenLabs clients come from the shared pooled registry (ELEVENLABS_BASE_URL lets us point at a local stub)
+from clients_for_bot import get_elevenlabs_client, get_async_elevenlabs_client
+# Identical text + voice parameters are synthesized once and served from outputs/voices/tts_<hash>.mp3
+from tts_cache_for_bot import tts_cache, tts_cache_key
+# Jittered backoff, request deadlines and a circuit breaker per provider
+from resilience_for_bot import call_async, call_sync, breakers, RETRY_BASE_DELAY
+from metrics_for_bot import traced
+# Reply files outside the TTS cache are indexed and garbage-collected
+from artifacts_for_bot import voice_artifacts
+
+ELEVENLABS_VOICE_ID = "1Z7Y8o9cvUeWq8oLKgMY"
+ELEVENLABS_MODEL_ID = "eleven_multilingual_v2"
+ELEVENLABS_VOICE_SETTINGS_PARAMS = {
+    "stability": 0.0,
+    "similarity_boost": 1.0,
+    "style": 0.0,
+    "use_speaker_boost": True
+}
+ELEVENLABS_VOICE_SETTINGS = VoiceSettings(**ELEVENLABS_VOICE_SETTINGS_PARAMS)
+
+# ElevenLabs plans cap concurrent requests per account (2 on free, 3-5 on paid tiers);
+# every async synthesis in this process shares these slots
+ELEVENLABS_MAX_CONCURRENCY = int(os.environ.get("ELEVENLABS_MAX_CONCURRENCY", "4"))
+elevenlabs_slots = asyncio.Semaphore(ELEVENLABS_MAX_CONCURRENCY)
+# Sentences of one reply synthesized at the same time
+TTS_SENTENCE_CONCURRENCY = int(os.environ.get("TTS_SENTENCE_CONCURRENCY", "3"))
+
+
+def elevenlabs_cache_key(input_text, language_code, voice_id=ELEVENLABS_VOICE_ID):
+    return tts_cache_key(
+        provider="elevenlabs",
+        text=input_text,
+        language=language_code,
+        voice_id=voice_id,
+        model=ELEVENLABS_MODEL_ID,
+        settings=ELEVENLABS_VOICE_SETTINGS_PARAMS
+    )
+
+
+def _voice_info(path, cached=False):
+    return {
+        "file": path,
+        "size": os.path.getsize(path),
+        "created_at": datetime.now().isoformat(),
+        "cached": cached
+    }
 
-# Initialize the ElevenLabs client
-client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
 
 # Add a language parameter
-def text_to_speech_with_elevenlabs(input_text, language_code, output_filepath=None, voice_id="1Z7Y8o9cvUeWq8oLKgMY", retries=3, delay=2, folder="outputs/voices"):
+@traced("tts_elevenlabs")
+def text_to_speech_with_elevenlabs(input_text, language_code, output_filepath=None, voice_id=ELEVENLABS_VOICE_ID, retries=3, delay=RETRY_BASE_DELAY, folder="outputs/voices"):
     """
     Convert text to speech using ElevenLabs with retries and metadata.
+    Without output_filepath the clip goes through the TTS cache, so identical
+    requests return the same file without calling ElevenLabs again.
 
     Args:
         input_text (str): Text to convert to speech.
         language_code (str): The language code for the output speech (e.g., 'en', 'fr').
-        output_filepath (str, optional): Path to save the MP3 file.
-        voice_id (str, optional): ID of the voice to use. Default is "JBFqnCBsd6RMkjVDRZzb".
+        output_filepath (str, optional): Path to save the MP3 file (bypasses the cache).
+        voice_id (str, optional): ID of the voice to use. Default is ELEVENLABS_VOICE_ID ("1Z7Y8o9cvUeWq8oLKgMY").
         retries (int, optional): Number of retry attempts.
-        delay (int, optional): Delay between retries in seconds.
+        delay (float, optional): Base delay of the jittered exponential backoff, in seconds.
         folder (str, optional): Directory to save output files.
 
     Returns:
         dict: {
             "file": str (file path),
             "size": int (file size in bytes),
-            "created_at": str (ISO timestamp)
+            "created_at": str (ISO timestamp),
+            "cached": bool (served from the TTS cache)
         }
     """
     os.makedirs(folder, exist_ok=True)
 
+    cache_key = None
+    if output_filepath is None:
+        cache_key = elevenlabs_cache_key(input_text, language_code, voice_id)
+        cached_path = tts_cache.lookup(cache_key)
+        if cached_path:
+            return _voice_info(cached_path, cached=True)
+        output_filepath = tts_cache.temp_path()
+
+    def synthesize():
+        # Convert text to speech
+        audio = get_elevenlabs_client().text_to_speech.convert(
+            # Use the detected language code here
+            model_id=ELEVENLABS_MODEL_ID, # Use a multilingual model
+            # You can also set a specific voice based on the language
+            # For example: voice_id=get_multilingual_voice(language_code),
+            text=input_text,
+            voice_id=voice_id,
+            voice_settings=ELEVENLABS_VOICE_SETTINGS
+        )
+
+        # Save the audio to file
+        with open(output_filepath, "wb") as f:
+            for chunk in audio:
+                f.write(chunk)
+
+        # Check if the file is non-empty
+        if not os.path.exists(output_filepath) or os.path.getsize(output_filepath) == 0:
+            raise Exception("ElevenLabs produced an empty file")
+
+    call_sync("elevenlabs", synthesize, attempts=retries, base_delay=delay)
+    if cache_key:
+        output_filepath = tts_cache.adopt(cache_key, output_filepath)
+    return _voice_info(output_filepath)
+
+
+async def _convert_stream(input_text, voice_id=ELEVENLABS_VOICE_ID):
+    # Holds one of the process-wide ElevenLabs slots while the request is open
+    async with elevenlabs_slots:
+        async for chunk in get_async_elevenlabs_client().text_to_speech.convert(
+            model_id=ELEVENLABS_MODEL_ID,
+            text=input_text,
+            voice_id=voice_id,
+            voice_settings=ELEVENLABS_VOICE_SETTINGS
+        ):
+            yield chunk
+
+
+@traced("tts_elevenlabs_stream")
+async def stream_elevenlabs_audio(input_text, voice_id=ELEVENLABS_VOICE_ID):
+    """
+    Yield MP3 bytes for input_text as ElevenLabs sends them (no file written).
+    Goes through the ElevenLabs circuit breaker; no retries, since chunks are already
+    handed out by the time a stream fails.
+    """
+    breaker = breakers["elevenlabs"]
+    breaker.before_call()
+    try:
+        async for chunk in _convert_stream(input_text, voice_id):
+            yield chunk
+    except Exception:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Cancelled or closed early (GeneratorExit): free a half-open trial slot
+        breaker.release_trial()
+        raise
+    breaker.record_success()
+
+
+@traced("tts_elevenlabs")
+async def elevenlabs_audio_bytes_async(input_text, voice_id=ELEVENLABS_VOICE_ID, retries=3, delay=RETRY_BASE_DELAY):
+    """Complete MP3 for input_text, retried with backoff through the ElevenLabs breaker."""
+    async def synthesize():
+        data = b"".join([chunk async for chunk in _convert_stream(input_text, voice_id)])
+        if not data:
+            raise Exception("ElevenLabs returned no audio")
+        return data
+
+    return await call_async("elevenlabs", synthesize, attempts=retries, base_delay=delay)
+
+
+def _write_audio_file(output_filepath, chunks):
+    with open(output_filepath, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return os.path.getsize(output_filepath)
+
+
+async def text_to_speech_with_elevenlabs_async(input_text, language_code, output_filepath=None, voice_id=ELEVENLABS_VOICE_ID, retries=3, delay=RETRY_BASE_DELAY, folder="outputs/voices"):
+    """
+    Async variant of text_to_speech_with_elevenlabs (same args, return value and caching).
+    Streams audio from AsyncElevenLabs and writes the file on the default executor.
+    """
+    os.makedirs(folder, exist_ok=True)
+
+    cache_key = None
     if output_filepath is None:
-        output_filepath = os.path.join(folder, f"final_{uuid.uuid4().hex}.mp3")
-
-    for attempt in range(retries):
-        try:
-            # Convert text to speech
-            audio = client.text_to_speech.convert(
-                # Use the detected language code here
-                model_id="eleven_multilingual_v2", # Use a multilingual model
-                # You can also set a specific voice based on the language
-                # For example: voice_id=get_multilingual_voice(language_code),
-                text=input_text,
-                voice_id="1Z7Y8o9cvUeWq8oLKgMY", # Or another suitable voice ID
-                voice_settings=VoiceSettings(
-                    stability=0.0,
-                    similarity_boost=1.0,
-                    style=0.0,
-                    use_speaker_boost=True
-                )
-            )
-
-            # Save the audio to file
-            with open(output_filepath, "wb") as f:
-                for chunk in audio:
-                    f.write(chunk)
-
-            # Check if the file is non-empty
-            if os.path.exists(output_filepath) and os.path.getsize(output_filepath) > 0:
-                return {
-                    "file": output_filepath,
-                    "size": os.path.getsize(output_filepath),
-                    "created_at": datetime.now().isoformat()
-                }
-
-            print(f"[ElevenLabs Warning] Empty file on attempt {attempt+1}")
-            time.sleep(delay)
-
-        except Exception as e:
-            print(f"[ElevenLabs Error] {e} — retry {attempt+1}/{retries}")
-            time.sleep(delay)
-
-    raise Exception("ElevenLabs TTS failed after multiple retries or produced empty files")
+        cache_key = elevenlabs_cache_key(input_text, language_code, voice_id)
+        cached_path = await asyncio.to_thread(tts_cache.lookup, cache_key)
+        if cached_path:
+            return await asyncio.to_thread(_voice_info, cached_path, True)
+        output_filepath = tts_cache.temp_path()
+
+    data = await elevenlabs_audio_bytes_async(input_text, voice_id, retries=retries, delay=delay)
+    size = await asyncio.to_thread(_write_audio_file, output_filepath, [data])
+    if cache_key:
+        output_filepath = await asyncio.to_thread(tts_cache.adopt, cache_key, output_filepath)
+    return {
+        "file": output_filepath,
+        "size": size,
+        "created_at": datetime.now().isoformat(),
+        "cached": False
+    }
+
+
+@traced("tts_reply")
+async def text_to_speech_with_fallback_async(input_text, language_code):
+    """
+    ElevenLabs, or gTTS when ElevenLabs fails or its circuit is open. Same return value
+    plus "provider". Raises only if both fail (the caller then replies with text only).
+    """
+    try:
+        voice_info = await text_to_speech_with_elevenlabs_async(input_text=input_text, language_code=language_code)
+        return {**voice_info, "provider": "elevenlabs"}
+    except Exception as e:
+        print(f"[ElevenLabs Error] {e} — falling back to gTTS")
+    voice_info = await asyncio.to_thread(text_to_speech_with_gtts, input_text, lang=language_code)
+    return {**voice_info, "provider": "gtts"}
+
+
+def strip_id3(data):
+    """Drop a leading ID3v2 tag so MP3 segments can be joined frame to frame."""
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return data[10 + size + footer:]
+    return data
+
+
+def concat_mp3(segments):
+    """Concatenate MP3 clips without re-encoding (keeps the first clip's ID3 tag only)."""
+    if not segments:
+        return b""
+    return segments[0] + b"".join(strip_id3(segment) for segment in segments[1:])
+
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def synthesize_sentence_async(sentence, language_code):
+    """
+    MP3 bytes for one sentence: from the cache, else ElevenLabs, else gTTS.
+    Returns (data, provider) with provider "cache", "elevenlabs" or "gtts".
+    """
+    key = elevenlabs_cache_key(sentence, language_code)
+    path = await asyncio.to_thread(tts_cache.lookup, key)
+    if path:
+        return await asyncio.to_thread(_read_bytes, path), "cache"
+    try:
+        data = await elevenlabs_audio_bytes_async(sentence)
+        await asyncio.to_thread(tts_cache.store, key, data)
+        return data, "elevenlabs"
+    except Exception as e:
+        print(f"[ElevenLabs Error] {e} — gTTS fallback for: {sentence[:40]}")
+    return await gtts_audio_bytes_async(sentence, language_code), "gtts"
+
+
+async def gtts_audio_bytes_async(input_text, language_code):
+    """MP3 bytes from gTTS (through the TTS cache), for sentences ElevenLabs could not voice."""
+    voice_info = await asyncio.to_thread(text_to_speech_with_gtts, input_text, lang=language_code, retries=1)
+    return await asyncio.to_thread(_read_bytes, voice_info["file"])
+
+
+@traced("tts_reply")
+async def text_to_speech_by_sentence_async(input_text, language_code, concurrency=TTS_SENTENCE_CONCURRENCY):
+    """
+    Split the reply into sentences, synthesize up to `concurrency` of them at a time
+    (each sentence reused from the cache when possible, gTTS when ElevenLabs fails) and
+    join the MP3 segments in order without re-encoding. The joined reply is cached
+    under the full text unless a sentence had to fall back to gTTS.
+    Returns the same dict as text_to_speech_with_elevenlabs, plus per-provider counts.
+    """
+    # Imported here: stream_of_bot imports this module
+    from stream_of_bot import SentenceSegmenter
+
+    full_key = tts_cache_key(mode="sentences", reply=elevenlabs_cache_key(input_text, language_code))
+    cached_path = await asyncio.to_thread(tts_cache.lookup, full_key)
+    if cached_path:
+        return await asyncio.to_thread(_voice_info, cached_path, True)
+
+    segmenter = SentenceSegmenter()
+    sentences = segmenter.feed(input_text) + segmenter.flush()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def synthesize(sentence):
+        async with slots:
+            return await synthesize_sentence_async(sentence, language_code)
+
+    # gather keeps the sentence order regardless of which finishes first
+    results = await asyncio.gather(*(synthesize(sentence) for sentence in sentences))
+    providers = [provider for _, provider in results]
+    audio = concat_mp3([data for data, _ in results])
+
+    if "gtts" in providers:
+        # Not cached as a whole: next time ElevenLabs gets another chance for those sentences
+        path = voice_artifacts.new_path(f"reply_{uuid.uuid4().hex}.mp3")
+        await asyncio.to_thread(_write_audio_file, path, [audio])
+        voice_artifacts.register(path)
+    else:
+        path = await asyncio.to_thread(tts_cache.store, full_key, audio)
+    info = await asyncio.to_thread(_voice_info, path)
+    info["sentences"] = {provider: providers.count(provider) for provider in set(providers)}
+    return info
 
 
 # Example usage
@@ -104,62 +327,59 @@ def text_to_speech_with_elevenlabs(input_text, language_code, output_filepath=No
 #Step2: Use Model for Text output to Voice
 
 import uuid
-import time
 import os
 from datetime import datetime
-from gtts import gTTS, gTTSError
+from gtts import gTTS
 
+@traced("tts_gtts")
 def text_to_speech_with_gtts(
     input_text,
     output_filepath=None,
     lang="en",
     retries=3,
-    delay=2,
+    delay=RETRY_BASE_DELAY,
     folder="outputs/voices"
 ):
     """
     Convert text to speech using gTTS with retries and metadata.
+    Without output_filepath the clip goes through the TTS cache.
 
     Args:
         input_text (str): Text to convert to speech.
-        output_filepath (str, optional): Path to save the MP3 file.
+        output_filepath (str, optional): Path to save the MP3 file (bypasses the cache).
         lang (str, optional): Language for speech. Default is "en".
         retries (int, optional): Number of retry attempts.
-        delay (int, optional): Delay between retries in seconds.
+        delay (float, optional): Base delay of the jittered exponential backoff, in seconds.
         folder (str, optional): Directory to save output files.
 
     Returns:
         dict: {
             "file": str (file path),
             "size": int (file size in bytes),
-            "created_at": str (ISO timestamp)
+            "created_at": str (ISO timestamp),
+            "cached": bool (served from the TTS cache)
         }
     """
     os.makedirs(folder, exist_ok=True)
 
+    cache_key = None
     if output_filepath is None:
-        output_filepath = os.path.join(folder, f"final_{uuid.uuid4().hex}.mp3")
-
-    for attempt in range(retries):
-        try:
-            tts = gTTS(text=input_text, lang=lang, slow=False)
-            tts.save(output_filepath)
-
-            if os.path.exists(output_filepath) and os.path.getsize(output_filepath) > 0:
-                return {
-                    "file": output_filepath,
-                    "size": os.path.getsize(output_filepath),
-                    "created_at": datetime.now().isoformat()
-                }
-
-            print(f"[gTTS Warning] Empty file on attempt {attempt+1}")
-            time.sleep(delay)
-
-        except gTTSError as e:
-            print(f"[gTTS Error] {e} — retry {attempt+1}/{retries}")
-            time.sleep(delay)
-
-    raise Exception("gTTS failed after multiple retries or produced empty files")
+        cache_key = tts_cache_key(provider="gtts", text=input_text, language=lang, slow=False)
+        cached_path = tts_cache.lookup(cache_key)
+        if cached_path:
+            return _voice_info(cached_path, cached=True)
+        output_filepath = tts_cache.temp_path()
+
+    def synthesize():
+        tts = gTTS(text=input_text, lang=lang, slow=False)
+        tts.save(output_filepath)
+        if not os.path.exists(output_filepath) or os.path.getsize(output_filepath) == 0:
+            raise Exception("gTTS produced an empty file")
+
+    call_sync("gtts", synthesize, attempts=retries, base_delay=delay)
+    if cache_key:
+        output_filepath = tts_cache.adopt(cache_key, output_filepath)
+    return _voice_info(output_filepath)
 
 
 # return path so Gradio can serve it
@@ -31,7 +31,9 @@ def record_audio(file_path, timeout=20, phrase_time_limit=None):
             # Convert the recorded audio to an MP3 file
             wav_data = audio_data.get_wav_data()
             audio_segment = AudioSegment.from_wav(BytesIO(wav_data))
-            audio_segment.export(file_path, format="mp3", bitrate="128k")
+            # Whisper only needs 16 kHz mono
+            audio_segment = audio_segment.set_channels(1).set_frame_rate(16000)
+            audio_segment.export(file_path, format="mp3", bitrate="32k")
             
             logging.info(f"Audio saved to {file_path}")
 
@@ -45,23 +47,222 @@ audio_filepath="patient_voice_test_for_patient.mp3"
 from dotenv import load_dotenv
 load_dotenv()
 import os
-from groq import Groq
-from langdetect import detect
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from clients_for_bot import get_groq_client, get_async_groq_client
+from language_of_patient import language_id
+from resilience_for_bot import call_async, call_sync
+from metrics_for_bot import traced
+from pydub.silence import detect_nonsilent
 
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 stt_model = "whisper-large-v3"
 
 
+# ---- Audio normalization ----
+# Whisper resamples everything to 16 kHz mono anyway, so that is all we upload
+STT_SAMPLE_RATE = 16000
+# mp3 at a low bitrate is the smallest upload; flac is lossless but several times larger
+STT_AUDIO_FORMAT = os.environ.get("STT_AUDIO_FORMAT", "mp3")
+STT_AUDIO_BITRATE = os.environ.get("STT_AUDIO_BITRATE", "32k")
+# Energy VAD: audio this far below the recording's average loudness (and never louder
+# than SPEECH_FLOOR_DBFS) counts as silence
+SILENCE_MARGIN_DB = 16
+SPEECH_FLOOR_DBFS = -50
+MIN_SPEECH_MS = 300
+SILENCE_PADDING_MS = 200
+
+
+class EmptyRecordingError(ValueError):
+    """The recording has no speech in it; nothing is sent to STT."""
+
+
+@traced("audio_normalize")
+def normalize_audio(audio_filepath, output_filepath=None, audio_format=STT_AUDIO_FORMAT):
+    """
+    Downmix to 16 kHz mono, trim leading/trailing silence and re-encode small for STT.
+    Returns (path_to_upload, info). Raises EmptyRecordingError if there is no speech.
+    If the file cannot be decoded or re-encoded (e.g. no ffmpeg) the original is uploaded unchanged.
+    """
+    original_bytes = os.path.getsize(audio_filepath)
+    try:
+        segment = AudioSegment.from_file(audio_filepath)
+    except Exception as e:
+        logging.warning(f"Audio normalization skipped for {audio_filepath}: {e}")
+        return audio_filepath, {"original_bytes": original_bytes, "sent_bytes": original_bytes, "normalized": False}
+
+    original_ms = len(segment)
+    segment = segment.set_channels(1).set_frame_rate(STT_SAMPLE_RATE)
+    if segment.dBFS == float("-inf"):
+        raise EmptyRecordingError("The recording is silent")
+
+    threshold = max(segment.dBFS - SILENCE_MARGIN_DB, SPEECH_FLOOR_DBFS)
+    speech = detect_nonsilent(segment, min_silence_len=MIN_SPEECH_MS, silence_thresh=threshold, seek_step=10)
+    if sum(end - start for start, end in speech) < MIN_SPEECH_MS:
+        raise EmptyRecordingError(f"No speech detected in the recording ({original_ms / 1000:.1f}s)")
+
+    start = max(speech[0][0] - SILENCE_PADDING_MS, 0)
+    end = min(speech[-1][1] + SILENCE_PADDING_MS, len(segment))
+    segment = segment[start:end]
+
+    output_filepath = output_filepath or f"{os.path.splitext(audio_filepath)[0]}_stt.{audio_format}"
+    export_args = {"bitrate": STT_AUDIO_BITRATE} if audio_format == "mp3" else {}
+    try:
+        segment.export(output_filepath, format=audio_format, **export_args)
+    except Exception as e:
+        logging.warning(f"Audio normalization skipped for {audio_filepath}: {e}")
+        if os.path.exists(output_filepath):
+            os.remove(output_filepath)
+        return audio_filepath, {"original_bytes": original_bytes, "sent_bytes": original_bytes, "normalized": False}
+    return output_filepath, {
+        "original_bytes": original_bytes,
+        "sent_bytes": os.path.getsize(output_filepath),
+        "original_ms": original_ms,
+        "trimmed_ms": original_ms - len(segment),
+        "normalized": True,
+    }
+
+
+@traced("stt_groq")
 def transcribe_with_groq(stt_model, audio_filepath, GROQ_API_KEY):
-    client = Groq(api_key=GROQ_API_KEY)
+    client = get_groq_client(GROQ_API_KEY)
 
-    with open(audio_filepath, "rb") as audio_file:
-        transcription = client.audio.transcriptions.create(
-            model=stt_model,
-            file=audio_file,
-            response_format="json"
-        )
+    def transcribe():
+        with open(audio_filepath, "rb") as audio_file:
+            return client.audio.transcriptions.create(
+                model=stt_model,
+                file=audio_file,
+                response_format="verbose_json"
+            )
+
+    transcription = call_sync("groq", transcribe)
+
+    text = transcription.text
+    # Whisper's own language ("english"), with a text fallback; e.g. "en", "fr", "hi"
+    detected_language = language_id.detect(text, getattr(transcription, "language", None))
+    return text, detected_language
+
+
+@traced("stt_groq")
+async def transcribe_with_groq_async(stt_model, audio_filepath, GROQ_API_KEY, conversation_id=None):
+    """
+    Async variant of transcribe_with_groq. The audio goes out as an open file, so httpx
+    streams the multipart body from disk instead of reading the recording into memory;
+    the text fallback of language detection runs on the loop's default executor.
+    """
+    client = get_async_groq_client(GROQ_API_KEY)
+
+    async def transcribe():
+        # Reopened per attempt so a retry uploads the file from the start
+        with open(audio_filepath, "rb") as audio_file:
+            return await client.audio.transcriptions.create(
+                model=stt_model,
+                file=(os.path.basename(audio_filepath), audio_file),
+                response_format="verbose_json"
+            )
+
+    transcription = await call_async("groq", transcribe)
 
     text = transcription.text
-    detected_language = detect(text)   # e.g. "en", "fr", "hi"
-    return text, detected_language
\ No newline at end of file
+    detected_language = await asyncio.to_thread(
+        language_id.detect, text, getattr(transcription, "language", None), conversation_id
+    )
+    return text, detected_language
+
+
+# ---- STT backends ----
+# STT_BACKEND=groq: Whisper large v3 on Groq (default)
+# STT_BACKEND=local: faster-whisper (CTranslate2, int8) on this machine's CPU, for clinics
+# without internet access. Needs the optional "faster-whisper" package.
+STT_BACKEND = os.environ.get("STT_BACKEND", "groq")
+LOCAL_STT_MODEL = os.environ.get("LOCAL_STT_MODEL", "small")
+LOCAL_STT_COMPUTE_TYPE = os.environ.get("LOCAL_STT_COMPUTE_TYPE", "int8")
+# Transcriptions running at once; each one gets LOCAL_STT_CPU_THREADS threads (0 = CTranslate2 default)
+LOCAL_STT_WORKERS = int(os.environ.get("LOCAL_STT_WORKERS", "2"))
+LOCAL_STT_CPU_THREADS = int(os.environ.get("LOCAL_STT_CPU_THREADS", "0"))
+# Greedy decoding; beam search (5) is a little more accurate and several times slower on CPU
+LOCAL_STT_BEAM_SIZE = int(os.environ.get("LOCAL_STT_BEAM_SIZE", "1"))
+
+
+class STTBackend:
+    """
+    transcribe(audio_filepath, conversation_id) -> (text, detected_language), awaited on
+    the event loop. conversation_id lets short utterances reuse the conversation's language.
+    """
+    name = None
+
+    async def transcribe(self, audio_filepath, conversation_id=None):
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Load whatever the first request would otherwise wait for."""
+
+
+class GroqSTT(STTBackend):
+    name = "groq"
+
+    def __init__(self, model=stt_model, api_key=None):
+        self.model = model
+        self.api_key = api_key
+
+    async def transcribe(self, audio_filepath, conversation_id=None):
+        return await transcribe_with_groq_async(self.model, audio_filepath, self.api_key or os.environ.get("GROQ_API_KEY"),
+                                                conversation_id=conversation_id)
+
+
+class LocalWhisperSTT(STTBackend):
+    """
+    faster-whisper on CPU. The model is loaded once and shared; transcriptions run on a
+    dedicated thread pool (CTranslate2 releases the GIL), so they neither block the event
+    loop nor tie up the app's default executor. Whisper detects the language itself.
+    """
+    name = "local"
+
+    def __init__(self, model_size=LOCAL_STT_MODEL, compute_type=LOCAL_STT_COMPUTE_TYPE,
+                 workers=LOCAL_STT_WORKERS, cpu_threads=LOCAL_STT_CPU_THREADS, beam_size=LOCAL_STT_BEAM_SIZE):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        self.beam_size = beam_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stt")
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    def _get_model(self):
+        with self._load_lock:
+            if self._model is None:
+                try:
+                    from faster_whisper import WhisperModel
+                except ImportError as e:
+                    raise RuntimeError("STT_BACKEND=local needs the 'faster-whisper' package (pip install faster-whisper)") from e
+                start = time.perf_counter()
+                self._model = WhisperModel(self.model_size, device="cpu", compute_type=self.compute_type,
+                                           cpu_threads=self.cpu_threads, num_workers=self.workers)
+                logging.info(f"Loaded faster-whisper {self.model_size} ({self.compute_type}) in {time.perf_counter() - start:.1f}s")
+            return self._model
+
+    def warm_up(self):
+        self._get_model()
+
+    @traced("stt_local")
+    def transcribe_sync(self, audio_filepath, conversation_id=None):
+        segments, info = self._get_model().transcribe(audio_filepath, beam_size=self.beam_size)
+        # segments is lazy: decoding happens while it is consumed
+        text = " ".join(segment.text.strip() for segment in segments)
+        return text, language_id.detect(text, info.language, conversation_id)
+
+    async def transcribe(self, audio_filepath, conversation_id=None):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.transcribe_sync, audio_filepath, conversation_id
+        )
+
+
+def get_stt_backend(name=STT_BACKEND):
+    if name == "groq":
+        return GroqSTT()
+    if name == "local":
+        return LocalWhisperSTT()
+    raise ValueError(f"Unknown STT_BACKEND: {name!r} (expected groq or local)")